@@ -0,0 +1,249 @@
+"""Negotiated response compression: zstd, brotli and gzip.
+
+``CompressionMiddleware`` compresses responses with the encoding the client
+prefers (``Accept-Encoding``) among ``COMPRESSION_ENCODINGS``, in that order
+of preference on ties. ``br`` needs the ``brotli`` package and ``zstd`` the
+``zstandard`` package; encodings whose package is missing are skipped, gzip
+is always available.
+
+Bodies under ``COMPRESSION_MIN_SIZE`` bytes are sent as is, as are bodies
+that would not get smaller. Streamed responses are compressed chunk by chunk,
+each chunk flushed so that clients receive it without waiting for the next.
+
+Views serving the same body repeatedly can compress it once with
+``precompress`` and attach the result to their response as ``precompressed``;
+the middleware then sends the stored variant instead of compressing again.
+"""
+
+import gzip
+import re
+import zlib
+from collections.abc import AsyncIterator, Callable, Iterator
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponseBase
+from django.utils.cache import patch_vary_headers
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+_ACCEPT_ENCODING_RE = re.compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$")
+
+
+class StreamCompressor:
+    """One compressed stream: chunks in, compressed bytes out."""
+
+    def compress(self, chunk: bytes) -> bytes:
+        raise NotImplementedError
+
+    def flush(self) -> bytes:
+        """Everything compressed so far, decodable without what follows."""
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        raise NotImplementedError
+
+
+class _GzipStream(StreamCompressor):
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream(StreamCompressor):
+    def __init__(self) -> None:
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStream(StreamCompressor):
+    def __init__(self) -> None:
+        import zstandard
+
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str  # ``Content-Encoding`` token
+    stream: Callable[[], StreamCompressor]
+    # Whole bodies, with their size in the header where the format has one
+    compress: Callable[[bytes], bytes]
+
+
+@lru_cache
+def _installed_codecs() -> dict[str, Codec]:
+    codecs = {
+        "gzip": Codec(
+            "gzip",
+            _GzipStream,
+            lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0),
+        )
+    }
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        codecs["br"] = Codec(
+            "br",
+            _BrotliStream,
+            lambda body: brotli.compress(body, quality=BROTLI_QUALITY),
+        )
+    try:
+        import zstandard
+    except ImportError:
+        pass
+    else:
+        # Compressor objects are not thread-safe
+        codecs["zstd"] = Codec(
+            "zstd",
+            _ZstdStream,
+            lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body),
+        )
+    return codecs
+
+
+def get_codecs() -> list[Codec]:
+    """Enabled and installed codecs, in order of preference."""
+    installed = _installed_codecs()
+    return [
+        installed[name] for name in settings.COMPRESSION_ENCODINGS if name in installed
+    ]
+
+
+def negotiate(accept_encoding: str) -> Codec | None:
+    """The codec to answer a request with ``accept_encoding`` with: the one
+    with the highest quality value, the first enabled one on ties.
+    """
+    qualities: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        match = _ACCEPT_ENCODING_RE.match(part)
+        if match is None:
+            continue
+        token, quality = match.group(1).lower(), match.group(2)
+        try:
+            qualities[token] = 1.0 if quality is None else float(quality)
+        except ValueError:
+            continue
+
+    best, best_quality = None, 0.0
+    for codec in get_codecs():
+        quality = qualities.get(codec.name, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = codec, quality
+    return best
+
+
+def precompress(body: bytes) -> dict[str, bytes]:
+    """``body`` compressed with every enabled codec that makes it smaller,
+    by encoding; empty under ``COMPRESSION_MIN_SIZE``.
+    """
+    if len(body) < settings.COMPRESSION_MIN_SIZE:
+        return {}
+    variants = {codec.name: codec.compress(body) for codec in get_codecs()}
+    return {name: data for name, data in variants.items() if len(data) < len(body)}
+
+
+def _compress_stream(codec: Codec, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    stream = codec.stream()
+    for chunk in chunks:
+        data = stream.compress(chunk) + stream.flush()
+        if data:
+            yield data
+    yield stream.finish()
+
+
+async def _compress_async_stream(
+    codec: Codec, chunks: AsyncIterator[bytes]
+) -> AsyncIterator[bytes]:
+    stream = codec.stream()
+    async for chunk in chunks:
+        data = stream.compress(chunk) + stream.flush()
+        if data:
+            yield data
+    yield stream.finish()
+
+
+class CompressionMiddleware:
+    """Compresses responses (see the module docstring). Installed first, so
+    that it sees the final body of every response.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.compress(request, response)
+
+    def compress(self, request, response: HttpResponseBase) -> HttpResponseBase:
+        if response.has_header("Content-Encoding"):
+            return response
+        if not response.streaming and (
+            len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        codec = negotiate(request.headers.get("Accept-Encoding", ""))
+        if codec is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _compress_async_stream(
+                    codec, response.streaming_content
+                )
+            else:
+                response.streaming_content = _compress_stream(
+                    codec, response.streaming_content
+                )
+            del response["Content-Length"]
+        else:
+            precompressed = getattr(response, "precompressed", None) or {}
+            body = precompressed.get(codec.name)
+            if body is None:
+                body = codec.compress(response.content)
+                if len(body) >= len(response.content):
+                    return response
+            response.content = body
+            response["Content-Length"] = str(len(body))
+
+        # The compressed body is a different representation of the resource
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = f"W/{etag}"
+        response["Content-Encoding"] = codec.name
+        return response
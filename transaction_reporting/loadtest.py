@@ -0,0 +1,343 @@
+"""Open-loop HTTP load generator used by ``manage.py loadtest``.
+
+Requests arrive at a fixed average rate (exponential inter-arrival times)
+whether or not earlier ones have completed, like independent clients do, and
+are sent by up to ``concurrency`` threads with keep-alive connections. A
+request's latency is measured from its scheduled arrival, so time spent
+waiting for a free sender counts too and an overloaded server cannot hide its
+queueing (no coordinated omission); ``backlog`` shows when the senders, not
+the server, are the bottleneck.
+
+Every ``interval`` seconds a snapshot of throughput, errors, latencies,
+requests in flight and database connections (``pg_stat_activity``) is taken,
+so the saturation point shows up as the rate at which latency and in-flight
+requests start to grow while throughput stays flat.
+"""
+
+import http.client
+import math
+import random
+import threading
+import time
+from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from urllib.parse import urlencode, urlsplit
+
+from django.db import DatabaseError, connection
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+@dataclass(frozen=True)
+class Target:
+    """An endpoint exercised by the load test and the queries sent to it."""
+
+    path: str
+    # Query parameter sets, picked uniformly
+    queries: Sequence[Mapping[str, str]]
+
+
+@dataclass(frozen=True)
+class LoadTestConfig:
+    base_url: str
+    rate: float  # requests per second
+    duration: float  # seconds
+    concurrency: int
+    # Weight of each target in the request mix
+    mix: Mapping[str, int]
+    timeout: float = 30.0
+    interval: float = 1.0
+    seed: int | None = None
+
+
+@dataclass(frozen=True)
+class Sample:
+    target: str
+    latency: float  # seconds from the scheduled arrival to the response
+    status: int | None  # None when no response was received
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and self.status < 400
+
+
+@dataclass
+class LatencyStats:
+    latencies: list[float] = field(default_factory=list)
+
+    def add(self, latency: float) -> None:
+        self.latencies.append(latency)
+
+    def percentile(self, fraction: float) -> float | None:
+        """Nearest-rank percentile, in seconds."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+    def histogram(self) -> list[tuple[str, int]]:
+        """Counts per bucket, labelled with the bucket's upper bound."""
+        counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for latency in self.latencies:
+            milliseconds = latency * 1000
+            index = next(
+                (
+                    i
+                    for i, bound in enumerate(HISTOGRAM_BOUNDS_MS)
+                    if milliseconds <= bound
+                ),
+                len(HISTOGRAM_BOUNDS_MS),
+            )
+            counts[index] += 1
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS]
+        labels.append(f">{HISTOGRAM_BOUNDS_MS[-1]}ms")
+        return list(zip(labels, counts, strict=True))
+
+
+@dataclass
+class TargetStats:
+    requests: int = 0
+    errors: int = 0
+    # Responses by status code, "error" for requests without a response
+    statuses: dict[str, int] = field(default_factory=dict)
+    latency: LatencyStats = field(default_factory=LatencyStats)
+
+    def add(self, sample: Sample) -> None:
+        self.requests += 1
+        self.errors += not sample.ok
+        status = "error" if sample.status is None else str(sample.status)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latency.add(sample.latency)
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+@dataclass(frozen=True)
+class IntervalStats:
+    elapsed: float  # seconds since the start, at the end of the interval
+    completed: int
+    errors: int
+    throughput: float  # completed requests per second
+    p50: float | None
+    p99: float | None
+    in_flight: int  # sent, not answered yet
+    backlog: int  # arrived, waiting for a free sender
+    # Database connections by state, None if they could not be read
+    connections: dict[str, int] | None
+
+
+@dataclass
+class LoadTestResult:
+    duration: float
+    targets: dict[str, TargetStats]
+    intervals: list[IntervalStats]
+
+    @property
+    def total(self) -> TargetStats:
+        total = TargetStats()
+        for stats in self.targets.values():
+            total.requests += stats.requests
+            total.errors += stats.errors
+            total.latency.latencies += stats.latency.latencies
+            for status, count in stats.statuses.items():
+                total.statuses[status] = total.statuses.get(status, 0) + count
+        return total
+
+    def as_dict(self) -> dict:
+        def stats_dict(stats: TargetStats) -> dict:
+            return {
+                "requests": stats.requests,
+                "throughput": stats.requests / self.duration if self.duration else 0,
+                "error_rate": stats.error_rate,
+                "statuses": stats.statuses,
+                "latency": {
+                    name: stats.latency.percentile(fraction)
+                    for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+                }
+                | {"max": max(stats.latency.latencies, default=None)},
+                "histogram": dict(stats.latency.histogram()),
+            }
+
+        return {
+            "duration": self.duration,
+            "total": stats_dict(self.total),
+            "targets": {
+                name: stats_dict(stats) for name, stats in self.targets.items()
+            },
+            "intervals": [asdict(interval) for interval in self.intervals],
+        }
+
+
+def parse_mix(raw: str, targets: Mapping[str, Target]) -> dict[str, int]:
+    """Parse ``name=weight`` pairs, e.g. ``list=3,report=1``."""
+    mix = {}
+    for part in filter(None, (part.strip() for part in raw.split(","))):
+        name, sep, weight = part.partition("=")
+        if not sep or not weight.isdigit():
+            raise ValueError(f"Invalid mix entry '{part}'. Expected name=weight.")
+        if name not in targets:
+            raise ValueError(
+                f"Unknown mix target '{name}'. Must be among {sorted(targets)}."
+            )
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("The mix must give at least one target a positive weight.")
+    return mix
+
+
+def database_connections() -> dict[str, int] | None:
+    """Connections to this process' database by state, its own excluded."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COALESCE(state, 'unknown'), COUNT(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND pid <> pg_backend_pid() "
+                "GROUP BY 1"
+            )
+            return dict(cursor.fetchall())
+    except DatabaseError:
+        return None
+
+
+class LoadTest:
+    def __init__(
+        self,
+        config: LoadTestConfig,
+        targets: Mapping[str, Target],
+        connection_stats: Callable[[], dict[str, int] | None] = database_connections,
+    ) -> None:
+        self.config = config
+        self.targets = targets
+        self.connection_stats = connection_stats
+        url = urlsplit(config.base_url)
+        self._connection_class = (
+            http.client.HTTPSConnection
+            if url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self._netloc = url.netloc
+        self._prefix = url.path.rstrip("/")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending: list[Sample] = []
+        self._scheduled = self._started = self._completed = 0
+
+    def run(
+        self, on_interval: Callable[[IntervalStats], None] | None = None
+    ) -> LoadTestResult:
+        config = self.config
+        rng = random.Random(config.seed)
+        names = [name for name, weight in config.mix.items() if weight]
+        weights = [config.mix[name] for name in names]
+        stats = {name: TargetStats() for name in names}
+        intervals: list[IntervalStats] = []
+        start = time.perf_counter()
+        done = threading.Event()
+
+        def monitor() -> None:
+            previous = start
+            try:
+                while True:
+                    finished = done.wait(config.interval)
+                    now = time.perf_counter()
+                    interval = self._interval(stats, now - start, now - previous)
+                    previous = now
+                    intervals.append(interval)
+                    if on_interval is not None:
+                        on_interval(interval)
+                    if finished:
+                        return
+            finally:
+                # The monitor thread's own database connection
+                connection.close()
+
+        monitor_thread = threading.Thread(target=monitor, daemon=True)
+        monitor_thread.start()
+        with ThreadPoolExecutor(max_workers=config.concurrency) as executor:
+            arrival = start
+            while True:
+                arrival += rng.expovariate(config.rate)
+                if arrival - start >= config.duration:
+                    break
+                name = rng.choices(names, weights)[0]
+                target = self.targets[name]
+                query = rng.choice(target.queries)
+                path = f"{self._prefix}{target.path}"
+                if query:
+                    path = f"{path}?{urlencode(query)}"
+                time.sleep(max(arrival - time.perf_counter(), 0))
+                with self._lock:
+                    self._scheduled += 1
+                executor.submit(self._send, name, path, arrival)
+            executor.shutdown(wait=True)  # let the requests in flight finish
+        done.set()
+        monitor_thread.join()
+        return LoadTestResult(
+            duration=time.perf_counter() - start, targets=stats, intervals=intervals
+        )
+
+    def _interval(
+        self, stats: dict[str, TargetStats], elapsed: float, length: float
+    ) -> IntervalStats:
+        with self._lock:
+            samples, self._pending = self._pending, []
+            in_flight = self._started - self._completed
+            backlog = self._scheduled - self._started
+        latency = LatencyStats()
+        for sample in samples:
+            stats[sample.target].add(sample)
+            latency.add(sample.latency)
+        return IntervalStats(
+            elapsed=elapsed,
+            completed=len(samples),
+            errors=sum(not sample.ok for sample in samples),
+            throughput=len(samples) / length if length else 0.0,
+            p50=latency.percentile(0.5),
+            p99=latency.percentile(0.99),
+            in_flight=in_flight,
+            backlog=backlog,
+            connections=self.connection_stats(),
+        )
+
+    def _send(self, name: str, path: str, arrival: float) -> None:
+        with self._lock:
+            self._started += 1
+        status = error = None
+        try:
+            status = self._request(path)
+        except (OSError, http.client.HTTPException) as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        sample = Sample(
+            target=name,
+            latency=time.perf_counter() - arrival,
+            status=status,
+            error=error,
+        )
+        with self._lock:
+            self._completed += 1
+            self._pending.append(sample)
+
+    def _request(self, path: str) -> int:
+        """GET ``path`` on this thread's keep-alive connection."""
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = self._local.connection = self._connection_class(
+                self._netloc, timeout=self.config.timeout
+            )
+        try:
+            conn.request("GET", path, headers={"Accept": "application/json"})
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.connection = None
+            raise
+        if response.will_close:
+            conn.close()
+            self._local.connection = None
+        return response.status
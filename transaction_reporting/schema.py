@@ -0,0 +1,127 @@
+"""OpenAPI schema, generated once and served from memory as bytes.
+
+DRF's schema view walks every view (including the custom filter/report
+parameter builders) on each request. Here the rendered document is built at
+most once per process, or read from the files written at deploy time by
+``manage.py build_openapi_schema``, and served with an ``ETag`` so clients can
+revalidate with ``If-None-Match``. Its compressed variants are built once too.
+
+The DRF schema generator and renderers are imported on first use only.
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views import View
+
+from .compression import precompress
+
+SCHEMA_TITLE = "Transaction Reporting API"
+SCHEMA_DESCRIPTION = "OpenAPI schema for the transaction reporting backend."
+SCHEMA_VERSION = "1.0.0"
+
+# Format name -> (file name, content type)
+SCHEMA_FORMATS = {
+    "openapi": ("openapi.yaml", "application/vnd.oai.openapi"),
+    "openapi-json": ("openapi.json", "application/vnd.oai.openapi+json"),
+}
+
+
+@dataclass(frozen=True)
+class RenderedSchema:
+    body: bytes
+    content_type: str
+    etag: str
+    precompressed: dict[str, bytes]
+
+
+def render_schemas() -> dict[str, bytes]:
+    """Generate the schema and render it in every supported format."""
+    from rest_framework.renderers import JSONOpenAPIRenderer, OpenAPIRenderer
+    from rest_framework.schemas.openapi import SchemaGenerator
+
+    schema = SchemaGenerator(
+        title=SCHEMA_TITLE,
+        description=SCHEMA_DESCRIPTION,
+        version=SCHEMA_VERSION,
+    ).get_schema(request=None, public=True)
+    return {
+        "openapi": OpenAPIRenderer().render(schema),
+        "openapi-json": JSONOpenAPIRenderer().render(schema),
+    }
+
+
+def write_schemas(directory: Path) -> list[Path]:
+    directory.mkdir(parents=True, exist_ok=True)
+    written = []
+    for fmt, body in render_schemas().items():
+        path = directory / SCHEMA_FORMATS[fmt][0]
+        path.write_bytes(body)
+        written.append(path)
+    return written
+
+
+_schemas: dict[str, RenderedSchema] = {}
+_schemas_lock = threading.Lock()
+
+
+def get_schema(fmt: str) -> RenderedSchema:
+    """Rendered schema for ``fmt``; built (or loaded from disk) once per process."""
+    with _schemas_lock:
+        if not _schemas:
+            _schemas.update(_load_schemas())
+        return _schemas[fmt]
+
+
+def _load_schemas() -> dict[str, RenderedSchema]:
+    bodies: dict[str, bytes] | None = None
+    if settings.OPENAPI_SCHEMA_DIR:
+        paths = {
+            fmt: Path(settings.OPENAPI_SCHEMA_DIR) / file_name
+            for fmt, (file_name, _) in SCHEMA_FORMATS.items()
+        }
+        if all(path.exists() for path in paths.values()):
+            bodies = {fmt: path.read_bytes() for fmt, path in paths.items()}
+    if bodies is None:
+        bodies = render_schemas()
+
+    return {
+        fmt: RenderedSchema(
+            body=body,
+            content_type=SCHEMA_FORMATS[fmt][1],
+            etag=quote_etag(hashlib.sha256(body).hexdigest()),
+            precompressed=precompress(body),
+        )
+        for fmt, body in bodies.items()
+    }
+
+
+class CachedSchemaView(View):
+    """Serve the cached OpenAPI schema as YAML (default) or JSON.
+    JSON is selected with ``?format=openapi-json`` or a JSON ``Accept`` header.
+    """
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        fmt = request.GET.get("format")
+        if fmt not in SCHEMA_FORMATS:
+            accept = request.headers.get("Accept", "")
+            fmt = "openapi-json" if "json" in accept else "openapi"
+        schema = get_schema(fmt)
+
+        # Weak comparison: compressed responses carry the weakened ETag
+        etags = parse_etags(request.headers.get("If-None-Match", ""))
+        if schema.etag in (etag.removeprefix("W/") for etag in etags):
+            response: HttpResponse = HttpResponseNotModified()
+        else:
+            response = HttpResponse(schema.body, content_type=schema.content_type)
+            response.precompressed = schema.precompressed
+        response["ETag"] = schema.etag
+        response["Vary"] = "Accept"
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
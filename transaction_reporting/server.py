@@ -0,0 +1,288 @@
+"""Preforking WSGI server used by ``manage.py serve``.
+
+The master process sets up Django, imports the URLconf and anything else the
+caller preloads, then forks workers that share those pages copy-on-write.
+Each worker runs its warm-up (e.g. opening database connections) before it
+accepts from the shared listening socket, handles one request at a time, and
+exits after ``max_requests`` requests so that the master replaces it. Reads
+from and writes to clients time out after ``timeout`` seconds, so that idle or
+slow clients cannot hold a worker (nor delay its shutdown) indefinitely.
+
+Signals handled by the master:
+
+- ``HUP``: graceful reload. The master re-executes itself with the listening
+  socket kept open, so new code is loaded; once the new workers are running,
+  the old ones finish their current request and exit.
+- ``TERM`` / ``INT``: graceful shutdown, workers that do not finish within
+  ``graceful_timeout`` seconds are killed.
+"""
+
+import contextlib
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+
+logger = logging.getLogger(__name__)
+
+# Environment variables passed to the re-executed master on reload
+LISTEN_FD_ENV = "SERVE_LISTEN_FD"
+OLD_WORKERS_ENV = "SERVE_OLD_WORKERS"
+
+# Seconds between checks of signal flags and worker liveness
+POLL_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    host: str
+    port: int
+    workers: int
+    max_requests: int = 0  # 0 disables recycling
+    max_requests_jitter: int = 0
+    graceful_timeout: float = 30.0
+    backlog: int = 2048
+    timeout: float | None = 30.0  # per connection, None disables
+
+
+def parse_bind(bind: str) -> tuple[str, int]:
+    """Split ``host:port`` (``[::1]:8000`` for IPv6) into its parts."""
+    host, sep, port = bind.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid bind address '{bind}'. Expected host:port.")
+    return host.strip("[]") or "0.0.0.0", int(port)
+
+
+class _WorkerServer(WSGIServer):
+    """``WSGIServer`` accepting from a socket inherited from the master."""
+
+    def __init__(
+        self, listener: socket.socket, app, connection_timeout: float | None
+    ) -> None:
+        super().__init__(
+            listener.getsockname()[:2], WSGIRequestHandler, bind_and_activate=False
+        )
+        # Unbound socket of the base class, replaced by the master's
+        self.server_close()
+        self.socket = listener
+        self.server_name, self.server_port = listener.getsockname()[:2]
+        self.setup_environ()
+        self.set_app(app)
+        self.timeout = POLL_INTERVAL
+        self.connection_timeout = connection_timeout
+        self.handled = 0
+
+    def get_request(self) -> tuple[socket.socket, tuple]:
+        connection, client_address = super().get_request()
+        connection.settimeout(self.connection_timeout)
+        return connection, client_address
+
+    def handle_error(self, request, client_address) -> None:
+        if isinstance(sys.exc_info()[1], TimeoutError):
+            logger.info("Connection from %s timed out", client_address)
+        else:
+            super().handle_error(request, client_address)
+
+    def process_request(self, request, client_address) -> None:
+        super().process_request(request, client_address)
+        self.handled += 1
+
+
+class PreforkServer:
+    def __init__(
+        self,
+        config: ServerConfig,
+        app,
+        *,
+        warmup: Callable[[], None] | None = None,
+        on_worker_exit: Callable[[], None] | None = None,
+    ) -> None:
+        self.config = config
+        self.app = app
+        self.warmup = warmup
+        self.on_worker_exit = on_worker_exit
+        self.listener: socket.socket | None = None
+        self.workers: set[int] = set()
+        self.stopping = False
+        self.reloading = False
+        # Workers write a byte here once warmed up and about to accept
+        self.ready_r, self.ready_w = os.pipe()
+        os.set_blocking(self.ready_r, False)
+        os.set_blocking(self.ready_w, False)
+
+    # Master
+
+    def run(self) -> None:
+        self.listener = self._listen()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        logger.info(
+            "Listening on %s:%s with %s workers (pid %s)",
+            *self.listener.getsockname()[:2],
+            self.config.workers,
+            os.getpid(),
+        )
+        self._spawn_workers()
+        self._retire_old_workers()
+
+        while not (self.stopping or self.reloading):
+            self._reap_workers()
+            self._spawn_workers()
+            self._read_ready()
+            time.sleep(POLL_INTERVAL)
+
+        if self.reloading:
+            self._reexec()
+        self._stop_workers(self.workers)
+
+    def _listen(self) -> socket.socket:
+        inherited_fd = os.environ.pop(LISTEN_FD_ENV, None)
+        if inherited_fd is not None:
+            return socket.socket(fileno=int(inherited_fd))
+
+        family = socket.AF_INET6 if ":" in self.config.host else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.config.host, self.config.port))
+        listener.listen(self.config.backlog)
+        return listener
+
+    def _handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _handle_reload(self, signum, frame) -> None:
+        self.reloading = True
+
+    def _spawn_workers(self) -> None:
+        while len(self.workers) < self.config.workers:
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    self._worker_main()
+                    code = 0
+                except Exception:
+                    logger.exception("Worker %s crashed", os.getpid())
+                finally:
+                    os._exit(code)
+            self.workers.add(pid)
+
+    def _reap_workers(self) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if os.waitstatus_to_exitcode(status) != 0:
+                    logger.warning("Worker %s exited with status %s", pid, status)
+
+    def _read_ready(self) -> int:
+        try:
+            return len(os.read(self.ready_r, 4096))
+        except BlockingIOError:
+            return 0
+
+    def _wait_ready(self, count: int) -> None:
+        deadline = time.monotonic() + self.config.graceful_timeout
+        while count > 0 and time.monotonic() < deadline:
+            count -= self._read_ready()
+            time.sleep(0.05)
+
+    def _stop_workers(self, pids: set[int]) -> None:
+        for pid in pids:
+            _signal(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.config.graceful_timeout
+        alive = set(pids)
+        while alive and time.monotonic() < deadline:
+            for pid in list(alive):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    alive.discard(pid)
+            time.sleep(0.05)
+
+        for pid in alive:
+            logger.warning("Killing worker %s after graceful timeout", pid)
+            _signal(pid, signal.SIGKILL)
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+        self.workers -= pids
+
+    def _reexec(self) -> None:
+        """Replace the master image, keeping the socket and current workers."""
+        logger.info("Reloading: re-executing master %s", os.getpid())
+        assert self.listener is not None
+        self.listener.set_inheritable(True)
+        os.environ[LISTEN_FD_ENV] = str(self.listener.fileno())
+        os.environ[OLD_WORKERS_ENV] = ",".join(str(pid) for pid in self.workers)
+        os.execv(sys.executable, [sys.executable, *sys.argv])
+
+    def _retire_old_workers(self) -> None:
+        """After a reload, stop the previous master's workers once ours are ready."""
+        old = os.environ.pop(OLD_WORKERS_ENV, "")
+        pids = {int(pid) for pid in old.split(",") if pid}
+        if pids:
+            self._wait_ready(self.config.workers)
+            self._stop_workers(pids)
+
+    # Worker
+
+    def _worker_main(self) -> None:
+        stopping = False
+
+        def stop(signum, frame) -> None:
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        if self.warmup is not None:
+            try:
+                self.warmup()
+            except Exception:
+                logger.exception("Worker %s warm-up failed", os.getpid())
+        with contextlib.suppress(BlockingIOError):
+            os.write(self.ready_w, b".")
+
+        max_requests = self.config.max_requests
+        if max_requests:
+            max_requests += random.randint(0, self.config.max_requests_jitter)
+
+        assert self.listener is not None
+        # Workers that lose the race for a connection must not block in accept();
+        # set on the descriptor only, so the socket still selects with a timeout
+        os.set_blocking(self.listener.fileno(), False)
+        server = _WorkerServer(self.listener, self.app, self.config.timeout)
+        master = os.getppid()
+        while not stopping and not (max_requests and server.handled >= max_requests):
+            if os.getppid() != master:
+                logger.warning("Master died, worker %s exiting", os.getpid())
+                break
+            server.handle_request()
+
+        if self.on_worker_exit is not None:
+            self.on_worker_exit()
+
+
+def _signal(pid: int, signum: int) -> None:
+    with contextlib.suppress(ProcessLookupError):
+        os.kill(pid, signum)
@@ -17,18 +17,11 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import include, path
-from rest_framework.schemas import get_schema_view
-from rest_framework.schemas.openapi import SchemaGenerator
 
-schema_view = get_schema_view(
-    title="Transaction Reporting API",
-    description="OpenAPI schema for the transaction reporting backend.",
-    version="1.0.0",
-    generator_class=SchemaGenerator,
-)
+from .schema import CachedSchemaView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("transactions.urls")),
-    path("api/schema/", schema_view, name="openapi-schema"),
+    path("api/schema/", CachedSchemaView.as_view(), name="openapi-schema"),
 ]
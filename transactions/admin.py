@@ -1,7 +1,33 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
+from .coalescing import bump_data_version
+from .filters import MIN_SUBSTRING_SEARCH_LENGTH, search_transactions
 from .models import Transaction
 
+# Unfiltered listings of tables estimated above this many rows show the
+# planner's estimate instead of counting every row
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self) -> int:
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            model = self.object_list.model
+            with connections[self.object_list.db].cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row is not None and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
@@ -16,4 +42,25 @@ class TransactionAdmin(admin.ModelAdmin):
     )
     list_filter = ("transaction_type", "status", "year")
     search_fields = ("transaction_number",)
+    search_help_text = (
+        "Transaction number, or part of it (short terms match the beginning)."
+    )
     ordering = ("created_at", "updated_at")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Same indexed search as the list API instead of ``ILIKE '%term%'``."""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        mode = "substring" if len(term) >= MIN_SUBSTRING_SEARCH_LENGTH else "prefix"
+        return search_transactions(queryset, term, mode), False
+
+    def delete_model(self, request, obj) -> None:
+        super().delete_model(request, obj)
+        bump_data_version(obj._state.db)
+
+    def delete_queryset(self, request, queryset) -> None:
+        super().delete_queryset(request, queryset)
+        bump_data_version(queryset.db)
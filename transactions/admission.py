@@ -0,0 +1,137 @@
+"""Admission control for expensive database work.
+
+``ConcurrencyLimiter`` bounds how many requests of one kind run at the same
+time, with a bounded queue of waiters behind them. Slots are PostgreSQL
+session advisory locks, so the limit holds across threads, worker processes
+and hosts sharing the database, and a slot is released by the server if its
+holder dies.
+
+``statement_timeout`` caps how long the statements of a block may run.
+"""
+
+import time
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from django.db import OperationalError, connections, transaction
+from psycopg import errors
+
+# Seconds between attempts of a queued request to take a running slot
+POLL_INTERVAL = 0.05
+
+
+class AdmissionError(Exception):
+    """Raised when a request is not admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        # Shared with coalesced waiters in other processes
+        return type(self), (str(self), self.retry_after)
+
+
+class QueueFull(AdmissionError):
+    """All running slots and all queue slots are taken."""
+
+
+class QueueTimeout(AdmissionError):
+    """The request was queued but no running slot freed up in time."""
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` concurrent holders; up to ``queue_size`` more wait for
+    at most ``queue_timeout`` seconds, everyone else is rejected immediately.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        queue_size: int,
+        queue_timeout: float,
+        retry_after: int,
+        using: str = "default",
+    ) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.using = using
+        # Advisory lock namespace (a signed int4) shared by all slots of ``name``
+        self.lock_key = zlib.crc32(name.encode()) - 2**31
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        slot = self._try_lock(0, self.limit)
+        if slot is None:
+            slot = self._wait_in_queue()
+        try:
+            yield
+        finally:
+            self._unlock(slot)
+
+    def _wait_in_queue(self) -> int:
+        queue_slot = self._try_lock(self.limit, self.queue_size)
+        if queue_slot is None:
+            raise QueueFull(
+                f"Too many concurrent {self.name} requests, try again later.",
+                self.retry_after,
+            )
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                slot = self._try_lock(0, self.limit)
+                if slot is not None:
+                    return slot
+        finally:
+            self._unlock(queue_slot)
+        raise QueueTimeout(
+            f"Timed out waiting for a free {self.name} slot, try again later.",
+            self.retry_after,
+        )
+
+    def _try_lock(self, first: int, count: int) -> int | None:
+        """Take the first free slot in ``[first, first + count)``, if any."""
+        if count <= 0:
+            return None
+        with connections[self.using].cursor() as cursor:
+            # Evaluated row by row, so at most one lock is taken
+            cursor.execute(
+                "SELECT slot FROM generate_series(%s::int, %s::int) AS slot "
+                "WHERE pg_try_advisory_lock(%s::int, slot) LIMIT 1",
+                [first, first + count - 1, self.lock_key],
+            )
+            row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def _unlock(self, slot: int) -> None:
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_unlock(%s::int, %s::int)", [self.lock_key, slot]
+            )
+
+
+@contextmanager
+def statement_timeout(seconds: float | None, using: str = "default") -> Iterator[None]:
+    """Run the block in a transaction whose statements are cancelled after
+    ``seconds`` (``None`` or 0 disables the limit).
+    """
+    if not seconds:
+        yield
+        return
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('statement_timeout', %s, true)",
+                [f"{int(seconds * 1000)}ms"],
+            )
+        yield
+
+
+def is_statement_timeout(exc: OperationalError) -> bool:
+    return isinstance(exc.__cause__, errors.QueryCanceled)
@@ -0,0 +1,242 @@
+"""Report aggregation in Python over partial aggregates of the finest groups.
+
+Report sources that cannot run the report's ``GROUPING SETS`` query as a whole
+(the columnar snapshot, several shards) reduce the transactions to one
+``GroupStats`` per combination of all report dimensions. Those are exact and
+mergeable, so ``grouping_set_rows`` can derive the coarser levels, metrics and
+trends from them and render the same rows as the SQL query would.
+"""
+
+from collections import defaultdict
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import chain
+from typing import Any
+
+from .services import ReportRowSelection, RowSort
+
+# Fractions of the percentile metrics (``ReportMetric`` values)
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+CENT = Decimal("0.01")
+
+
+@dataclass
+class GroupStats:
+    """Partial aggregates of one group of transactions, amounts in cents."""
+
+    total: int = 0
+    count: int = 0
+    minimum: int | None = None
+    maximum: int | None = None
+    # Sum of the squared amounts, for the error bounds of sampled reports
+    sum_squares: int = 0
+    # Sorted runs of the amounts, only kept when percentiles are requested
+    runs: list[Sequence[int]] = field(default_factory=list)
+
+    def merge(self, other: "GroupStats") -> None:
+        self.total += other.total
+        self.count += other.count
+        self.minimum = _pick(min, self.minimum, other.minimum)
+        self.maximum = _pick(max, self.maximum, other.maximum)
+        self.sum_squares += other.sum_squares
+        self.runs.extend(other.runs)
+
+
+def to_cents(amount: Decimal) -> int:
+    return int(amount.scaleb(2))
+
+
+def money(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def grouping_set_rows(
+    groups: Mapping[tuple, GroupStats],
+    group_by: list[str],
+    metrics: list[str],
+    trends: list[str],
+    decode: Callable[[str, Any], Any] | None = None,
+    sampled: bool = False,
+    rows: ReportRowSelection | None = None,
+) -> list[dict]:
+    """Rows of the report's grouping sets query (see
+    ``TransactionReportService._grouping_sets_query``) with the same keys,
+    types and order, from the stats of its finest groups keyed by their
+    ``group_by`` values. ``metrics`` and ``trends`` are ``ReportMetric`` and
+    ``ReportTrend`` values; ``decode`` turns stored values into dimension values.
+    With ``rows`` the rows are ranked and selected first, and ``row_rank``
+    and ``row_count`` are added.
+    """
+    ranks: dict[Any, int] = {}
+    row_count = 0
+    if rows is not None:
+        groups, ranks, row_count = _select_rows(groups, group_by, rows, decode)
+    levels = [tuple(range(len(group_by))), ()]
+    if len(group_by) > 1:
+        levels[1:1] = [(0,), tuple(range(1, len(group_by)))]
+    year = group_by.index("year") if "year" in group_by else None
+
+    result = []
+    for level in levels:
+        merged: defaultdict[tuple, GroupStats] = defaultdict(GroupStats)
+        for key, stats in groups.items():
+            merged[tuple(key[i] for i in level)].merge(stats)
+        if not level and not merged:
+            # Like SQL, the empty grouping set yields a row for no input
+            merged[()] = GroupStats()
+        trend_values = (
+            _trends(merged, level.index(year), trends)
+            if trends and year in level
+            else {}
+        )
+        for key, stats in merged.items():
+            values = dict(zip(level, key, strict=True))
+            row = {
+                name: (
+                    values.get(i)
+                    if decode is None or values.get(i) is None
+                    else decode(name, values[i])
+                )
+                for i, name in enumerate(group_by)
+            }
+            row["grouping_id"] = sum(
+                1 << (len(group_by) - 1 - i)
+                for i in range(len(group_by))
+                if i not in level
+            )
+            row.update(_metrics(stats, metrics))
+            if sampled:
+                row["sum_squares"] = Decimal(stats.sum_squares).scaleb(-4)
+                row["sample_count"] = stats.count
+            for trend in trends:
+                row[f"trend_{trend}"] = trend_values.get(key, {}).get(trend)
+            if rows is not None:
+                row["row_rank"] = ranks.get(values.get(0))
+                row["row_count"] = row_count
+            result.append(row)
+
+    result.sort(
+        key=lambda row: tuple((row[name] is None, row[name]) for name in group_by)
+    )
+    return result
+
+
+def _select_rows(
+    groups: Mapping[tuple, GroupStats],
+    group_by: list[str],
+    rows: ReportRowSelection,
+    decode: Callable[[str, Any], Any] | None,
+) -> tuple[dict[tuple, GroupStats], dict[Any, int], int]:
+    """``groups`` with the rows ``rows`` leaves out merged into one row of
+    row value ``None``, like ``TransactionReportService._selected_source``,
+    the rank of the selected rows by row value and the number of rows.
+    """
+
+    def decoded(i: int, value: Any) -> Any:
+        return value if decode is None else decode(group_by[i], value)
+
+    stored: dict[Any, Any] = {}  # stored row values by row value
+    keys: dict[Any, Any] = {}
+    for key, stats in groups.items():
+        value = decoded(0, key[0])
+        stored[value] = key[0]
+        if rows.sort is RowSort.ROW:
+            keys[value] = value
+        elif rows.sort is RowSort.TOTAL:
+            keys[value] = keys.get(value, 0) + stats.total
+        else:
+            keys.setdefault(value, None)
+            column = tuple(decoded(i, key[i]) for i in range(1, len(group_by)))
+            if column == rows.column:
+                keys[value] = (keys[value] or 0) + stats.total
+
+    ranked = rows.rank(keys)
+    ranks = {
+        stored[value]: rank
+        for rank, value in enumerate(ranked, start=1)
+        if rows.selects(rank)
+    }
+    selected: defaultdict[tuple, GroupStats] = defaultdict(GroupStats)
+    for key, stats in groups.items():
+        row = key[0] if key[0] in ranks else None
+        selected[(row, *key[1:])].merge(stats)
+    return selected, ranks, len(ranked)
+
+
+def _pick(choose, a: int | None, b: int | None) -> int | None:
+    if a is None:
+        return b
+    return a if b is None else choose(a, b)
+
+
+def _metrics(stats: GroupStats, metrics: list[str]) -> dict:
+    """Metric columns of one group, rendered like PostgreSQL's aggregates."""
+    count = stats.count
+    row: dict[str, Any] = {"total_amount": money(stats.total) if count else None}
+    for metric in metrics:
+        value: int | Decimal | None
+        if metric == "count":
+            value = count
+        elif not count:
+            value = None
+        elif metric == "sum":
+            value = money(stats.total)
+        elif metric == "avg":
+            value = (money(stats.total) / count).quantize(CENT, ROUND_HALF_UP)
+        elif metric in ("min", "max"):
+            extreme = stats.minimum if metric == "min" else stats.maximum
+            assert extreme is not None  # set in every group with rows
+            value = money(extreme)
+        else:
+            # Sorting concatenated sorted runs only merges them
+            amounts = sorted(chain.from_iterable(stats.runs))
+            value = _percentile(amounts, PERCENTILES[metric])
+        row[f"metric_{metric}"] = value
+    return row
+
+
+def _percentile(cents: list[int], fraction: float) -> Decimal:
+    """PostgreSQL's ``PERCENTILE_CONT``: linear interpolation in double
+    precision, converted to ``numeric`` with 15 significant digits.
+    """
+    position = fraction * (len(cents) - 1)
+    lower = int(position)
+    value = cents[lower] / 100
+    if position > lower:
+        value += (cents[lower + 1] / 100 - value) * (position - lower)
+    return Decimal(f"{value:.15g}").quantize(CENT, ROUND_HALF_UP)
+
+
+def _trends(
+    groups: Mapping[tuple, GroupStats], year_index: int, trends: list[str]
+) -> dict[tuple, dict[str, Decimal | None]]:
+    """Trends of each group of one level, over the years of the groups that
+    agree on every other dimension (the SQL ``trend`` window).
+    """
+    partitions: defaultdict[tuple, dict[int, int]] = defaultdict(dict)
+    for key, stats in groups.items():
+        rest = key[:year_index] + key[year_index + 1 :]
+        partitions[rest][key[year_index]] = stats.total
+
+    result = {}
+    for rest, by_year in partitions.items():
+        cumulative = 0
+        for year in sorted(by_year):
+            total = by_year[year]
+            cumulative += total
+            previous = by_year.get(year - 1)
+            values = {
+                "cumulative": money(cumulative),
+                "yoy": None if previous is None else money(total - previous),
+                "yoy_pct": (
+                    None
+                    if not previous
+                    else (Decimal((total - previous) * 100) / previous).quantize(
+                        CENT, ROUND_HALF_UP
+                    )
+                ),
+            }
+            key = rest[:year_index] + (year,) + rest[year_index:]
+            result[key] = {trend: values[trend] for trend in trends}
+    return result
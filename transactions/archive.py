@@ -0,0 +1,116 @@
+"""Hot/cold split of transactions by year.
+
+``archive_transactions`` moves the transactions of old years from the hot
+``Transaction`` table into ``ArchivedTransaction``, so the hot table and its
+indexes only hold the years most queries touch. Reads stay transparent:
+``with_archive`` switches a queryset to the ``CombinedTransaction`` view (hot
+``UNION ALL`` archive) only when the filters can match an archived year.
+Archived rows are read-only.
+"""
+
+from django.db import connections, transaction
+from django.db.models import Max, QuerySet
+
+from .coalescing import bump_data_version
+from .filters import TransactionFilters
+from .models import ArchivedTransaction, CombinedTransaction, Transaction
+
+COLUMNS = (
+    "id",
+    "transaction_type",
+    "status",
+    "transaction_number",
+    "amount",
+    "year",
+    "created_at",
+    "updated_at",
+)
+# Columns of the combined view: the copied ones and the generated ones
+VIEW_COLUMNS = (*COLUMNS, "amount_cents")
+
+# Read by the tombstone trigger (migration 0007) to skip rows being archived
+_SET_ARCHIVING = "SELECT set_config('transactions.archiving', %s, true)"
+
+
+def get_archive_boundary(using: str = "default") -> int | None:
+    """First year after the archived ones, or ``None`` if nothing is archived.
+
+    Read on every request that may need the archive (an index-only lookup),
+    so an archive run in another process takes effect immediately.
+    """
+    last_year = ArchivedTransaction.objects.using(using).aggregate(Max("year"))[
+        "year__max"
+    ]
+    return None if last_year is None else last_year + 1
+
+
+def reaches_archive(filters: TransactionFilters, boundary: int | None) -> bool:
+    """Whether ``filters`` can match a year before ``boundary``."""
+    if boundary is None:
+        return False
+    if filters.year_min is not None and filters.year_min >= boundary:
+        return False
+    year = filters.year
+    return year is None or year.negate or min(year.values) < boundary
+
+
+def with_archive(queryset: QuerySet, filters: TransactionFilters) -> QuerySet:
+    """``queryset`` over ``CombinedTransaction`` if ``filters`` reach archived
+    years, else ``queryset`` unchanged. Only the ordering of ``queryset`` is
+    carried over, so pass an unfiltered one and apply ``filters`` afterwards.
+    """
+    if not reaches_archive(filters, get_archive_boundary(queryset.db)):
+        return queryset
+    return CombinedTransaction.objects.using(queryset.db).order_by(
+        *queryset.query.order_by
+    )
+
+
+def archive_transactions(
+    before_year: int, batch_size: int = 5000, using: str = "default"
+) -> int:
+    """Move the transactions of years before ``before_year`` to the archive.
+
+    Each batch is moved by one ``DELETE ... RETURNING`` feeding an ``INSERT``
+    and committed on its own; ``transactions.archiving`` keeps the delete
+    trigger from recording the moved rows as deleted in the change feed.
+    Returns the number of moved transactions.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    hot = quote(Transaction._meta.db_table)
+    archive = quote(ArchivedTransaction._meta.db_table)
+    columns = ", ".join(quote(column) for column in COLUMNS)
+    sql = (
+        f"WITH moved AS ("
+        f"DELETE FROM {hot} WHERE id IN ("
+        f"SELECT id FROM {hot} WHERE year < %s ORDER BY id LIMIT %s"
+        f") RETURNING {columns}"
+        f") INSERT INTO {archive} ({columns}) SELECT {columns} FROM moved"
+    )
+
+    moved = 0
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(_SET_ARCHIVING, ["on"])
+            cursor.execute(sql, [before_year, batch_size])
+            batch = cursor.rowcount
+            # Transaction-local, but the caller's transaction may outlive ours
+            cursor.execute(_SET_ARCHIVING, ["off"])
+        moved += batch
+        if batch < batch_size:
+            break
+    if moved:
+        bump_data_version(using)
+    return moved
+
+
+def vacuum_tables(using: str = "default") -> None:
+    """Make the space freed in the hot table reusable and refresh statistics.
+    ``VACUUM`` cannot run inside a transaction block.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in (Transaction, ArchivedTransaction):
+            cursor.execute(f"VACUUM (ANALYZE) {quote(model._meta.db_table)}")
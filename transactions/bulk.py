@@ -0,0 +1,91 @@
+"""Set-based status updates for many transactions at once.
+
+Rows are selected in batches of primary keys and each batch is changed by a
+single ``UPDATE``, committed on its own, so row locks are held briefly and a
+large update does not block concurrent writers for its whole duration.
+``QuerySet.update()`` bypasses ``auto_now`` and ``post_save``, so
+``updated_at`` is set explicitly (keeping the change feed correct) and the
+data version is bumped once at the end (invalidating coalesced reports and
+report job results).
+"""
+
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .coalescing import bump_data_version
+from .models import Transaction
+from .sharding import shard_aliases
+
+
+@dataclass(frozen=True)
+class BulkStatusResult:
+    matched: int
+    changed: int
+
+
+def update_status_by_numbers(
+    transaction_numbers: Sequence[str], status: str
+) -> BulkStatusResult:
+    """Set ``status`` on the transactions with the given numbers, on every
+    shard (numbers do not tell the year).
+    """
+    batch_size = settings.BULK_STATUS_BATCH_SIZE
+    numbers = list(dict.fromkeys(transaction_numbers))
+    matched = changed = 0
+    for alias in shard_aliases():
+        batches = (
+            list(
+                Transaction.objects.using(alias)
+                .filter(transaction_number__in=numbers[start : start + batch_size])
+                .values_list("id", flat=True)
+            )
+            for start in range(0, len(numbers), batch_size)
+        )
+        result = _update_status(batches, status, alias)
+        matched += result.matched
+        changed += result.changed
+    return BulkStatusResult(matched=matched, changed=changed)
+
+
+def update_status_by_filters(
+    queryset: QuerySet[Transaction], status: str
+) -> BulkStatusResult:
+    """Set ``status`` on every transaction matched by the filtered ``queryset``."""
+    return _update_status(_id_batches(queryset), status, queryset.db)
+
+
+def _id_batches(queryset: QuerySet[Transaction]) -> Iterator[list[int]]:
+    """Primary keys of ``queryset`` in ascending batches (keyset pagination)."""
+    batch_size = settings.BULK_STATUS_BATCH_SIZE
+    last_id = 0
+    while True:
+        ids = list(
+            queryset.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def _update_status(
+    batches: Iterator[list[int]], status: str, using: str
+) -> BulkStatusResult:
+    matched = changed = 0
+    for ids in batches:
+        matched += len(ids)
+        changed += (
+            Transaction.objects.using(using)
+            .filter(id__in=ids)
+            .exclude(status=status)
+            .update(status=status, updated_at=timezone.now())
+        )
+    if changed:
+        bump_data_version(using)
+    return BulkStatusResult(matched=matched, changed=changed)
@@ -0,0 +1,192 @@
+"""Change feed over transactions for incremental downstream sync.
+
+Inserts and updates are read by keyset pagination over ``(updated_at, id)``;
+deletions come from ``TransactionTombstone`` rows written by database
+triggers on the hot and archive tables. Both streams are merged in timestamp order, and the cursor records
+the position reached in each of them, so a consumer can resume exactly
+where the previous page ended. With several shards (``sharding``) the streams
+of every shard are merged, the cursor keeps a position per shard and events
+carry the ``shard`` they come from, as ids are unique per shard only.
+
+``updated_at`` is assigned when a row is written, not when its transaction
+commits, so rows younger than ``CHANGE_FEED_SAFETY_LAG`` seconds are held
+back until concurrent writers have had time to commit.
+"""
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from typing import Any
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from .models import Transaction, TransactionTombstone
+from .sharding import is_sharded, shard_aliases
+
+# Transaction fields included in upsert events
+CHANGE_FIELDS = (
+    "id",
+    "transaction_type",
+    "transaction_number",
+    "amount",
+    "status",
+    "year",
+    "updated_at",
+)
+
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that were not produced by this feed."""
+
+
+@dataclass(frozen=True)
+class FeedPosition:
+    changed_at: datetime
+    id: int
+
+
+@dataclass(frozen=True)
+class ShardPosition:
+    upserts: FeedPosition | None = None
+    deletes: FeedPosition | None = None
+
+    def encode(self) -> dict[str, list]:
+        return {
+            key: [position.changed_at.isoformat(), position.id]
+            for key, position in (("u", self.upserts), ("d", self.deletes))
+            if position is not None
+        }
+
+    @classmethod
+    def decode(cls, data: dict) -> "ShardPosition":
+        positions = {
+            key: FeedPosition(datetime.fromisoformat(value[0]), int(value[1]))
+            for key, value in data.items()
+            if key in ("u", "d")
+        }
+        return cls(upserts=positions.get("u"), deletes=positions.get("d"))
+
+
+@dataclass(frozen=True)
+class ChangeFeedCursor:
+    # Position in the streams of each shard, by database alias
+    shards: dict[str, ShardPosition] = field(default_factory=dict)
+
+    def position(self, alias: str) -> ShardPosition:
+        return self.shards.get(alias, ShardPosition())
+
+    def encode(self) -> str:
+        # The default database at the top level, as before sharding
+        data: dict[str, Any] = self.position(DEFAULT_DB_ALIAS).encode()
+        others = {
+            alias: position.encode()
+            for alias, position in self.shards.items()
+            if alias != DEFAULT_DB_ALIAS
+        }
+        if others:
+            data["s"] = others
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    @classmethod
+    def decode(cls, raw: str) -> "ChangeFeedCursor":
+        try:
+            data = json.loads(base64.urlsafe_b64decode(raw.encode()))
+            shards = {
+                DEFAULT_DB_ALIAS: ShardPosition.decode(data),
+                **{
+                    alias: ShardPosition.decode(position)
+                    for alias, position in data.get("s", {}).items()
+                },
+            }
+        except (ValueError, TypeError, IndexError, AttributeError, binascii.Error):
+            raise InvalidCursor(f"Invalid cursor '{raw}'.") from None
+        return cls(shards=shards)
+
+
+@dataclass(frozen=True)
+class ChangePage:
+    results: list[dict]
+    next_cursor: str
+    has_more: bool
+
+
+def _after(queryset: QuerySet, field: str, position: FeedPosition | None) -> QuerySet:
+    """Rows strictly after ``position`` in ``(field, id)`` order.
+    The ``field >= value`` conjunct lets the planner start an index range scan.
+    """
+    if position is None:
+        return queryset
+    return queryset.filter(
+        Q(**{f"{field}__gte": position.changed_at})
+        & (Q(**{f"{field}__gt": position.changed_at}) | Q(id__gt=position.id))
+    )
+
+
+def read_changes(cursor: ChangeFeedCursor, limit: int) -> ChangePage:
+    """Return up to ``limit`` change events after ``cursor``, oldest first."""
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SAFETY_LAG)
+    events: list[tuple[tuple, str, dict[str, Any]]] = []
+    for alias in shard_aliases():
+        events += _shard_events(alias, cursor.position(alias), horizon, limit)
+    events.sort(key=lambda event: event[0])
+    page, has_more = events[:limit], len(events) > limit
+
+    sharded = is_sharded()
+    positions = dict(cursor.shards)
+    results: list[dict] = []
+    for (changed_at, _, alias, row_id), op, row in page:
+        position = positions.get(alias, ShardPosition())
+        if op == "upsert":
+            positions[alias] = replace(
+                position, upserts=FeedPosition(changed_at, row_id)
+            )
+            row = {key: value for key, value in row.items() if key != "updated_at"}
+            event = {"op": op, **row, "changed_at": changed_at}
+        else:
+            positions[alias] = replace(
+                position, deletes=FeedPosition(changed_at, row_id)
+            )
+            event = {
+                "op": op,
+                "id": row["transaction_id"],
+                "transaction_number": row["transaction_number"],
+                "changed_at": changed_at,
+            }
+        if sharded:
+            event["shard"] = alias
+        results.append(event)
+
+    next_cursor = ChangeFeedCursor(shards=positions)
+    return ChangePage(
+        results=results, next_cursor=next_cursor.encode(), has_more=has_more
+    )
+
+
+def _shard_events(
+    alias: str, position: ShardPosition, horizon: datetime, limit: int
+) -> list[tuple[tuple, str, dict[str, Any]]]:
+    """Up to ``limit + 1`` events of each stream of shard ``alias`` after
+    ``position``, keyed for merging with the other streams.
+    """
+    upserts = (
+        _after(Transaction.objects.using(alias), "updated_at", position.upserts)
+        .filter(updated_at__lt=horizon)
+        .order_by("updated_at", "id")
+        .values(*CHANGE_FIELDS)[: limit + 1]
+    )
+    deletes = (
+        _after(
+            TransactionTombstone.objects.using(alias), "deleted_at", position.deletes
+        )
+        .filter(deleted_at__lt=horizon)
+        .order_by("deleted_at", "id")
+        .values("id", "transaction_id", "transaction_number", "deleted_at")[: limit + 1]
+    )
+    return [
+        ((row["updated_at"], 1, alias, row["id"]), "upsert", row) for row in upserts
+    ] + [((row["deleted_at"], 0, alias, row["id"]), "delete", row) for row in deletes]
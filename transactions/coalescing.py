@@ -0,0 +1,251 @@
+"""Single-flight coalescing of identical, concurrent computations.
+
+When many clients ask for the same report at the same moment, only one of them
+(the *leader*) runs the query; the others wait for it and share its result or
+its exception. Calls are collapsed within a process by ``SingleFlight`` and,
+optionally, across processes on the same host by ``FileSingleFlight``, which
+uses ``flock`` lock files and pickled result files in a local directory.
+
+Keys include the data version, a database sequence bumped by every write path,
+so that all worker processes stop sharing results computed before a write.
+"""
+
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+DATA_VERSION_SEQUENCE = "transactions_data_version"
+
+
+class CoalescingTimeout(Exception):
+    """Raised to a waiter whose leader did not finish within the timeout."""
+
+
+class CoalescedCallError(Exception):
+    """Raised to cross-process waiters when the leader failed with an exception
+    that cannot be pickled; carries the leader's error message instead.
+    """
+
+
+def get_data_version() -> int:
+    """Version of the transactions data; changes whenever transactions are written."""
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(
+            f"SELECT CASE WHEN is_called THEN last_value ELSE 0 END "
+            f"FROM {DATA_VERSION_SEQUENCE}"
+        )
+        return cursor.fetchone()[0]
+
+
+def bump_data_version(using: str = DEFAULT_DB_ALIAS) -> None:
+    """Bump the version after writing to the ``using`` database.
+    Inside a transaction it is bumped again on commit: reports computed from
+    the uncommitted state under the first bump must not be shared afterwards.
+    """
+    _next_data_version()
+    if connections[using].in_atomic_block:
+        transaction.on_commit(_next_data_version, using=using)
+
+
+def _next_data_version() -> None:
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [DATA_VERSION_SEQUENCE])
+
+
+def make_key(*parts: Any) -> str:
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+
+
+class SingleFlight:
+    """In-process single-flight group keyed by strings."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise CoalescingTimeout(
+                    f"Timed out after {timeout}s waiting for an identical request."
+                )
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class FileSingleFlight:
+    """Cross-process single-flight group backed by lock files in ``directory``.
+
+    The leader holds an exclusive ``flock`` on ``<key>.lock`` while computing
+    and publishes ``<key>.result`` atomically before releasing it. A waiter
+    blocks on the lock and then accepts the published result only if it was
+    written after the waiter arrived; otherwise (e.g. the leader crashed) it
+    computes the result itself. The leader's exception is published pickled,
+    so waiters raise the same exception type.
+
+    Files of keys unused for longer than the timeout can no longer be accepted
+    by any waiter; leaders sweep them from the directory.
+    """
+
+    poll_interval = 0.01
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float) -> Any:
+        arrived_at = time.time()
+        lock_path = os.path.join(self.directory, f"{key}.lock")
+        result_path = os.path.join(self.directory, f"{key}.result")
+
+        with open(lock_path, "a") as lock_file:
+            waited = self._acquire(lock_file, timeout)
+            try:
+                if waited:
+                    published = self._read_result(result_path, arrived_at)
+                    if published is not None:
+                        return self._unwrap(published)
+                # Marks the key as in use for the sweeps
+                os.utime(lock_path)
+                self._sweep(timeout)
+                try:
+                    result = fn()
+                except Exception as exc:
+                    self._write_result(result_path, ("error", exc))
+                    raise
+                self._write_result(result_path, ("ok", result))
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file, timeout: float) -> bool:
+        """Take the exclusive lock; returns True if another process held it."""
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return waited
+            except BlockingIOError:
+                waited = True
+                if time.monotonic() >= deadline:
+                    raise CoalescingTimeout(
+                        f"Timed out after {timeout}s waiting for an identical request."
+                    ) from None
+                time.sleep(self.poll_interval)
+
+    def _read_result(self, path: str, arrived_at: float) -> tuple | None:
+        try:
+            if os.path.getmtime(path) < arrived_at:
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write_result(self, path: str, published: tuple) -> None:
+        status, value = published
+        try:
+            data = pickle.dumps(published)
+            if status == "error":
+                # Exceptions with extra constructor arguments pickle fine but
+                # fail to unpickle
+                pickle.loads(data)
+        except Exception:
+            if status != "error":
+                raise
+            data = pickle.dumps(("error", CoalescedCallError(str(value))))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _sweep(self, timeout: float) -> None:
+        """Remove the files of keys last used more than ``timeout`` ago."""
+        expired_before = time.time() - timeout
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime >= expired_before:
+                    continue
+                if entry.name.endswith(".lock"):
+                    self._remove_lock(entry.path)
+                elif entry.name.endswith((".result", ".tmp")):
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                # Swept by another leader meanwhile
+                continue
+
+    @staticmethod
+    def _remove_lock(path: str) -> None:
+        """Unlink an idle lock file. A process that opened it just before may
+        still lock the unlinked file and compute the result a second time; that
+        only costs a duplicate computation.
+        """
+        with open(path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            os.unlink(path)
+
+    @staticmethod
+    def _unwrap(published: tuple) -> Any:
+        status, value = published
+        if status == "error":
+            raise value
+        return value
+
+
+_local_flight = SingleFlight()
+
+
+def coalesce(
+    key: str,
+    fn: Callable[[], Any],
+    *,
+    timeout: float,
+    directory: str | None = None,
+) -> Any:
+    """Run ``fn`` once for all concurrent callers with the same ``key``.
+
+    Threads of this process are collapsed first; with ``directory`` set, the
+    leading thread additionally coalesces with other processes on the host.
+    """
+    if directory:
+        file_flight = FileSingleFlight(directory)
+        return _local_flight.do(key, lambda: file_flight.do(key, fn, timeout), timeout)
+    return _local_flight.do(key, fn, timeout)
@@ -0,0 +1,35 @@
+"""Derived report dimensions, computed in the database.
+
+Each entry maps a dimension name to the expression that computes it from the
+raw ``Transaction`` columns. The same expressions back the expression indexes
+declared on ``Transaction``, so grouping and filtering on them can use those
+indexes. Adding a derived dimension means adding it here, to
+``ReportDimension``, and creating its index in a migration.
+"""
+
+from django.db.models import CharField, F, Func, IntegerField, Value
+from django.db.models.expressions import Combinable
+from django.db.models.functions import Cast, Floor
+
+# Width of the ``amount_bucket`` dimension; buckets are keyed by their lower bound
+AMOUNT_BUCKET_WIDTH = 100
+
+
+class SplitPart(Func):
+    function = "SPLIT_PART"
+    output_field = CharField()
+
+
+DERIVED_DIMENSIONS: dict[str, Combinable] = {
+    # 0 for amounts in [0, 100), 100 for [100, 200), ...
+    "amount_bucket": Cast(
+        Floor(F("amount") / Value(AMOUNT_BUCKET_WIDTH)), output_field=IntegerField()
+    )
+    * Value(AMOUNT_BUCKET_WIDTH),
+    # 2020 for 2020-2029 (integer division)
+    "decade": F("year") / Value(10) * Value(10),
+    # "INV" for "INV-2024-1"; numbers without "-" are their own prefix
+    "transaction_number_prefix": SplitPart(
+        F("transaction_number"), Value("-"), Value(1)
+    ),
+}
@@ -0,0 +1,473 @@
+"""Report engines: interchangeable implementations of a report's aggregation.
+
+An engine turns a ``ReportQuery`` into the rows of the report's grouping sets
+query (see ``TransactionReportService._grouping_sets_query``), with the same
+keys, types and order; ``TransactionReportService.build_report`` pivots those
+rows whichever engine produced them. Built-in engines:
+
+- ``postgres``: the ``GROUPING SETS`` query in PostgreSQL, the reference;
+- ``partials``: a ``GROUP BY`` of mergeable partial aggregates on every shard,
+  rolled up in Python (``aggregation``); only for reports spanning shards;
+- ``snapshot``: the memory-mapped columnar snapshot (``snapshot``);
+- ``mirror``: the DuckDB report mirror (``mirror``).
+
+``select_engine`` picks, among the engines supporting a query, the one with
+the lowest estimated cost, from the planner's row estimate and the expected
+number of groups; a query only one engine supports is not estimated.
+Estimates are cached per report source for a while, so repeated reports do
+not pay for an extra ``EXPLAIN``. ``REPORT_ENGINE`` forces an engine whenever
+it supports the query. Further engines (e.g. over pre-aggregated tables) are
+added with ``register_engine``.
+"""
+
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+
+from .aggregation import PERCENTILES, GroupStats, grouping_set_rows
+from .filters import TransactionFilters
+from .mirror import get_fresh_report_mirror
+from .models import Transaction
+from .services import (
+    MIRROR_METRIC_SQL,
+    MIRROR_TREND_SQL,
+    ReportMetric,
+    ReportRowSelection,
+    ReportSampling,
+    ReportTrend,
+    TransactionReportService,
+)
+from .sharding import is_sharded, shard_aliases, shard_querysets
+from .snapshot import CHUNK_ROWS, get_fresh_report_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Rough costs in microseconds, only their ratios matter: a statement round
+# trip, scanning and aggregating a row in SQL (and sorting it for
+# percentiles), filtering and grouping a snapshot row with numpy, merging a
+# row of sorted amounts and rolling up a group in Python and the DuckDB
+# equivalents
+STATEMENT_COST = 500.0
+SQL_ROW_COST = 0.3
+SQL_SORT_ROW_COST = 0.5
+SQL_GROUP_COST = 0.2
+NUMPY_SCAN_ROW_COST = 0.02
+NUMPY_ROW_COST = 0.05
+PYTHON_ROW_COST = 0.15
+PYTHON_GROUP_COST = 3.0
+MIRROR_STATEMENT_COST = 300.0
+MIRROR_ROW_COST = 0.02
+
+# Expected distinct values of dimensions the filters do not pin down
+DEFAULT_CARDINALITIES = {
+    "transaction_type": len(Transaction.TransactionType.values),
+    "status": len(Transaction.Status.values),
+    "amount_bucket": 100,
+    "transaction_number_prefix": 20,
+}
+# Distinct years are read from the planner's statistics, cached this long
+YEAR_CARDINALITY_TTL = 300.0
+DEFAULT_YEAR_CARDINALITY = 10
+# Planner row estimates of report sources are cached this long, for at most
+# this many distinct sources
+ROW_ESTIMATE_TTL = 300.0
+ROW_ESTIMATES_SIZE = 1024
+
+
+class EngineUnavailable(Exception):
+    """Raised by engines whose source went away after they were selected."""
+
+
+@dataclass(frozen=True)
+class ReportEstimate:
+    rows: float  # transactions the report aggregates
+    groups: float  # finest groups, at most ``rows``
+
+
+@dataclass
+class ReportQuery:
+    """Everything an engine needs to aggregate one report."""
+
+    queryset: QuerySet[Transaction]
+    row_field: str
+    column_fields: list[str]
+    metrics: list[ReportMetric]
+    sampling: ReportSampling | None = None
+    trends: list[ReportTrend] = field(default_factory=list)
+    # The filters ``queryset`` was built with, if known
+    filters: TransactionFilters | None = None
+    rows: ReportRowSelection | None = None
+
+    @property
+    def group_by(self) -> list[str]:
+        return [self.row_field, *self.column_fields]
+
+    @property
+    def levels(self) -> int:
+        """Grouping sets of the report."""
+        return 4 if self.column_fields else 2
+
+    @property
+    def exact(self) -> bool:
+        return self.sampling is None and self.queryset.db in shard_aliases()
+
+    @property
+    def percentiles(self) -> bool:
+        return any(metric.value in PERCENTILES for metric in self.metrics)
+
+    @cached_property
+    def querysets(self) -> list[QuerySet[Transaction]]:
+        """The report's transactions as one queryset per shard they live on."""
+        if self.filters is None or not is_sharded():
+            return [self.queryset]
+        return shard_querysets(Transaction.objects.all(), self.filters)
+
+    @cached_property
+    def estimate(self) -> ReportEstimate:
+        rows = sum(_estimate_rows(queryset, self) for queryset in self.querysets)
+        groups = math.prod(_cardinality(field, self) for field in self.group_by)
+        return ReportEstimate(rows=rows, groups=min(groups, max(rows, 1)))
+
+
+class ReportEngine:
+    """Base class of report engines."""
+
+    name: str = ""
+
+    def supports(self, query: ReportQuery) -> bool:
+        """Whether the engine can answer ``query`` exactly as required."""
+        return True
+
+    def cost(self, query: ReportQuery) -> float:
+        """Estimated cost of answering ``query``, in the units above."""
+        raise NotImplementedError
+
+    def fetch(self, query: ReportQuery) -> list[dict]:
+        raise NotImplementedError
+
+
+class PostgresEngine(ReportEngine):
+    """The report's ``GROUPING SETS`` query, run in PostgreSQL."""
+
+    name = "postgres"
+
+    def supports(self, query: ReportQuery) -> bool:
+        return len(query.querysets) == 1
+
+    def cost(self, query: ReportQuery) -> float:
+        estimate = query.estimate
+        row_cost = SQL_ROW_COST + (SQL_SORT_ROW_COST if query.percentiles else 0)
+        return (
+            STATEMENT_COST
+            + estimate.rows * row_cost * query.levels
+            + estimate.groups * SQL_GROUP_COST * query.levels
+        )
+
+    def fetch(self, query: ReportQuery) -> list[dict]:
+        [queryset] = query.querysets
+        sql = TransactionReportService._grouping_sets_query(
+            queryset,
+            query.row_field,
+            query.column_fields,
+            query.metrics,
+            query.sampling,
+            query.trends,
+            rows=query.rows,
+        )
+        return (
+            []
+            if sql is None
+            else TransactionReportService._fetch_rows(queryset.db, sql)
+        )
+
+
+class PartialsEngine(ReportEngine):
+    """Partial aggregates of the finest groups, computed by each shard
+    concurrently and rolled up in Python.
+    """
+
+    name = "partials"
+
+    def supports(self, query: ReportQuery) -> bool:
+        return len(query.querysets) > 1
+
+    def cost(self, query: ReportQuery) -> float:
+        estimate = query.estimate
+        row_cost = SQL_ROW_COST
+        if query.percentiles:
+            # The sorted amounts are merged again at every level
+            row_cost += SQL_SORT_ROW_COST + PYTHON_ROW_COST * query.levels
+        return (
+            STATEMENT_COST
+            + estimate.rows * row_cost
+            + estimate.groups * PYTHON_GROUP_COST * query.levels
+        )
+
+    def fetch(self, query: ReportQuery) -> list[dict]:
+        group_by = query.group_by
+        sampling = query.sampling
+        with_amounts = query.percentiles
+
+        def fetch_partials(queryset: QuerySet[Transaction]) -> list[dict]:
+            sql = TransactionReportService._partial_query(
+                queryset, group_by, sampling, with_amounts
+            )
+            return (
+                []
+                if sql is None
+                else TransactionReportService._fetch_rows(queryset.db, sql)
+            )
+
+        def fetch_in_thread(queryset: QuerySet[Transaction]) -> list[dict]:
+            try:
+                return fetch_partials(queryset)
+            finally:
+                # The connections of pool threads are not reused
+                connections[queryset.db].close()
+
+        if len(query.querysets) == 1:
+            # Stay on the request's connection (and transaction)
+            partials = [fetch_partials(query.querysets[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(query.querysets)) as executor:
+                partials = list(executor.map(fetch_in_thread, query.querysets))
+
+        groups: dict[tuple, GroupStats] = {}
+        for partial in partials:
+            for row in partial:
+                stats = GroupStats(
+                    total=int(row["total"]),
+                    count=row["count"],
+                    minimum=row["minimum"],
+                    maximum=row["maximum"],
+                    sum_squares=int(row["sum_squares"].scaleb(4)) if sampling else 0,
+                    runs=[row["amounts"]] if with_amounts else [],
+                )
+                key = tuple(row[field] for field in group_by)
+                if key in groups:
+                    groups[key].merge(stats)
+                else:
+                    groups[key] = stats
+        return grouping_set_rows(
+            groups,
+            group_by,
+            [metric.value for metric in query.metrics],
+            [trend.value for trend in query.trends],
+            sampled=sampling is not None,
+            rows=query.rows,
+        )
+
+
+class SnapshotEngine(ReportEngine):
+    """Exact reports aggregated in process from the columnar snapshot, while
+    it is fresh. Filtering scans every row of the snapshot, chunk by chunk.
+    """
+
+    name = "snapshot"
+
+    def supports(self, query: ReportQuery) -> bool:
+        return (
+            query.exact
+            and query.filters is not None
+            and get_fresh_report_snapshot() is not None
+        )
+
+    def cost(self, query: ReportQuery) -> float:
+        snapshot = get_fresh_report_snapshot()
+        scanned = snapshot.rows if snapshot is not None else query.estimate.rows
+        row_cost = NUMPY_ROW_COST
+        if query.percentiles:
+            # The sorted amounts are merged again in Python at every level
+            row_cost += PYTHON_ROW_COST * query.levels
+        # The groups of every chunk are merged in Python
+        chunks = max(math.ceil(scanned / CHUNK_ROWS), 1)
+        return (
+            scanned * NUMPY_SCAN_ROW_COST
+            + min(query.estimate.rows, scanned) * row_cost
+            + query.estimate.groups * PYTHON_GROUP_COST * (chunks + query.levels)
+        )
+
+    def fetch(self, query: ReportQuery) -> list[dict]:
+        snapshot = get_fresh_report_snapshot()
+        # Supported queries have filters
+        if snapshot is None or query.filters is None:
+            raise EngineUnavailable(self.name)
+        return snapshot.aggregate(
+            query.filters,
+            query.row_field,
+            query.column_fields,
+            [metric.value for metric in query.metrics],
+            [trend.value for trend in query.trends],
+            query.rows,
+        )
+
+
+class MirrorEngine(ReportEngine):
+    """Exact reports run in the DuckDB report mirror, while it is fresh."""
+
+    name = "mirror"
+
+    def supports(self, query: ReportQuery) -> bool:
+        return query.exact and get_fresh_report_mirror() is not None
+
+    def cost(self, query: ReportQuery) -> float:
+        # Its rows are rounded to cents in Python
+        return (
+            MIRROR_STATEMENT_COST
+            + query.estimate.rows * MIRROR_ROW_COST
+            + query.estimate.groups * PYTHON_GROUP_COST * query.levels
+        )
+
+    def fetch(self, query: ReportQuery) -> list[dict]:
+        mirror = get_fresh_report_mirror()
+        if mirror is None:
+            raise EngineUnavailable(self.name)
+        sql = TransactionReportService._grouping_sets_query(
+            query.queryset,
+            query.row_field,
+            query.column_fields,
+            query.metrics,
+            trends=query.trends,
+            metric_sql=MIRROR_METRIC_SQL,
+            trend_sql=MIRROR_TREND_SQL,
+            rows=query.rows,
+        )
+        if sql is None:
+            return []
+        return [
+            TransactionReportService._round_mirror_values(agg)
+            for agg in mirror.fetch(*sql)
+        ]
+
+
+_engines: dict[str, ReportEngine] = {}
+
+
+def register_engine(engine: ReportEngine) -> ReportEngine:
+    """Make ``engine`` available for selection under its name."""
+    _engines[engine.name] = engine
+    return engine
+
+
+def get_engine(name: str) -> ReportEngine:
+    return _engines[name]
+
+
+def get_engines() -> list[ReportEngine]:
+    return list(_engines.values())
+
+
+for _engine in (PostgresEngine(), PartialsEngine(), SnapshotEngine(), MirrorEngine()):
+    register_engine(_engine)
+
+
+def select_engine(query: ReportQuery) -> ReportEngine:
+    """The forced engine (``REPORT_ENGINE``) if it supports ``query``, else
+    the cheapest engine supporting it.
+    """
+    forced = settings.REPORT_ENGINE
+    if forced:
+        engine = _engines.get(forced)
+        if engine is None:
+            logger.warning("Unknown REPORT_ENGINE '%s'", forced)
+        elif engine.supports(query):
+            return engine
+    candidates = [engine for engine in _engines.values() if engine.supports(query)]
+    if len(candidates) == 1:
+        return candidates[0]
+    return min(candidates, key=lambda engine: engine.cost(query))
+
+
+def run_report_query(query: ReportQuery) -> tuple[ReportEngine, list[dict]]:
+    """Rows of ``query`` from the selected engine, falling back to the
+    reference engines if its source went away in the meantime.
+    """
+    engine = select_engine(query)
+    try:
+        return engine, engine.fetch(query)
+    except EngineUnavailable:
+        fallback = _engines[
+            PostgresEngine.name if len(query.querysets) == 1 else PartialsEngine.name
+        ]
+        return fallback, fallback.fetch(query)
+
+
+_row_estimates: OrderedDict[tuple, tuple[float, float]] = OrderedDict()
+_row_estimates_lock = threading.Lock()
+
+
+def _estimate_rows(queryset: QuerySet[Transaction], query: ReportQuery) -> float:
+    """Planner's estimate of the transactions ``queryset`` reads."""
+    source = TransactionReportService._report_source(
+        queryset, query.group_by, query.sampling
+    )
+    if source is None:
+        return 0.0
+    sql, params = source
+    key = (queryset.db, sql, tuple(params))
+    now = time.monotonic()
+    with _row_estimates_lock:
+        cached = _row_estimates.get(key)
+        if cached is not None and now - cached[1] < ROW_ESTIMATE_TTL:
+            _row_estimates.move_to_end(key)
+            return cached[0]
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    rows = float(plan[0]["Plan"]["Plan Rows"])
+    with _row_estimates_lock:
+        _row_estimates[key] = (rows, now)
+        _row_estimates.move_to_end(key)
+        while len(_row_estimates) > ROW_ESTIMATES_SIZE:
+            _row_estimates.popitem(last=False)
+    return rows
+
+
+def _cardinality(name: str, query: ReportQuery) -> float:
+    """Expected distinct values of dimension ``name`` in the report."""
+    filters = query.filters
+    value_filter = getattr(filters, name, None) if filters is not None else None
+    if value_filter is not None and not value_filter.negate:
+        return len(value_filter.values)
+    if name in ("year", "decade"):
+        years = _year_cardinality(query.queryset.db)
+        return years if name == "year" else years / 10 + 1
+    return DEFAULT_CARDINALITIES[name]
+
+
+_year_cardinalities: dict[str, tuple[float, float]] = {}
+_year_cardinalities_lock = threading.Lock()
+
+
+def _year_cardinality(using: str) -> float:
+    """Distinct years of the hot table according to ``pg_stats``."""
+    now = time.monotonic()
+    with _year_cardinalities_lock:
+        cached = _year_cardinalities.get(using)
+    if cached is not None and now - cached[1] < YEAR_CARDINALITY_TTL:
+        return cached[0]
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT n_distinct FROM pg_stats WHERE tablename = %s AND attname = 'year'",
+            [Transaction._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # Negative values are a fraction of the rows; years never scale with them
+    years = row[0] if row is not None and row[0] > 0 else DEFAULT_YEAR_CARDINALITY
+    with _year_cardinalities_lock:
+        _year_cardinalities[using] = (years, now)
+    return years
@@ -0,0 +1,201 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any
+
+from django.db.models import QuerySet
+
+from .models import Transaction
+
+# Query parameters understood by ``TransactionFilters``
+FILTER_PARAMS = (
+    "transaction_type",
+    "status",
+    "year",
+    "year_min",
+    "year_max",
+    "amount_min",
+    "amount_max",
+)
+
+# Prefix negating a value list, e.g. ``status=!paid,partially_paid``
+NEGATION_PREFIX = "!"
+
+
+# ``search_mode`` -> case-insensitive lookup on ``transaction_number``; exact and
+# prefix matches use ``transaction_number_upper_idx``, substring matches the
+# trigram index from migration 0006
+SEARCH_LOOKUPS = {
+    "exact": "iexact",
+    "prefix": "istartswith",
+    "substring": "icontains",
+}
+DEFAULT_SEARCH_MODE = "substring"
+# Shorter substrings have no trigram to look up, so they would scan the table
+MIN_SUBSTRING_SEARCH_LENGTH = 3
+
+
+class FilterError(ValueError):
+    """Raised for filter parameters that cannot be turned into a query."""
+
+
+@dataclass(frozen=True)
+class ValueFilter:
+    """Membership predicate compiled to ``IN`` (or ``NOT IN`` when negated)."""
+
+    values: tuple
+    negate: bool = False
+
+
+@dataclass(frozen=True)
+class TransactionFilters:
+    transaction_type: ValueFilter | None = None
+    status: ValueFilter | None = None
+    year: ValueFilter | None = None
+    year_min: int | None = None
+    year_max: int | None = None
+    amount_min: Decimal | None = None
+    amount_max: Decimal | None = None
+
+    @classmethod
+    def from_params(cls, params: Mapping[str, Any]) -> "TransactionFilters":
+        """Parse and validate filter params; raises ``FilterError`` on bad input.
+
+        For backwards compatibility non-numeric ``year`` values are ignored
+        rather than rejected.
+        """
+        params = get_filter_params(params)
+        filters = cls(
+            transaction_type=_parse_choices(
+                params, "transaction_type", Transaction.TransactionType.values
+            ),
+            status=_parse_choices(params, "status", Transaction.Status.values),
+            year=_parse_years(params),
+            year_min=_parse_int(params, "year_min"),
+            year_max=_parse_int(params, "year_max"),
+            amount_min=_parse_decimal(params, "amount_min"),
+            amount_max=_parse_decimal(params, "amount_max"),
+        )
+        for low, high in (("year_min", "year_max"), ("amount_min", "amount_max")):
+            low_value, high_value = getattr(filters, low), getattr(filters, high)
+            if None not in (low_value, high_value) and low_value > high_value:
+                raise FilterError(f"{low} must not be greater than {high}.")
+        return filters
+
+    def apply(self, queryset: QuerySet[Transaction]) -> QuerySet[Transaction]:
+        """Translate the filters into sargable ``IN`` / range predicates."""
+        for name in ("transaction_type", "status", "year"):
+            value_filter: ValueFilter | None = getattr(self, name)
+            if value_filter is None:
+                continue
+            lookup = {f"{name}__in": value_filter.values}
+            if value_filter.negate:
+                queryset = queryset.exclude(**lookup)
+            else:
+                queryset = queryset.filter(**lookup)
+
+        ranges = {
+            "year__gte": self.year_min,
+            "year__lte": self.year_max,
+            "amount__gte": self.amount_min,
+            "amount__lte": self.amount_max,
+        }
+        ranges = {
+            lookup: value for lookup, value in ranges.items() if value is not None
+        }
+        if ranges:
+            queryset = queryset.filter(**ranges)
+        return queryset
+
+
+def get_filter_params(params: Mapping[str, Any]) -> dict[str, str]:
+    """Pick the filter parameters out of a request's query params or body."""
+    return {
+        name: str(params.get(name))
+        for name in FILTER_PARAMS
+        if params.get(name) not in (None, "")
+    }
+
+
+def filter_transactions(
+    queryset: QuerySet[Transaction], params: Mapping[str, Any]
+) -> QuerySet[Transaction]:
+    """Apply the transaction filters shared by the list, report and job endpoints.
+    Filters are combined with AND logic.
+    """
+    return TransactionFilters.from_params(params).apply(queryset)
+
+
+def search_transactions(
+    queryset: QuerySet[Transaction], term: str, mode: str = DEFAULT_SEARCH_MODE
+) -> QuerySet[Transaction]:
+    """Search transactions by ``transaction_number``, ignoring case.
+    Raises ``FilterError`` for unknown modes and too short substrings.
+    """
+    if mode not in SEARCH_LOOKUPS:
+        raise FilterError(
+            f"Invalid search_mode '{mode}'. Must be one of {sorted(SEARCH_LOOKUPS)}."
+        )
+    if mode == "substring" and len(term) < MIN_SUBSTRING_SEARCH_LENGTH:
+        raise FilterError(
+            f"Substring search needs at least {MIN_SUBSTRING_SEARCH_LENGTH} "
+            "characters; use search_mode=prefix or exact for shorter terms."
+        )
+    return queryset.filter(**{f"transaction_number__{SEARCH_LOOKUPS[mode]}": term})
+
+
+def _split_values(raw: str) -> tuple[list[str], bool]:
+    negate = raw.startswith(NEGATION_PREFIX)
+    if negate:
+        raw = raw[len(NEGATION_PREFIX) :]
+    return [_p for part in raw.split(",") if (_p := part.strip())], negate
+
+
+def _parse_choices(
+    params: Mapping[str, str], name: str, allowed: list[str]
+) -> ValueFilter | None:
+    raw = params.get(name)
+    if not raw:
+        return None
+    values, negate = _split_values(raw)
+    for value in values:
+        if value not in allowed:
+            raise FilterError(
+                f"Invalid {name} '{value}'. Must be one of {sorted(allowed)}."
+            )
+    if not values:
+        return None
+    return ValueFilter(values=tuple(dict.fromkeys(values)), negate=negate)
+
+
+def _parse_years(params: Mapping[str, str]) -> ValueFilter | None:
+    raw = params.get("year")
+    if not raw:
+        return None
+    values, negate = _split_values(raw)
+    years = tuple(dict.fromkeys(int(value) for value in values if value.isdigit()))
+    if not years:
+        return None
+    return ValueFilter(values=years, negate=negate)
+
+
+def _parse_int(params: Mapping[str, str], name: str) -> int | None:
+    raw = params.get(name)
+    if not raw:
+        return None
+    if not raw.isdigit():
+        raise FilterError(f"Invalid {name} '{raw}'. Must be a non-negative integer.")
+    return int(raw)
+
+
+def _parse_decimal(params: Mapping[str, str], name: str) -> Decimal | None:
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise FilterError(f"Invalid {name} '{raw}'. Must be a decimal number.")
+    return value
@@ -0,0 +1,250 @@
+"""Asynchronous report jobs executed on a bounded, in-process worker pool.
+
+Jobs are persisted as ``ReportJob`` rows so that any web worker can answer
+status requests, while the computation itself runs on a thread pool of the
+process that accepted the job. There is no external broker: the pool refreshes
+the heartbeat of the jobs it holds, and queued or running jobs whose heartbeat
+stopped (their process died) are marked as failed. Workers record the stage
+the computation is in (querying, pivoting, serializing) as its progress.
+"""
+
+import dataclasses
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .archive import with_archive
+from .filters import TransactionFilters
+from .models import ReportJob, Transaction
+from .serializers import TransactionReportSerializer
+from .services import TransactionReportRequest, TransactionReportService
+
+logger = logging.getLogger(__name__)
+
+# Heartbeat intervals a job may miss before it is considered dead
+STALE_HEARTBEATS = 3
+
+
+class JobQueueFull(Exception):
+    """Raised when the local worker pool already has its maximum of pending jobs."""
+
+
+class _WorkerPool:
+    """Thread pool that refuses work beyond ``max_pending`` unfinished jobs and
+    refreshes the heartbeat of its unfinished jobs from a background thread.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="report-job"
+        )
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self._jobs: set = set()
+        self._jobs_lock = threading.Lock()
+        self._stopped = threading.Event()
+        threading.Thread(
+            target=self._beat, name="report-job-heartbeat", daemon=True
+        ).start()
+
+    def submit(self, fn, job_id) -> None:
+        if not self.pending.acquire(blocking=False):
+            raise JobQueueFull("Too many report jobs are pending, try again later.")
+        with self._jobs_lock:
+            self._jobs.add(job_id)
+        future = self.executor.submit(fn, job_id)
+        future.add_done_callback(lambda _: self._done(job_id))
+
+    def shutdown(self, wait: bool) -> None:
+        self.executor.shutdown(wait=wait)
+        self._stopped.set()
+
+    def _done(self, job_id) -> None:
+        with self._jobs_lock:
+            self._jobs.discard(job_id)
+        self.pending.release()
+
+    def _beat(self) -> None:
+        while not self._stopped.wait(settings.REPORT_JOBS_HEARTBEAT_INTERVAL):
+            with self._jobs_lock:
+                jobs = list(self._jobs)
+            if not jobs:
+                continue
+            try:
+                ReportJob.objects.filter(pk__in=jobs).update(
+                    heartbeat_at=timezone.now()
+                )
+            except DatabaseError:
+                logger.exception("Could not refresh the heartbeat of report jobs")
+            finally:
+                connections.close_all()
+
+
+_pool: _WorkerPool | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> _WorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _WorkerPool(
+                max_workers=settings.REPORT_JOBS_MAX_WORKERS,
+                max_pending=settings.REPORT_JOBS_MAX_PENDING,
+            )
+        return _pool
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    """Stop the local worker pool, by default finishing the jobs it accepted."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+
+def _expires_at():
+    return timezone.now() + timedelta(seconds=settings.REPORT_JOBS_RESULT_TTL)
+
+
+def purge_expired_jobs() -> int:
+    deleted, _ = ReportJob.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def fail_stale_jobs() -> int:
+    """Mark queued and running jobs whose process stopped beating as failed."""
+    stale_before = timezone.now() - timedelta(
+        seconds=STALE_HEARTBEATS * settings.REPORT_JOBS_HEARTBEAT_INTERVAL
+    )
+    return ReportJob.objects.filter(
+        status__in=[ReportJob.JobStatus.QUEUED, ReportJob.JobStatus.RUNNING],
+        heartbeat_at__lt=stale_before,
+    ).update(
+        status=ReportJob.JobStatus.FAILED,
+        error="The process running the job stopped.",
+        finished_at=timezone.now(),
+        expires_at=_expires_at(),
+    )
+
+
+def get_job(job_id) -> ReportJob | None:
+    fail_stale_jobs()
+    return ReportJob.objects.filter(pk=job_id, expires_at__gt=timezone.now()).first()
+
+
+def submit_report_job(
+    filters: dict[str, str],
+    report_request: TransactionReportRequest,
+) -> tuple[ReportJob, bool]:
+    """Enqueue a report; returns ``(job, created)``.
+
+    A live job (queued, running or succeeded, not expired) with the same
+    fingerprint is returned instead of enqueueing a duplicate; jobs whose
+    process died are failed first, so they are not returned. Raises
+    ``JobQueueFull`` if this process already has too many pending jobs.
+    """
+    purge_expired_jobs()
+    fail_stale_jobs()
+
+    queryset = _filtered_queryset(filters)
+    fingerprint = TransactionReportService.fingerprint(queryset, report_request)
+    existing = (
+        ReportJob.objects.filter(fingerprint=fingerprint, expires_at__gt=timezone.now())
+        .exclude(status=ReportJob.JobStatus.FAILED)
+        .order_by("-created_at")
+        .first()
+    )
+    if existing is not None:
+        return existing, False
+
+    job = ReportJob.objects.create(
+        fingerprint=fingerprint,
+        filters=filters,
+        report_request=dataclasses.asdict(report_request),
+        expires_at=_expires_at(),
+        heartbeat_at=timezone.now(),
+    )
+
+    if settings.REPORT_JOBS_EAGER:
+        run_report_job(job.pk)
+        job.refresh_from_db()
+        return job, True
+
+    try:
+        _get_pool().submit(_run_in_worker, job.pk)
+    except JobQueueFull:
+        job.delete()
+        raise
+    return job, True
+
+
+def _filtered_queryset(filters: dict[str, str]) -> QuerySet[Transaction]:
+    parsed = TransactionFilters.from_params(filters)
+    return parsed.apply(with_archive(Transaction.objects.all(), parsed))
+
+
+def _run_in_worker(job_id) -> None:
+    close_old_connections()
+    try:
+        run_report_job(job_id)
+    finally:
+        # Worker threads own their connections; don't leak one per thread
+        connections.close_all()
+
+
+def run_report_job(job_id) -> None:
+    """Execute a queued job and store its serialized result (or error)."""
+    updated = ReportJob.objects.filter(
+        pk=job_id, status=ReportJob.JobStatus.QUEUED
+    ).update(
+        status=ReportJob.JobStatus.RUNNING,
+        started_at=timezone.now(),
+    )
+    if not updated:
+        return
+
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        report_request = TransactionReportRequest.from_dict(job.report_request)
+        queryset = _filtered_queryset(job.filters)
+        result = TransactionReportService.build_report(
+            queryset,
+            report_request,
+            TransactionFilters.from_params(job.filters),
+            on_stage=lambda stage: _set_stage(job_id, stage),
+        )
+        _set_stage(job_id, ReportJob.JobStage.SERIALIZING)
+        payload = TransactionReportSerializer(result.as_dict()).data
+    except Exception as exc:
+        logger.exception("Report job %s failed", job_id)
+        _running(job_id).update(
+            status=ReportJob.JobStatus.FAILED,
+            error=str(exc),
+            finished_at=timezone.now(),
+            expires_at=_expires_at(),
+        )
+        return
+
+    # A job failed as stale meanwhile keeps its failure
+    _running(job_id).update(
+        status=ReportJob.JobStatus.SUCCEEDED,
+        stage=ReportJob.JobStage.DONE,
+        result=payload,
+        finished_at=timezone.now(),
+        expires_at=_expires_at(),
+    )
+
+
+def _running(job_id) -> QuerySet[ReportJob]:
+    return ReportJob.objects.filter(pk=job_id, status=ReportJob.JobStatus.RUNNING)
+
+
+def _set_stage(job_id, stage) -> None:
+    _running(job_id).update(stage=stage)
@@ -0,0 +1,58 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.archive import archive_transactions, vacuum_tables
+from transactions.sharding import get_shards
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the transactions of years before --before-year from the hot table "
+        "to the archive. The API keeps serving them, reading the archive only "
+        "when filters reach into archived years."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--before-year",
+            type=int,
+            required=True,
+            help="Archive transactions whose year is lower than this.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f"Rows moved per transaction. Defaults to {DEFAULT_BATCH_SIZE}.",
+        )
+        parser.add_argument(
+            "--no-vacuum",
+            action="store_true",
+            help="Skip VACUUM (ANALYZE) of the hot and archive tables afterwards.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        before_year: int = options["before_year"]
+        batch_size: int = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        moved = 0
+        for shard in get_shards():
+            if shard.first_year is not None and shard.first_year >= before_year:
+                continue
+            shard_moved = archive_transactions(
+                before_year, batch_size=batch_size, using=shard.alias
+            )
+            if shard_moved and not options["no_vacuum"]:
+                vacuum_tables(using=shard.alias)
+            moved += shard_moved
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {moved} transactions from years before {before_year}."
+            )
+        )
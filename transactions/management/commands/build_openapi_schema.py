@@ -0,0 +1,31 @@
+from pathlib import Path
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from transaction_reporting.schema import write_schemas
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the OpenAPI schema to openapi.yaml and openapi.json, "
+        "to be served by /api/schema/ without generating it at runtime."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--output",
+            dest="output",
+            default=None,
+            help="Output directory. Defaults to the OPENAPI_SCHEMA_DIR setting.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        output = options.get("output") or settings.OPENAPI_SCHEMA_DIR
+        if not output:
+            raise CommandError("Pass --output or set OPENAPI_SCHEMA_DIR.")
+
+        for path in write_schemas(Path(output)):
+            self.stdout.write(f"Wrote {path}")
+        self.stdout.write(self.style.SUCCESS("OpenAPI schema built."))
@@ -0,0 +1,25 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.snapshot import refresh_report_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the memory-mapped report snapshot (REPORT_SNAPSHOT_PATH) from "
+        "all transactions and publish it to the workers. Run it more often than "
+        "REPORT_SNAPSHOT_MAX_STALENESS, e.g. from cron."
+    )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        result = refresh_report_snapshot()
+        if result is None:
+            raise CommandError("No report snapshot: set REPORT_SNAPSHOT_PATH.")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Published report snapshot version {result.version}: "
+                f"{result.rows} transactions."
+            )
+        )
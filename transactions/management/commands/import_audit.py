@@ -0,0 +1,117 @@
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Entry points audited, as code run in a fresh interpreter
+IMPORT_TARGETS = {
+    # The URLconf is imported on a worker's first request, so it counts too
+    "wsgi": (
+        "import transaction_reporting.wsgi; "
+        "from django.urls import get_resolver; get_resolver().url_patterns"
+    ),
+    "manage": (
+        "import os, django; "
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', "
+        "'transaction_reporting.settings'); "
+        "django.setup(); "
+        "from django.core.management import get_commands; get_commands()"
+    ),
+}
+
+# import time:   self [us] | cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+@dataclass(frozen=True)
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_import_times(stderr: str) -> list[ImportTiming]:
+    """Parse the output of ``python -X importtime``."""
+    timings = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            timings.append(
+                ImportTiming(
+                    module=module,
+                    self_us=int(self_us),
+                    cumulative_us=int(cumulative_us),
+                    depth=(len(indent) - 1) // 2,
+                )
+            )
+    return timings
+
+
+class Command(BaseCommand):
+    help = (
+        "Report per-module import time of the manage.py and wsgi.py entry points "
+        "(python -X importtime), optionally failing above a time budget."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--target",
+            choices=sorted(IMPORT_TARGETS),
+            action="append",
+            help="Entry point to audit (repeatable). Defaults to all of them.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="Number of slowest modules to list per entry point.",
+        )
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            default=None,
+            help="Fail if an entry point's total import time exceeds this budget.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        budget_ms: float | None = options["budget_ms"]
+        over_budget = []
+        for target in options["target"] or sorted(IMPORT_TARGETS):
+            timings = self._measure(IMPORT_TARGETS[target])
+            total_ms = sum(t.cumulative_us for t in timings if t.depth == 0) / 1000
+
+            self.stdout.write(f"{target}: {total_ms:.1f} ms total import time")
+            self.stdout.write(f"  {'cumulative ms':>13}  {'self ms':>8}  module")
+            slowest = sorted(timings, key=lambda t: t.cumulative_us, reverse=True)
+            for timing in slowest[: options["top"]]:
+                self.stdout.write(
+                    f"  {timing.cumulative_us / 1000:>13.1f}"
+                    f"  {timing.self_us / 1000:>8.1f}  {timing.module}"
+                )
+
+            if budget_ms is not None and total_ms > budget_ms:
+                over_budget.append(f"{target} ({total_ms:.1f} ms)")
+
+        if over_budget:
+            raise CommandError(
+                f"Import time budget of {budget_ms} ms exceeded: "
+                + ", ".join(over_budget)
+            )
+
+    def _measure(self, code: str) -> list[ImportTiming]:
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f"Importing failed:\n{completed.stderr[-2000:]}")
+        return parse_import_times(completed.stderr)
@@ -1,5 +1,7 @@
 import json
 import os
+from collections import defaultdict
+from contextlib import ExitStack
 from typing import Any
 
 from django.conf import settings
@@ -7,8 +9,12 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import IntegrityError
 from django.db import transaction as db_transaction
 
-from transactions.models import Transaction
+from transactions.coalescing import bump_data_version
+from transactions.mirror import refresh_report_mirror
+from transactions.models import ArchivedTransaction, Transaction
 from transactions.serializers import TransactionIngestSerializer
+from transactions.sharding import shard_aliases, shard_for_year
+from transactions.snapshot import refresh_report_snapshot
 
 DEFAULT_FIXTURE_PATH = os.path.join(
     "transactions",
@@ -38,7 +44,10 @@ class Command(BaseCommand):
         parser.add_argument(
             "--reset",
             action="store_true",
-            help="Delete all existing transactions before loading new ones.",
+            help=(
+                "Delete all existing transactions (archived ones included) "
+                "before loading new ones."
+            ),
         )
 
     def handle(self, *args: Any, **options: Any) -> None:
@@ -79,12 +88,39 @@ class Command(BaseCommand):
             )
             return
 
-        with db_transaction.atomic():
+        self._write(objects_to_create, reset)
+        bump_data_version()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Inserted {len(objects_to_create)} transactions (skipped {skipped} of {total})."
+            )
+        )
+
+        # A reset deletes every row, which is quicker to rebuild than to replay
+        if refresh_report_mirror(rebuild=reset) is not None:
+            self.stdout.write("Refreshed the report mirror.")
+        if refresh_report_snapshot() is not None:
+            self.stdout.write("Rebuilt the report snapshot.")
+
+    def _write(self, objects: list[Transaction], reset: bool) -> None:
+        """Insert ``objects`` into the shards owning their years, atomically."""
+        by_shard: defaultdict[str, list[Transaction]] = defaultdict(list)
+        for obj in objects:
+            by_shard[shard_for_year(obj.year)].append(obj)
+
+        with ExitStack() as stack:
+            # One transaction per shard, all committed once every row is in
+            for alias in shard_aliases():
+                stack.enter_context(db_transaction.atomic(using=alias))
             if reset:
-                Transaction.objects.all().delete()
+                for alias in shard_aliases():
+                    Transaction.objects.using(alias).all().delete()
+                    ArchivedTransaction.objects.using(alias).all().delete()
 
             try:
-                Transaction.objects.bulk_create(objects_to_create)
+                for alias, shard_objects in by_shard.items():
+                    Transaction.objects.using(alias).bulk_create(shard_objects)
             except IntegrityError as exc:
                 raise CommandError(
                     "Failed to insert transactions due to duplicate transaction_number "
@@ -92,12 +128,6 @@ class Command(BaseCommand):
                     "Use --reset to start from a clean slate if appropriate."
                 ) from exc
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"Inserted {len(objects_to_create)} transactions (skipped {skipped} of {total})."
-            )
-        )
-
     def _load_json(self, path: str) -> list[dict[str, Any]]:
         """Load and validate the top-level JSON structure.
         Returns a list of dicts, or raises CommandError on invalid structure.
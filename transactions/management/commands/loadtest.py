@@ -0,0 +1,220 @@
+import json
+import math
+import urllib.request
+from typing import Any
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from transaction_reporting.loadtest import (
+    IntervalStats,
+    LoadTest,
+    LoadTestConfig,
+    LoadTestResult,
+    Target,
+    parse_mix,
+)
+from transactions.services import ReportDimension
+
+DEFAULT_MIX = "list=3,report=1"
+
+# Filter sets combined with list pages and reports
+FILTER_SETS: list[dict[str, str]] = [
+    {},
+    {"status": "unpaid"},
+    {"transaction_type": "invoice,bill"},
+    {"status": "!paid", "year_min": "2022"},
+    {"year": "2023"},
+    {"amount_min": "100", "amount_max": "5000"},
+]
+LIST_PAGE_SIZES = (10, 50, 100)
+
+# Report dimension combinations as (row_field, column_fields)
+REPORT_LAYOUTS = [
+    (ReportDimension.TRANSACTION_TYPE, []),
+    (ReportDimension.TRANSACTION_TYPE, [ReportDimension.STATUS]),
+    (ReportDimension.STATUS, [ReportDimension.YEAR]),
+    (ReportDimension.YEAR, [ReportDimension.TRANSACTION_TYPE, ReportDimension.STATUS]),
+    (ReportDimension.TRANSACTION_NUMBER_PREFIX, [ReportDimension.DECADE]),
+    (ReportDimension.AMOUNT_BUCKET, [ReportDimension.STATUS]),
+]
+REPORT_METRICS = ("", "count,avg", "p50,p90,p99")
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server with an open-loop mix of list pages and reports "
+        "and report throughput, latency histograms, error rates and database "
+        "connection usage over time."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--url",
+            default="http://127.0.0.1:8000",
+            help="Base URL of the server. Defaults to http://127.0.0.1:8000.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=20.0,
+            help="Average arrival rate in requests per second. Defaults to 20.",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=30.0,
+            help="Seconds to generate load for. Defaults to 30.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="Maximum requests in flight. Defaults to 16.",
+        )
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help=f"Weights of the endpoints as name=weight pairs. "
+            f"Defaults to {DEFAULT_MIX}.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between progress lines. Defaults to 1.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30.0,
+            help="Seconds to wait for a response. Defaults to 30.",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None, help="Seed of the request mix."
+        )
+        parser.add_argument(
+            "--json",
+            dest="json_path",
+            default=None,
+            help="Also write the full results (with the time series) to this file.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["rate"] <= 0 or options["duration"] <= 0:
+            raise CommandError("--rate and --duration must be positive.")
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        if options["interval"] <= 0:
+            raise CommandError("--interval must be positive.")
+
+        base_url = options["url"].rstrip("/")
+        targets = self._targets(base_url, options["timeout"])
+        try:
+            mix = parse_mix(options["mix"], targets)
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        config = LoadTestConfig(
+            base_url=base_url,
+            rate=options["rate"],
+            duration=options["duration"],
+            concurrency=options["concurrency"],
+            mix=mix,
+            timeout=options["timeout"],
+            interval=options["interval"],
+            seed=options["seed"],
+        )
+        self.stdout.write(
+            f"Sending {config.rate:g} requests/s for {config.duration:g}s to "
+            f"{base_url} (at most {config.concurrency} in flight)..."
+        )
+        result = LoadTest(config, targets).run(on_interval=self._write_interval)
+        self._write_summary(result)
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as file:
+                json.dump(result.as_dict(), file, indent=2)
+            self.stdout.write(f"Wrote the results to {options['json_path']}.")
+
+    def _targets(self, base_url: str, timeout: float) -> dict[str, Target]:
+        list_path = reverse("transaction-list")
+        list_queries = []
+        for filters in FILTER_SETS:
+            # Only request pages that exist for the server's data
+            count = self._count(f"{base_url}{list_path}", filters, timeout)
+            for page_size in LIST_PAGE_SIZES:
+                pages = max(math.ceil(count / page_size), 1)
+                list_queries += [
+                    {**filters, "page": str(page), "page_size": str(page_size)}
+                    for page in range(1, pages + 1)
+                ]
+
+        report_queries = [
+            {
+                **filters,
+                "row_field": row_field.value,
+                "column_fields": ",".join(field.value for field in column_fields),
+                **({"metrics": metrics} if metrics else {}),
+            }
+            for filters in FILTER_SETS
+            for row_field, column_fields in REPORT_LAYOUTS
+            for metrics in REPORT_METRICS
+        ]
+        return {
+            "list": Target(path=list_path, queries=list_queries),
+            "report": Target(
+                path=reverse("transaction-report"), queries=report_queries
+            ),
+        }
+
+    def _count(self, url: str, filters: dict[str, str], timeout: float) -> int:
+        query = urlencode({**filters, "page_size": 1})
+        try:
+            with urllib.request.urlopen(f"{url}?{query}", timeout=timeout) as response:
+                return json.load(response)["count"]
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Cannot query {url}: {exc}") from exc
+
+    def _write_interval(self, interval: IntervalStats) -> None:
+        connections = (
+            "n/a"
+            if interval.connections is None
+            else " ".join(
+                f"{state}={count}"
+                for state, count in sorted(interval.connections.items())
+            )
+        )
+        self.stdout.write(
+            f"{interval.elapsed:7.1f}s  {interval.throughput:7.1f} req/s  "
+            f"errors={interval.errors:<4d} p50={_ms(interval.p50):>9s} "
+            f"p99={_ms(interval.p99):>9s}  in_flight={interval.in_flight:<4d} "
+            f"backlog={interval.backlog:<4d} db: {connections}"
+        )
+
+    def _write_summary(self, result: LoadTestResult) -> None:
+        for name, stats in [*result.targets.items(), ("total", result.total)]:
+            latency = stats.latency
+            self.stdout.write(
+                f"\n{name}: {stats.requests} requests, "
+                f"{stats.requests / result.duration:.1f} req/s, "
+                f"{stats.error_rate:.2%} errors "
+                f"({', '.join(f'{s}: {n}' for s, n in sorted(stats.statuses.items()))})"
+            )
+            self.stdout.write(
+                f"  latency p50={_ms(latency.percentile(0.5))} "
+                f"p90={_ms(latency.percentile(0.9))} "
+                f"p99={_ms(latency.percentile(0.99))} "
+                f"max={_ms(max(latency.latencies, default=None))}"
+            )
+            histogram = latency.histogram()
+            largest = max((count for _, count in histogram), default=0)
+            for label, count in histogram:
+                if count:
+                    bar = "#" * max(round(40 * count / largest), 1)
+                    self.stdout.write(f"  {label:>9s} {count:7d} {bar}")
+
+
+def _ms(seconds: float | None) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
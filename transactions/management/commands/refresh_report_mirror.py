@@ -0,0 +1,35 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.mirror import refresh_report_mirror
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the DuckDB report mirror (REPORT_MIRROR_PATH) with the "
+        "transactions written since its last refresh. Run it more often than "
+        "REPORT_MIRROR_MAX_STALENESS, e.g. from cron."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Copy all transactions instead of the changes since the last refresh.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        result = refresh_report_mirror(rebuild=options["rebuild"])
+        if result is None:
+            raise CommandError(
+                "No report mirror: set REPORT_MIRROR_PATH and install duckdb."
+            )
+
+        action = "Rebuilt" if result.rebuilt else "Refreshed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action} the report mirror: {result.upserted} rows written, "
+                f"{result.deleted} deleted."
+            )
+        )
@@ -0,0 +1,107 @@
+from importlib import import_module
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+
+from transaction_reporting.schema import SCHEMA_FORMATS, get_schema
+from transaction_reporting.server import PreforkServer, ServerConfig, parse_bind
+from transactions.jobs import shutdown_pool
+from transactions.models import Transaction
+from transactions.services import (
+    ReportDimension,
+    TransactionReportRequest,
+    TransactionReportService,
+)
+
+
+def warm_worker() -> None:
+    """Open this worker's database connections before it accepts traffic."""
+    for connection in connections.all():
+        connection.ensure_connection()
+    if settings.SERVER_WARM_REPORTS:
+        # Coalesced, so workers warming at the same time share one query
+        TransactionReportService.build_report_coalesced(
+            Transaction.objects.all(),
+            TransactionReportRequest(
+                row_field=ReportDimension.TRANSACTION_TYPE,
+                column_fields=[ReportDimension.STATUS],
+            ),
+        )
+
+
+def stop_worker() -> None:
+    shutdown_pool(wait=True)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the application with a preforking WSGI server: the app is loaded "
+        "once in the master and forked into warmed-up workers. "
+        "Send HUP to reload gracefully, TERM to stop."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--bind",
+            default=None,
+            help="host:port to listen on. Defaults to the SERVER_BIND setting.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes. Defaults to SERVER_WORKERS.",
+        )
+        parser.add_argument(
+            "--max-requests",
+            type=int,
+            default=None,
+            help="Recycle a worker after this many requests (0 disables). "
+            "Defaults to SERVER_MAX_REQUESTS.",
+        )
+        parser.add_argument(
+            "--warm-reports",
+            action="store_true",
+            help="Compute the default report in each worker before serving.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            host, port = parse_bind(options["bind"] or settings.SERVER_BIND)
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        workers = options["workers"] or settings.SERVER_WORKERS
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+        max_requests = options["max_requests"]
+        if max_requests is None:
+            max_requests = settings.SERVER_MAX_REQUESTS
+        if options["warm_reports"]:
+            settings.SERVER_WARM_REPORTS = True
+
+        # Preload in the master so that workers inherit it copy-on-write
+        app = get_wsgi_application()
+        import_module(settings.ROOT_URLCONF)
+        for fmt in SCHEMA_FORMATS:
+            get_schema(fmt)
+        # Workers must not share the master's database sockets
+        connections.close_all()
+
+        config = ServerConfig(
+            host=host,
+            port=port,
+            workers=workers,
+            max_requests=max_requests,
+            max_requests_jitter=settings.SERVER_MAX_REQUESTS_JITTER,
+            graceful_timeout=settings.SERVER_GRACEFUL_TIMEOUT,
+            timeout=settings.SERVER_TIMEOUT or None,
+        )
+        self.stdout.write(
+            f"Serving on {host}:{port} with {workers} workers "
+            f"(max {max_requests or 'unlimited'} requests each)."
+        )
+        PreforkServer(config, app, warmup=warm_worker, on_worker_exit=stop_worker).run()
@@ -0,0 +1,145 @@
+"""Per-request memory accounting with ``tracemalloc``.
+
+With ``MEMORY_ACCOUNTING`` on, ``MemoryAccountingMiddleware`` measures the
+Python allocations of every request and of its stages, the ``trace_span``
+blocks (filter parsing, queryset evaluation, aggregation, pivot construction,
+serialization): the peak above the allocations at the start of the stage,
+and the bytes still allocated at its end (retained). They are returned in the
+``X-Memory-*`` response headers and added to the request's trace, if traced.
+
+``tracemalloc`` counts the allocations of the whole process, so the figures
+are exact when a process handles one request at a time, like the workers of
+``manage.py serve``; concurrent requests in other threads add to them.
+Tracing allocations also slows Python code down severalfold, so accounting is
+meant for diagnosing memory growth and for budget tests, not to stay on.
+"""
+
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+
+
+@dataclass
+class StageMemory:
+    name: str
+    peak: int = 0  # bytes, above the allocations at the start of the stage
+    retained: int = 0  # bytes, allocated during the stage and not freed
+
+
+class MemoryAccount:
+    """Memory of the stages of one request, in the order they end. Stages
+    nest in the order they are opened, so an account is only used from the
+    thread handling the request.
+    """
+
+    def __init__(self) -> None:
+        self.stages: list[StageMemory] = []
+        # [allocated at the start, highest allocated since] of each open stage
+        self._open: list[list[int]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMemory]:
+        current, peak = tracemalloc.get_traced_memory()
+        # The peak is reset for the new stage; the open ones keep theirs
+        for frame in self._open:
+            frame[1] = max(frame[1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current]
+        self._open.append(frame)
+        stage = StageMemory(name)
+        try:
+            yield stage
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self._open.pop()
+            frame[1] = max(frame[1], peak)
+            for outer in self._open:
+                outer[1] = max(outer[1], frame[1])
+            stage.peak = frame[1] - frame[0]
+            stage.retained = current - frame[0]
+            self.stages.append(stage)
+
+    @property
+    def total(self) -> StageMemory:
+        """The outermost stage, once ended."""
+        return self.stages[-1]
+
+    def as_dict(self) -> dict:
+        return {
+            "peak": self.total.peak,
+            "retained": self.total.retained,
+            "stages": [asdict(stage) for stage in self.stages[:-1]],
+        }
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "X-Memory-Peak": str(self.total.peak),
+            "X-Memory-Retained": str(self.total.retained),
+            "X-Memory-Stages": ", ".join(
+                f"{stage.name};peak={stage.peak};retained={stage.retained}"
+                for stage in self.stages[:-1]
+            ),
+        }
+
+
+_current: ContextVar[MemoryAccount | None] = ContextVar("memory", default=None)
+
+
+@contextmanager
+def account_memory(name: str = "request") -> Iterator[MemoryAccount]:
+    """Account the memory of the block, as a stage named ``name``, and of the
+    ``memory_stage`` blocks it runs. Starts ``tracemalloc`` for the block if
+    it is not tracing yet.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    account = MemoryAccount()
+    token = _current.set(account)
+    try:
+        with account.stage(name):
+            yield account
+    finally:
+        _current.reset(token)
+        if started:
+            tracemalloc.stop()
+
+
+@contextmanager
+def memory_stage(name: str) -> Iterator[StageMemory | None]:
+    """Account the block as a stage of the current memory account, if any."""
+    account = _current.get()
+    if account is None:
+        yield None
+        return
+    with account.stage(name) as stage:
+        yield stage
+
+
+class MemoryAccountingMiddleware:
+    """Accounts the memory of requests (see the module docstring). Installed
+    after ``TracingMiddleware``, so that traces include the account.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.MEMORY_ACCOUNTING:
+            return self.get_response(request)
+
+        if not tracemalloc.is_tracing():
+            # Kept on: restarting it would forget what is still allocated
+            tracemalloc.start()
+        # Responses are rendered by the time they get here
+        with account_memory() as account:
+            response = self.get_response(request)
+        # Read by ``TracingMiddleware``
+        request.memory_account = account
+        for header, value in account.headers().items():
+            response[header] = value
+        return response
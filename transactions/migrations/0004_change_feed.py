@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:58
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# Statement-level trigger: one set-based INSERT per DELETE statement, reading
+# the deleted rows from the transition table.
+CREATE_TOMBSTONE_TRIGGER = """
+CREATE FUNCTION transactions_record_tombstones() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transactions_transactiontombstone
+        (transaction_id, transaction_number, deleted_at)
+    SELECT id, transaction_number, now() FROM deleted_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER transactions_transaction_tombstones
+    AFTER DELETE ON transactions_transaction
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION transactions_record_tombstones();
+"""
+
+DROP_TOMBSTONE_TRIGGER = """
+DROP TRIGGER IF EXISTS transactions_transaction_tombstones
+    ON transactions_transaction;
+DROP FUNCTION IF EXISTS transactions_record_tombstones();
+"""
+
+
+class Migration(migrations.Migration):
+    # AddIndexConcurrently cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0003_report_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TransactionTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("transaction_id", models.BigIntegerField()),
+                ("transaction_number", models.CharField(max_length=64)),
+                ("deleted_at", models.DateTimeField()),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                fields=["updated_at", "id"], name="transaction_updated_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transactiontombstone",
+            index=models.Index(
+                fields=["deleted_at", "id"], name="tombstone_deleted_id_idx"
+            ),
+        ),
+        migrations.RunSQL(CREATE_TOMBSTONE_TRIGGER, DROP_TOMBSTONE_TRIGGER),
+    ]
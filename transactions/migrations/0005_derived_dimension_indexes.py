@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:59
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+import transactions.dimensions
+
+
+class Migration(migrations.Migration):
+    # AddIndexConcurrently cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0004_change_feed"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                django.db.models.expressions.CombinedExpression(
+                    django.db.models.functions.comparison.Cast(
+                        django.db.models.functions.math.Floor(
+                            django.db.models.expressions.CombinedExpression(
+                                models.F("amount"), "/", models.Value(100)
+                            )
+                        ),
+                        output_field=models.IntegerField(),
+                    ),
+                    "*",
+                    models.Value(100),
+                ),
+                name="transaction_amount_bucket_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                django.db.models.expressions.CombinedExpression(
+                    django.db.models.expressions.CombinedExpression(
+                        models.F("year"), "/", models.Value(10)
+                    ),
+                    "*",
+                    models.Value(10),
+                ),
+                name="transaction_decade_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                transactions.dimensions.SplitPart(
+                    models.F("transaction_number"), models.Value("-"), models.Value(1)
+                ),
+                name="transaction_number_prefix_idx",
+            ),
+        ),
+    ]
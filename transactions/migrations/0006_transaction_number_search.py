@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:16
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+TRIGRAM_INDEX = "transaction_number_trgm_idx"
+
+
+def create_trigram_index(apps, schema_editor):
+    """Substring search index. pg_trgm ships with the PostgreSQL contrib
+    modules; on servers without it substring search scans the table instead.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRIGRAM_INDEX} "
+        "ON transactions_transaction "
+        "USING gin (UPPER(transaction_number) gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {TRIGRAM_INDEX}")
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently, which cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0005_derived_dimension_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("transaction_number"),
+                    name="text_pattern_ops",
+                ),
+                name="transaction_number_upper_idx",
+            ),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:22
+
+from django.db import migrations, models
+
+COLUMNS = (
+    "id, transaction_type, status, transaction_number, amount, year, "
+    "created_at, updated_at"
+)
+
+CREATE_COMBINED_VIEW = f"""
+CREATE VIEW transactions_combinedtransaction AS
+    SELECT {COLUMNS} FROM transactions_transaction
+    UNION ALL
+    SELECT {COLUMNS} FROM transactions_archivedtransaction;
+"""
+
+DROP_COMBINED_VIEW = "DROP VIEW IF EXISTS transactions_combinedtransaction;"
+
+# Rows moved to the archive are still served by the API, so the change feed
+# must not report them as deleted: archiving sets ``transactions.archiving``
+# for its transactions and the trigger then writes no tombstones.
+SKIP_ARCHIVED_TOMBSTONES = """
+CREATE OR REPLACE FUNCTION transactions_record_tombstones() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('transactions.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO transactions_transactiontombstone
+        (transaction_id, transaction_number, deleted_at)
+    SELECT id, transaction_number, now() FROM deleted_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+RECORD_ALL_TOMBSTONES = """
+CREATE OR REPLACE FUNCTION transactions_record_tombstones() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transactions_transactiontombstone
+        (transaction_id, transaction_number, deleted_at)
+    SELECT id, transaction_number, now() FROM deleted_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+TRANSACTION_FIELDS = [
+    ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+    (
+        "transaction_type",
+        models.CharField(
+            choices=[
+                ("invoice", "Invoice"),
+                ("bill", "Bill"),
+                ("direct_expense", "Direct Expense"),
+            ],
+            max_length=32,
+        ),
+    ),
+    (
+        "status",
+        models.CharField(
+            choices=[
+                ("paid", "Paid"),
+                ("unpaid", "Unpaid"),
+                ("partially_paid", "Partially Paid"),
+            ],
+            max_length=32,
+        ),
+    ),
+    ("transaction_number", models.CharField(max_length=64)),
+    ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+    ("year", models.PositiveSmallIntegerField()),
+    ("created_at", models.DateTimeField()),
+    ("updated_at", models.DateTimeField()),
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0006_transaction_number_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTransaction",
+            fields=[(name, field.clone()) for name, field in TRANSACTION_FIELDS],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["year", "transaction_number"],
+                        name="archived_year_number_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="CombinedTransaction",
+            fields=[(name, field.clone()) for name, field in TRANSACTION_FIELDS],
+            options={
+                "db_table": "transactions_combinedtransaction",
+                "managed": False,
+            },
+        ),
+        migrations.RunSQL(CREATE_COMBINED_VIEW, DROP_COMBINED_VIEW),
+        migrations.RunSQL(SKIP_ARCHIVED_TOMBSTONES, RECORD_ALL_TOMBSTONES),
+    ]
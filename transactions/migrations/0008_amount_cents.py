@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:16
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+COLUMNS = (
+    "id, transaction_type, status, transaction_number, amount, year, "
+    "created_at, updated_at"
+)
+
+
+def combined_view(columns: str) -> str:
+    return f"""
+DROP VIEW IF EXISTS transactions_combinedtransaction;
+CREATE VIEW transactions_combinedtransaction AS
+    SELECT {columns} FROM transactions_transaction
+    UNION ALL
+    SELECT {columns} FROM transactions_archivedtransaction;
+"""
+
+
+def amount_cents_field():
+    return models.GeneratedField(
+        db_persist=True,
+        expression=django.db.models.functions.comparison.Cast(
+            django.db.models.expressions.CombinedExpression(
+                models.F("amount"), "*", models.Value(100)
+            ),
+            models.BigIntegerField(),
+        ),
+        output_field=models.BigIntegerField(),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0007_transaction_archive"),
+    ]
+
+    operations = [
+        # Adding a stored generated column rewrites the tables, computing it
+        # for the existing rows
+        migrations.AddField(
+            model_name="transaction",
+            name="amount_cents",
+            field=amount_cents_field(),
+        ),
+        migrations.AddField(
+            model_name="archivedtransaction",
+            name="amount_cents",
+            field=amount_cents_field(),
+        ),
+        migrations.AddField(
+            model_name="combinedtransaction",
+            name="amount_cents",
+            field=amount_cents_field(),
+        ),
+        migrations.RunSQL(
+            combined_view(f"{COLUMNS}, amount_cents"), combined_view(COLUMNS)
+        ),
+    ]
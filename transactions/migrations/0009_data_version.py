@@ -0,0 +1,17 @@
+from django.db import migrations
+
+# Shared by every worker process: sequence values are visible to all sessions
+# at once, outside of transactions.
+CREATE_DATA_VERSION = "CREATE SEQUENCE transactions_data_version;"
+
+DROP_DATA_VERSION = "DROP SEQUENCE IF EXISTS transactions_data_version;"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0008_amount_cents"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_DATA_VERSION, DROP_DATA_VERSION),
+    ]
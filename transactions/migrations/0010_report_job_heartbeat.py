@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0009_data_version"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="reportjob",
+            name="progress",
+        ),
+        migrations.AddField(
+            model_name="reportjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
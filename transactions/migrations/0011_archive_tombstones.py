@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# Archived transactions are still served by the API, so deleting them must
+# reach the change feed too. The function skips the rows moved by archiving
+# (see 0007), whichever table they are deleted from.
+CREATE_ARCHIVE_TOMBSTONE_TRIGGER = """
+CREATE TRIGGER transactions_archivedtransaction_tombstones
+    AFTER DELETE ON transactions_archivedtransaction
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION transactions_record_tombstones();
+"""
+
+DROP_ARCHIVE_TOMBSTONE_TRIGGER = """
+DROP TRIGGER IF EXISTS transactions_archivedtransaction_tombstones
+    ON transactions_archivedtransaction;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0010_report_job_heartbeat"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CREATE_ARCHIVE_TOMBSTONE_TRIGGER, DROP_ARCHIVE_TOMBSTONE_TRIGGER
+        ),
+    ]
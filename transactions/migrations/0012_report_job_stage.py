@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0011_archive_tombstones"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportjob",
+            name="stage",
+            field=models.CharField(
+                choices=[
+                    ("queued", "Queued"),
+                    ("querying", "Querying"),
+                    ("pivoting", "Pivoting"),
+                    ("serializing", "Serializing"),
+                    ("done", "Done"),
+                ],
+                default="queued",
+                max_length=16,
+            ),
+        ),
+    ]
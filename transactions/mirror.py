@@ -0,0 +1,417 @@
+"""Optional embedded columnar mirror of transactions for reports.
+
+A local DuckDB file holds the columns reports group and filter on, for hot
+and archived transactions alike. ``TransactionReportService`` runs exact
+reports against it while its last refresh is at most
+``REPORT_MIRROR_MAX_STALENESS`` seconds old and falls back to PostgreSQL
+otherwise (or when ``duckdb`` is not installed).
+
+Refreshes are incremental: rows written since the previous refresh (by
+``updated_at``, re-reading the last ``CHANGE_FEED_SAFETY_LAG`` seconds for
+transactions that committed late) are extracted with ``COPY`` and replace
+their old versions, and tombstoned rows are deleted. DuckDB allows no reader
+while another process writes a file, so the published path is a symlink to
+one of two files: a refresh updates the other one in place, catching up from
+its own (one refresh older) state, and atomically switches the link to it;
+readers keep using the file they opened until they notice the switch. Only
+when a reader still holds the other file, or there is none yet, is it replaced
+by a copy of the published one. With several shards (``sharding``) the mirror
+holds the transactions of all of them.
+"""
+
+import fcntl
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Value
+from django.utils import timezone
+
+from .archive import get_archive_boundary
+from .models import (
+    ArchivedTransaction,
+    CombinedTransaction,
+    Transaction,
+    TransactionTombstone,
+)
+from .sharding import shard_aliases
+
+logger = logging.getLogger(__name__)
+
+# The columns reports read, with their DuckDB types; ``shard`` is the alias of
+# the database the row was read from, as ids are unique per shard only
+MIRROR_COLUMNS = {
+    "shard": "VARCHAR",
+    "id": "BIGINT",
+    "transaction_type": "VARCHAR",
+    "status": "VARCHAR",
+    "transaction_number": "VARCHAR",
+    "amount": "DECIMAL(12, 2)",
+    "amount_cents": "BIGINT",
+    "year": "SMALLINT",
+}
+MIRROR_TABLE = CombinedTransaction._meta.db_table
+
+# Rows extracted from PostgreSQL as CSV, read back by DuckDB
+_CSV_COLUMNS = ", ".join(
+    f"'{name}': '{type_}'" for name, type_ in MIRROR_COLUMNS.items()
+)
+_CSV_SOURCE = (
+    "read_csv(?, header = false, delim = ',', quote = '\"', escape = '\"', "
+    f"columns = {{{_CSV_COLUMNS}}})"
+)
+
+
+@dataclass(frozen=True)
+class MirrorState:
+    # Changes written before this moment are in the mirror
+    synced_at: datetime
+    # Archive boundary of each shard at that moment
+    archive_boundaries: dict[str, int | None]
+
+
+@dataclass(frozen=True)
+class RefreshResult:
+    rebuilt: bool
+    upserted: int
+    deleted: int
+
+
+def _connect(path: str, read_only: bool):
+    import duckdb
+
+    connection = duckdb.connect(path, read_only=read_only)
+    # Same integer semantics as PostgreSQL for the derived dimensions; global
+    # so that the cursors of the connection share it
+    connection.execute("SET GLOBAL integer_division = true")
+    return connection
+
+
+def _to_duckdb(sql: str, params) -> tuple[str, list]:
+    """Turn psycopg placeholders and parameter types into DuckDB ones."""
+    sql = re.sub(r"%([s%])", lambda m: "?" if m.group(1) == "s" else "%", sql)
+    return sql, [int(p) if isinstance(p, int) else p for p in params]
+
+
+class ReportMirror:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._version: tuple[int, int] | None = None
+        self._state: MirrorState | None = None
+
+    # Reading
+
+    def state(self) -> MirrorState | None:
+        """State of the published file, or ``None`` if there is none yet."""
+        with self._lock:
+            return self._open()[1]
+
+    def is_fresh(self, max_staleness: float) -> bool:
+        state = self.state()
+        return (
+            state is not None
+            and (timezone.now() - state.synced_at).total_seconds() <= max_staleness
+        )
+
+    def fetch(self, sql: str, params) -> list[dict]:
+        """Run a report query written for PostgreSQL against the mirror."""
+        with self._lock:
+            connection = self._open()[0]
+            if connection is None:
+                raise FileNotFoundError(self.path)
+            # DuckDB connections are not thread-safe; cursors are
+            cursor = connection.cursor()
+        try:
+            cursor.execute(*_to_duckdb(sql, params))
+            names = [col[0] for col in cursor.description]
+            return [dict(zip(names, row, strict=True)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = self._version = self._state = None
+
+    def _open(self):
+        """Connection to (and state of) the currently published file, reopened
+        when a refresh has replaced it.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, None
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version != self._version:
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = _connect(self.path, read_only=True)
+            self._state = _read_state(self._connection)
+            self._version = version
+        return self._connection, self._state
+
+    # Writing
+
+    def refresh(self, rebuild: bool = False) -> RefreshResult:
+        """Bring the mirror up to date and publish it; the first refresh (or
+        ``rebuild``) copies all transactions.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock_file:
+            # One refresh at a time; readers are never blocked
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            published, standby = self._slots()
+            if rebuild or not os.path.exists(self.path):
+                result = self._refresh_copy(standby, source=None)
+            else:
+                result = self._refresh_standby(standby)
+            link_path = f"{self.path}.link"
+            if os.path.lexists(link_path):
+                os.unlink(link_path)
+            os.symlink(os.path.basename(standby), link_path)
+            os.replace(link_path, self.path)
+            if result.rebuilt and os.path.exists(published):
+                # Catching up with a rebuild would replay it; copy it instead
+                os.unlink(published)
+        return result
+
+    def _slots(self) -> tuple[str, str]:
+        """The published file and the other one (``<path>.0`` or ``<path>.1``)."""
+        slots = (f"{self.path}.0", f"{self.path}.1")
+        if os.path.realpath(self.path) == os.path.realpath(slots[0]):
+            return slots
+        return slots[1], slots[0]
+
+    def _refresh_standby(self, standby: str) -> RefreshResult:
+        """Refresh ``standby`` in place, or a copy of the published file if it is
+        missing or a reader still has it open.
+        """
+        if os.path.exists(standby):
+            try:
+                connection = _connect(standby, read_only=False)
+            except Exception:  # locked by a reader (duckdb.IOException, ...)
+                logger.info("Report mirror %s is still open, copying it", standby)
+            else:
+                return _refresh_file(connection, rebuild=False)
+        return self._refresh_copy(standby, source=self.path)
+
+    def _refresh_copy(self, path: str, source: str | None) -> RefreshResult:
+        """Refresh a copy of ``source`` (or a new file) and rename it to
+        ``path``; readers of the replaced file keep reading it.
+        """
+        fd, work_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".duckdb")
+        os.close(fd)
+        try:
+            if source is None:
+                os.unlink(work_path)
+            else:
+                shutil.copyfile(source, work_path)
+            result = _refresh_file(
+                _connect(work_path, read_only=False), rebuild=source is None
+            )
+            os.replace(work_path, path)
+        finally:
+            for leftover in (work_path, f"{work_path}.wal"):
+                if os.path.exists(leftover):
+                    os.unlink(leftover)
+        return result
+
+
+def _refresh_file(connection, rebuild: bool) -> RefreshResult:
+    """Bring the mirror file of ``connection`` up to date in one transaction,
+    so that a failed refresh leaves it as it was; closes the connection.
+    """
+    try:
+        state = None if rebuild else _read_state(connection)
+        connection.execute("BEGIN TRANSACTION")
+        if state is None:
+            _create_schema(connection)
+        started_at = timezone.now()
+        boundaries = {alias: get_archive_boundary(alias) for alias in shard_aliases()}
+        upserted = deleted = 0
+
+        for alias, boundary in boundaries.items():
+            if state is None or alias not in state.archive_boundaries:
+                upserted += _load(connection, CombinedTransaction.objects.using(alias))
+            else:
+                shard_upserted, shard_deleted = _catch_up(
+                    connection, alias, state, boundary
+                )
+                upserted += shard_upserted
+                deleted += shard_deleted
+
+        connection.execute("DELETE FROM mirror_state")
+        connection.executemany(
+            "INSERT INTO mirror_state VALUES (?, ?, ?)",
+            [
+                [alias, started_at.timestamp(), boundary]
+                for alias, boundary in boundaries.items()
+            ],
+        )
+        connection.execute("COMMIT")
+        connection.execute("CHECKPOINT")
+    finally:
+        connection.close()
+    return RefreshResult(rebuilt=state is None, upserted=upserted, deleted=deleted)
+
+
+def _catch_up(
+    connection, alias: str, state: MirrorState, boundary: int | None
+) -> tuple[int, int]:
+    """Apply the changes of shard ``alias`` since ``state``; returns the numbers
+    of upserted and deleted rows.
+    """
+    since = state.synced_at - timedelta(seconds=settings.CHANGE_FEED_SAFETY_LAG)
+    upserted = _load(
+        connection,
+        Transaction.objects.using(alias).filter(updated_at__gte=since),
+        replace=True,
+    )
+    if boundary != state.archive_boundaries[alias]:
+        # Rows archived since the last refresh may never have been seen in the
+        # hot table
+        upserted += _load(
+            connection, ArchivedTransaction.objects.using(alias), replace=True
+        )
+    deleted = _delete(
+        connection,
+        TransactionTombstone.objects.using(alias).filter(deleted_at__gte=since),
+    )
+    return upserted, deleted
+
+
+def _create_schema(connection) -> None:
+    columns = ", ".join(f"{name} {type_}" for name, type_ in MIRROR_COLUMNS.items())
+    connection.execute(f"DROP TABLE IF EXISTS {MIRROR_TABLE}")
+    connection.execute(f"CREATE TABLE {MIRROR_TABLE} ({columns})")
+    # Report queries over the hot table only run with filters that exclude
+    # archived years, so they can read the full mirror as well
+    connection.execute(
+        f"CREATE OR REPLACE VIEW {Transaction._meta.db_table} "
+        f"AS SELECT * FROM {MIRROR_TABLE}"
+    )
+    connection.execute(
+        "CREATE OR REPLACE TABLE mirror_state "
+        "(shard VARCHAR, synced_at DOUBLE, archive_boundary INTEGER)"
+    )
+
+
+def _read_state(connection) -> MirrorState | None:
+    try:
+        rows = connection.execute(
+            "SELECT shard, synced_at, archive_boundary FROM mirror_state"
+        ).fetchall()
+        # Files written before a column was added are rebuilt
+        connection.execute(
+            f"SELECT {', '.join(MIRROR_COLUMNS)} FROM {MIRROR_TABLE} LIMIT 0"
+        )
+    except Exception:  # an empty, outdated or foreign file
+        return None
+    if not rows:
+        return None
+    return MirrorState(
+        synced_at=datetime.fromtimestamp(min(row[1] for row in rows), tz=UTC),
+        archive_boundaries={row[0]: row[2] for row in rows},
+    )
+
+
+def _load(connection, queryset, replace: bool = False) -> int:
+    """Copy the rows of ``queryset`` into the mirror through a CSV file written
+    by PostgreSQL's ``COPY``; with ``replace`` older versions are removed.
+    """
+    sql, params = (
+        queryset.order_by()
+        .annotate(shard=Value(queryset.db))
+        .values_list(*MIRROR_COLUMNS)
+        .query.sql_with_params()
+    )
+    with tempfile.NamedTemporaryFile(suffix=".csv") as csv_file:
+        with (
+            connections[queryset.db].cursor() as cursor,
+            # Django's cursor wrapper does not pass parameters to COPY
+            cursor.cursor.copy(f"COPY ({sql}) TO STDOUT (FORMAT CSV)", params) as copy,
+        ):
+            for chunk in copy:
+                csv_file.write(chunk)
+        csv_file.flush()
+        if not csv_file.tell():
+            return 0
+
+        if replace:
+            connection.execute(
+                f"DELETE FROM {MIRROR_TABLE} USING {_CSV_SOURCE} AS changed "
+                f"WHERE {MIRROR_TABLE}.shard = changed.shard "
+                f"AND {MIRROR_TABLE}.id = changed.id",
+                [csv_file.name],
+            )
+        return connection.execute(
+            f"INSERT INTO {MIRROR_TABLE} SELECT * FROM {_CSV_SOURCE}", [csv_file.name]
+        ).fetchone()[0]
+
+
+def _delete(connection, tombstones) -> int:
+    ids = list(tombstones.values_list("transaction_id", flat=True))
+    if not ids:
+        return 0
+    return connection.execute(
+        f"DELETE FROM {MIRROR_TABLE} WHERE shard = ? AND id IN (SELECT UNNEST(?))",
+        [tombstones.db, ids],
+    ).fetchone()[0]
+
+
+_mirrors: dict[str, ReportMirror] = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_report_mirror() -> ReportMirror | None:
+    """The configured mirror, or ``None`` if there is none or ``duckdb`` is
+    not installed.
+    """
+    path = settings.REPORT_MIRROR_PATH
+    if not path:
+        return None
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        logger.warning("REPORT_MIRROR_PATH is set but duckdb is not installed")
+        return None
+    with _mirrors_lock:
+        if path not in _mirrors:
+            _mirrors[path] = ReportMirror(path)
+        return _mirrors[path]
+
+
+def get_fresh_report_mirror() -> ReportMirror | None:
+    """The configured mirror if it is within the staleness bound."""
+    mirror = get_report_mirror()
+    if mirror is None or not mirror.is_fresh(settings.REPORT_MIRROR_MAX_STALENESS):
+        return None
+    return mirror
+
+
+def refresh_report_mirror(rebuild: bool = False) -> RefreshResult | None:
+    """Refresh the configured mirror, if any; returns what was done."""
+    mirror = get_report_mirror()
+    if mirror is None:
+        return None
+    started = time.monotonic()
+    result = mirror.refresh(rebuild=rebuild)
+    logger.info(
+        "Refreshed report mirror %s in %.2fs: %s",
+        mirror.path,
+        time.monotonic() - started,
+        result,
+    )
+    return result
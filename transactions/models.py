@@ -1,4 +1,35 @@
+import uuid
+
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Cast, Upper
+
+from .dimensions import DERIVED_DIMENSIONS
+
+# ``amount`` in integer cents, generated by PostgreSQL on every write. Reports
+# sum it instead of the numeric amount: bigint sums are much cheaper.
+AMOUNT_CENTS = Cast(models.F("amount") * 100, models.BigIntegerField())
+
+
+def amount_cents_field() -> models.GeneratedField:
+    return models.GeneratedField(
+        expression=AMOUNT_CENTS,
+        output_field=models.BigIntegerField(),
+        db_persist=True,
+    )
+
+
+class TransactionQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        """Insert into the shard owning ``year`` unless ``using()`` chose a
+        database (``QuerySet.create`` does not pass the instance to routers).
+        """
+        if self._db is None and kwargs.get("year") is not None:
+            # sharding imports the models
+            from .sharding import shard_for_year
+
+            return self.using(shard_for_year(kwargs["year"])).create(**kwargs)
+        return super().create(**kwargs)
 
 
 class Transaction(models.Model):
@@ -23,10 +54,162 @@ class Transaction(models.Model):
 
     transaction_number = models.CharField(max_length=64, unique=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount_cents = amount_cents_field()
     year = models.PositiveSmallIntegerField()
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the change feed
+            models.Index(
+                fields=["updated_at", "id"], name="transaction_updated_id_idx"
+            ),
+            # Derived report dimensions
+            models.Index(
+                DERIVED_DIMENSIONS["amount_bucket"],
+                name="transaction_amount_bucket_idx",
+            ),
+            models.Index(DERIVED_DIMENSIONS["decade"], name="transaction_decade_idx"),
+            models.Index(
+                DERIVED_DIMENSIONS["transaction_number_prefix"],
+                name="transaction_number_prefix_idx",
+            ),
+            # Case-insensitive exact and prefix search; substring search uses a
+            # pg_trgm GIN index created by migration 0006 where available
+            models.Index(
+                OpClass(Upper("transaction_number"), name="text_pattern_ops"),
+                name="transaction_number_upper_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"{self.transaction_type} {self.transaction_number} ({self.year})"
+
+
+class TransactionColumns(models.Model):
+    """Columns of ``Transaction`` shared by the archive table and the combined
+    view. Rows only ever reach these through SQL, so no ``auto_now`` here.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    transaction_type = models.CharField(
+        max_length=32,
+        choices=Transaction.TransactionType.choices,
+    )
+    status = models.CharField(
+        max_length=32,
+        choices=Transaction.Status.choices,
+    )
+    transaction_number = models.CharField(max_length=64)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount_cents = amount_cents_field()
+    year = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return f"{self.transaction_type} {self.transaction_number} ({self.year})"
+
+
+class ArchivedTransaction(TransactionColumns):
+    """Transactions of old years moved out of the hot table by
+    ``manage.py archive_transactions``; they keep their ids and timestamps.
+
+    Rows are written once and never updated, so the table has no dead tuples
+    and only one index, which serves the year filters, the list ordering and
+    the lookup of the archive boundary.
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["year", "transaction_number"], name="archived_year_number_idx"
+            ),
+        ]
+
+
+class CombinedTransaction(TransactionColumns):
+    """Read-only view of hot and archived transactions (``UNION ALL``).
+
+    Queried instead of ``Transaction`` when filters reach archived years;
+    PostgreSQL pushes the filters down into both tables.
+    """
+
+    class Meta:
+        managed = False
+        db_table = "transactions_combinedtransaction"
+
+
+class TransactionTombstone(models.Model):
+    """Record of a deleted transaction, consumed by the change feed.
+
+    Rows are written by a database trigger on ``transactions_transaction``,
+    so every delete path (admin, ``load_transactions --reset``, raw SQL) is
+    captured; application code never inserts tombstones itself.
+    """
+
+    transaction_id = models.BigIntegerField()
+    transaction_number = models.CharField(max_length=64)
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deleted_at", "id"], name="tombstone_deleted_id_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"deleted {self.transaction_number} ({self.deleted_at})"
+
+
+class ReportJob(models.Model):
+    """A report computed asynchronously by the local report worker pool."""
+
+    class JobStatus(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    class JobStage(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        QUERYING = "querying", "Querying"
+        PIVOTING = "pivoting", "Pivoting"
+        SERIALIZING = "serializing", "Serializing"
+        DONE = "done", "Done"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(
+        max_length=16,
+        choices=JobStatus.choices,
+        default=JobStatus.QUEUED,
+    )
+    # Progress of the computation, recorded by the worker; failed jobs keep
+    # the stage they failed in
+    stage = models.CharField(
+        max_length=16,
+        choices=JobStage.choices,
+        default=JobStage.QUEUED,
+    )
+
+    filters = models.JSONField(default=dict)
+    report_request = models.JSONField()
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    # Refreshed by the process holding the job until it finishes
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"report job {self.id} ({self.status})"
@@ -1,6 +1,7 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from .models import Transaction
+from .models import ReportJob, Transaction
 
 
 class TransactionIngestSerializer(serializers.Serializer):
@@ -16,6 +17,16 @@ class TransactionIngestSerializer(serializers.Serializer):
 
 
 class TransactionSerializer(serializers.ModelSerializer):
+    """Serializes transactions (model instances or ``values()`` dicts).
+    Pass ``fields`` to render only a subset of the declared fields.
+    """
+
+    def __init__(self, *args, fields: list[str] | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Transaction
         fields = [
@@ -28,9 +39,94 @@ class TransactionSerializer(serializers.ModelSerializer):
         ]
 
 
+class TransactionBulkStatusSerializer(serializers.Serializer):
+    """Target status and the transactions to update: either explicit
+    ``transaction_numbers`` or ``filters`` as accepted by the list endpoint.
+    """
+
+    status = serializers.ChoiceField(choices=Transaction.Status.choices)
+    transaction_numbers = serializers.ListField(
+        child=serializers.CharField(max_length=64),
+        allow_empty=False,
+        required=False,
+    )
+    filters = serializers.DictField(
+        child=serializers.CharField(), allow_empty=False, required=False
+    )
+
+    def validate_transaction_numbers(self, value):
+        if len(value) > settings.BULK_STATUS_MAX_NUMBERS:
+            raise serializers.ValidationError(
+                f"At most {settings.BULK_STATUS_MAX_NUMBERS} transaction numbers "
+                "per request."
+            )
+        return value
+
+    def validate(self, attrs):
+        if ("transaction_numbers" in attrs) == ("filters" in attrs):
+            raise serializers.ValidationError(
+                "Provide either transaction_numbers or filters."
+            )
+        return attrs
+
+
+class TransactionBulkStatusResultSerializer(serializers.Serializer):
+    matched = serializers.IntegerField()
+    changed = serializers.IntegerField()
+
+
 class TransactionReportSerializer(serializers.Serializer):
     row_field = serializers.CharField()
     column_fields = serializers.ListField(child=serializers.CharField())
     data = serializers.ListField()
     column_totals = serializers.ListField()
     grand_total = serializers.CharField()
+    # Only present when extra metrics were requested
+    metrics = serializers.ListField(child=serializers.CharField(), required=False)
+    grand_metrics = serializers.DictField(required=False)
+    # Only present for mode=approx
+    approximation = serializers.DictField(required=False)
+    # Only present when trends were requested
+    trends = serializers.ListField(child=serializers.CharField(), required=False)
+    # Only present when rows were sorted, limited or paginated
+    row_count = serializers.IntegerField(required=False)
+    # Only present with top, when rows were left out
+    other = serializers.DictField(required=False)
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = [
+            "id",
+            "status",
+            "stage",
+            "result",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "expires_at",
+        ]
+        read_only_fields = fields
+
+
+class TransactionChangeSerializer(serializers.Serializer):
+    """One change feed event; transaction fields are absent for deletions."""
+
+    op = serializers.ChoiceField(choices=["upsert", "delete"])
+    id = serializers.IntegerField()
+    transaction_number = serializers.CharField()
+    transaction_type = serializers.CharField(required=False)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    status = serializers.CharField(required=False)
+    year = serializers.IntegerField(required=False)
+    changed_at = serializers.DateTimeField()
+    # Only present with several shards: ids are unique per shard
+    shard = serializers.CharField(required=False)
+
+
+class TransactionChangePageSerializer(serializers.Serializer):
+    results = TransactionChangeSerializer(many=True)
+    next_cursor = serializers.CharField()
+    has_more = serializers.BooleanField()
@@ -1,27 +1,260 @@
-from dataclasses import dataclass
-from decimal import Decimal
+import json
+from collections.abc import Callable, Mapping
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
 from enum import Enum
 from typing import Any
 
-from django.db.models import QuerySet, Sum
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import QuerySet
 
-from .models import Transaction
+from .archive import VIEW_COLUMNS
+from .coalescing import coalesce, get_data_version, make_key
+from .dimensions import DERIVED_DIMENSIONS
+from .filters import TransactionFilters
+from .models import ArchivedTransaction, CombinedTransaction, Transaction
+from .tracing import trace_span
 
 
-class ReportDimension(str, Enum):
+class ChoiceEnum(str, Enum):
+    @classmethod
+    def values(cls) -> list[str]:
+        return [member.value for member in cls]
+
+
+class ReportDimension(ChoiceEnum):
     TRANSACTION_TYPE = "transaction_type"
     STATUS = "status"
     YEAR = "year"
+    # Derived dimensions, computed by the expressions in ``DERIVED_DIMENSIONS``
+    AMOUNT_BUCKET = "amount_bucket"
+    DECADE = "decade"
+    TRANSACTION_NUMBER_PREFIX = "transaction_number_prefix"
 
-    @classmethod
-    def values(cls) -> list[str]:
-        return [member.value for member in cls]
+    def parse(self, raw: str) -> str | int:
+        """Value of the dimension from its query string form; raises
+        ``ValueError`` for non-integers on integer dimensions.
+        """
+        if self in (
+            ReportDimension.YEAR,
+            ReportDimension.DECADE,
+            ReportDimension.AMOUNT_BUCKET,
+        ):
+            return int(raw)
+        return raw
+
+
+class ReportMetric(ChoiceEnum):
+    COUNT = "count"
+    SUM = "sum"
+    AVG = "avg"
+    MIN = "min"
+    MAX = "max"
+    P50 = "p50"
+    P90 = "p90"
+    P99 = "p99"
+
+
+# Summed amount of a group, formatted with the quoted ``amount_cents`` column:
+# bigint sums are much cheaper than numeric ones, and scaling the sum back to
+# cents gives the same numeric value (and string) as summing the amounts.
+TOTAL_SQL = "SUM({cents}) * 0.01"
+
+# SQL aggregate for each metric, formatted with the quoted amount and
+# ``amount_cents`` columns. Everything except COUNT is rounded to the scale of
+# ``Transaction.amount`` so that metrics render the same way as ``total_amount``.
+METRIC_SQL: dict[ReportMetric, str] = {
+    ReportMetric.COUNT: "COUNT(*)",
+    ReportMetric.SUM: TOTAL_SQL,
+    ReportMetric.AVG: "ROUND(AVG({cents}) / 100, 2)",
+    ReportMetric.MIN: "MIN({amount})",
+    ReportMetric.MAX: "MAX({amount})",
+    ReportMetric.P50: (
+        "ROUND((PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {amount}))::numeric, 2)"
+    ),
+    ReportMetric.P90: (
+        "ROUND((PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY {amount}))::numeric, 2)"
+    ),
+    ReportMetric.P99: (
+        "ROUND((PERCENTILE_CONT(0.99) WITHIN GROUP (ORDER BY {amount}))::numeric, 2)"
+    ),
+}
+
+
+class ReportTrend(ChoiceEnum):
+    """Changes of ``total_amount`` along the ``year`` dimension."""
+
+    CUMULATIVE = "cumulative"
+    YOY = "yoy"
+    YOY_PCT = "yoy_pct"
+
+
+# SQL of each trend, formatted with the summed amount of the group (``total``),
+# the window over its years (``window``) and ``PREVIOUS_YEAR_SQL``
+TREND_SQL: dict[ReportTrend, str] = {
+    ReportTrend.CUMULATIVE: "SUM({total}) OVER ({window} RANGE UNBOUNDED PRECEDING)",
+    ReportTrend.YOY: "{total} - {previous}",
+    ReportTrend.YOY_PCT: "ROUND(({total} - {previous}) * 100 / NULLIF({previous}, 0), 2)",
+}
+# Sum of the same group in the previous calendar year (not merely the previous
+# row), NULL if the group has no transactions that year
+PREVIOUS_YEAR_SQL = (
+    "SUM({total}) OVER ({window} RANGE BETWEEN 1 PRECEDING AND 1 PRECEDING)"
+)
+
+# DuckDB (the report mirror) divides decimals into doubles, so averages,
+# percentiles and percentages are selected unrounded there and rounded to
+# cents by ``_round_mirror_values``.
+MIRROR_METRIC_SQL: dict[ReportMetric, str] = {
+    **METRIC_SQL,
+    ReportMetric.AVG: "AVG({cents}) / 100",
+    ReportMetric.P50: "PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {amount}::DOUBLE)",
+    ReportMetric.P90: "PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY {amount}::DOUBLE)",
+    ReportMetric.P99: "PERCENTILE_CONT(0.99) WITHIN GROUP (ORDER BY {amount}::DOUBLE)",
+}
+MIRROR_TREND_SQL: dict[ReportTrend, str] = {
+    **TREND_SQL,
+    ReportTrend.YOY_PCT: "({total} - {previous}) * 100 / NULLIF({previous}, 0)",
+}
+
+
+class ReportMode(ChoiceEnum):
+    EXACT = "exact"
+    APPROX = "approx"
+
+
+class SampleMethod(ChoiceEnum):
+    SYSTEM = "system"
+    BERNOULLI = "bernoulli"
+
+
+# Two-sided 95% normal quantile used for approximate report intervals
+CONFIDENCE_LEVEL = 0.95
+CONFIDENCE_Z = Decimal("1.96")
+CENT = Decimal("0.01")
+
+
+@dataclass(frozen=True)
+class ReportSampling:
+    """``TABLESAMPLE`` settings for approximate reports.
+
+    Estimates use the Horvitz-Thompson estimator (sample sum divided by the
+    sampling fraction). Its variance assumes rows are sampled independently,
+    which holds for BERNOULLI; SYSTEM samples whole pages, so its intervals
+    are optimistic when rows on a page are correlated.
+    """
+
+    percent: float
+    method: SampleMethod = SampleMethod.SYSTEM
+    seed: int | None = None
+
+    @property
+    def fraction(self) -> Decimal:
+        return Decimal(str(self.percent)) / 100
+
+    def tablesample_sql(self) -> str:
+        sql = f"TABLESAMPLE {self.method.value.upper()} ({float(self.percent)!r})"
+        if self.seed is not None:
+            sql += f" REPEATABLE ({int(self.seed)})"
+        return sql
+
+
+class RowSort(ChoiceEnum):
+    """What pivot rows are ordered by."""
+
+    ROW = "row"  # the row value
+    TOTAL = "total"  # the row total
+    COLUMN = "column"  # the total of one column (``ReportRowSelection.column``)
+
+
+@dataclass(frozen=True)
+class ReportRowSelection:
+    """Order of the pivot rows, and which of them a report returns: the
+    ``limit`` rows after the first ``offset``, all of them without ``limit``.
+
+    Rows are ranked in the same query as the aggregation; the rows left out
+    are aggregated into one row of their own, returned as "other" with
+    ``other``. Column totals and the grand total always cover every row.
+    """
+
+    sort: RowSort = RowSort.ROW
+    descending: bool = False
+    # Values of the column fields of the column sorted by, for RowSort.COLUMN
+    column: tuple = ()
+    limit: int | None = None
+    offset: int = 0
+    other: bool = False
+
+    @property
+    def is_limited(self) -> bool:
+        return self.limit is not None or self.offset > 0
+
+    def rank(self, keys: Mapping[Any, Any]) -> list:
+        """Row values in the order of the selection, from their sort keys:
+        ``None`` keys last, ties in row order, like ``_selected_source``.
+        """
+        values = sorted(keys)
+        if self.sort is RowSort.ROW:
+            return values[::-1] if self.descending else values
+        ranked = sorted(
+            (value for value in values if keys[value] is not None),
+            key=keys.__getitem__,
+            reverse=self.descending,
+        )
+        return ranked + [value for value in values if keys[value] is None]
+
+    def selects(self, rank: int) -> bool:
+        """Whether the row ranked ``rank`` (from 1) is returned."""
+        return rank > self.offset and (
+            self.limit is None or rank <= self.offset + self.limit
+        )
 
 
 @dataclass(frozen=True)
 class TransactionReportRequest:
     row_field: ReportDimension
     column_fields: list[ReportDimension]
+    metrics: list[ReportMetric] = field(default_factory=list)
+    sampling: ReportSampling | None = None
+    # Require ``year`` among the row and column fields
+    trends: list[ReportTrend] = field(default_factory=list)
+    rows: ReportRowSelection | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TransactionReportRequest":
+        """Inverse of ``dataclasses.asdict``, used to hand requests to report jobs."""
+        sampling = data.get("sampling")
+        rows = data.get("rows")
+        return cls(
+            row_field=ReportDimension(data["row_field"]),
+            column_fields=[ReportDimension(f) for f in data["column_fields"]],
+            metrics=[ReportMetric(m) for m in data.get("metrics", [])],
+            sampling=(
+                ReportSampling(
+                    percent=sampling["percent"],
+                    method=SampleMethod(sampling["method"]),
+                    seed=sampling.get("seed"),
+                )
+                if sampling
+                else None
+            ),
+            trends=[ReportTrend(t) for t in data.get("trends", [])],
+            rows=(
+                ReportRowSelection(
+                    sort=RowSort(rows["sort"]),
+                    descending=rows["descending"],
+                    column=tuple(rows["column"]),
+                    limit=rows["limit"],
+                    offset=rows["offset"],
+                    other=rows["other"],
+                )
+                if rows
+                else None
+            ),
+        )
 
 
 @dataclass(frozen=True)
@@ -31,6 +264,43 @@ class TransactionReportResult:
     data: list[dict]
     column_totals: list[dict]
     grand_total: str
+    metrics: list[str] = field(default_factory=list)
+    grand_metrics: dict = field(default_factory=dict)
+    # Sampling details and the grand total interval of approximate reports
+    approximation: dict | None = None
+    trends: list[str] = field(default_factory=list)
+    # Rows before the row selection, and the rows it left out aggregated
+    row_count: int | None = None
+    other: dict | None = None
+
+    def as_dict(self) -> dict:
+        """Response payload: optional sections only appear when requested."""
+        payload: dict[str, Any] = {
+            "row_field": self.row_field,
+            "column_fields": self.column_fields,
+            "data": self.data,
+            "column_totals": self.column_totals,
+            "grand_total": self.grand_total,
+        }
+        if self.metrics:
+            payload["metrics"] = self.metrics
+            payload["grand_metrics"] = self.grand_metrics
+        if self.approximation is not None:
+            payload["approximation"] = self.approximation
+        if self.trends:
+            payload["trends"] = self.trends
+        if self.row_count is not None:
+            payload["row_count"] = self.row_count
+        if self.other is not None:
+            payload["other"] = self.other
+        return payload
+
+
+def format_metric(metric: ReportMetric, value: Any) -> Any:
+    """Render a metric value for the API: counts as ints, money as strings."""
+    if metric is ReportMetric.COUNT:
+        return value or 0
+    return None if value is None else str(value)
 
 
 class TransactionReportService:
@@ -41,99 +311,625 @@ class TransactionReportService:
         cls,
         queryset: QuerySet[Transaction],
         request: TransactionReportRequest,
+        filters: TransactionFilters | None = None,
+        on_stage: Callable[[str], None] | None = None,
     ) -> TransactionReportResult:
         """Aggregates transaction amounts into a pivot-style structure:
         it groups records by the chosen row and column fields,
         calculates the summed amount for each group, and then computes row summaries,
         column summaries, and a grand total across all transactions.
+
+        Cells, row totals, column totals and the grand total all come from a
+        single ``GROUPING SETS`` query, so non-additive metrics (averages,
+        percentiles) are exact at every level and the table is scanned once.
+
+        Requested ``trends`` are computed by window functions over ``year`` in
+        the same query and added to the cells and totals grouped by year.
+
+        ``filters``, if given, must be the filters ``queryset`` was built
+        with; they let the report be answered from the columnar snapshot or
+        split across shards.
+
+        With a row selection (``request.rows``) the rows are ordered, and
+        limited to the selected ones, by that query too, so that only those
+        rows are fetched and pivoted.
+
+        The aggregation itself is run by the report engine selected for the
+        request (see ``engines``); they all return the rows of the
+        ``GROUPING SETS`` query.
+
+        ``on_stage``, if given, is called with ``"querying"`` and then
+        ``"pivoting"`` as the build goes on.
         """
         row_field = request.row_field.value
         column_fields = [field.value for field in request.column_fields]
+        metrics = list(request.metrics)
+        trends = list(request.trends)
+
+        sampling = request.sampling
+
+        # The engines build on this class' queries
+        from .engines import ReportQuery, run_report_query
+
+        query = ReportQuery(
+            queryset=queryset,
+            row_field=row_field,
+            column_fields=column_fields,
+            metrics=metrics,
+            sampling=sampling,
+            trends=trends,
+            filters=filters,
+            rows=request.rows,
+        )
+        if on_stage is not None:
+            on_stage("querying")
+        with trace_span("aggregate") as span:
+            engine, aggregates = run_report_query(query)
+            if span is not None:
+                span.attributes["engine"] = engine.name
+        if on_stage is not None:
+            on_stage("pivoting")
+        with trace_span("pivot"):
+            return cls._pivot(
+                aggregates,
+                row_field,
+                column_fields,
+                metrics,
+                sampling,
+                trends,
+                request.rows,
+            )
 
-        group_by: list[str] = [row_field, *column_fields]
-        aggregates = (
-            queryset.values(*group_by)
-            .annotate(total_amount=Sum("amount"))
-            .order_by(*group_by)
+    @classmethod
+    def _pivot(
+        cls,
+        aggregates: list[dict],
+        row_field: str,
+        column_fields: list[str],
+        metrics: list[ReportMetric],
+        sampling: ReportSampling | None,
+        trends: list[ReportTrend],
+        rows: ReportRowSelection | None = None,
+    ) -> TransactionReportResult:
+        """Arrange the grouping sets rows into the report's cells and totals.
+        With ``rows`` the rows are ordered by their rank, and the row of the
+        rows it left out (``None``) becomes the "other" row.
+        """
+        if sampling is not None:
+            aggregates = [cls._scale_sample(agg, sampling) for agg in aggregates]
+
+        # ``grouping_id`` is the GROUPING() bitmask over (row_field, *column_fields):
+        # the row bit is the most significant one, the column bits follow it.
+        columns_mask = (1 << len(column_fields)) - 1
+        row_mask = 1 << len(column_fields)
+        all_mask = row_mask | columns_mask
+        group_by = [row_field, *column_fields]
+        year_bit = (
+            1 << (len(group_by) - 1 - group_by.index(ReportDimension.YEAR.value))
+            if trends
+            else 0
         )
 
-        rows: dict[Any, dict] = {}
-        column_totals_numeric: dict[tuple, Decimal] = {}
-        grand_total_numeric: Decimal = Decimal("0")
-        for agg in aggregates:
-            amount: Decimal = agg["total_amount"] or Decimal("0")
+        def trends_of(agg: dict) -> list[ReportTrend]:
+            # Only levels grouped by year (its GROUPING() bit unset) have trends
+            return [] if agg["grouping_id"] & year_bit else trends
 
-            # Row handling
+        pivot_rows: dict[Any, dict] = {}
+        row_totals: dict[Any, dict] = {}
+        column_totals: dict[tuple, dict] = {}
+        # Column totals keep the order in which columns are first seen in cells;
+        # with a row selection, the order of the columns (the same on every
+        # page of rows)
+        column_order: dict[tuple, None] = {}
+        grand: dict = {}
+        for agg in aggregates:
+            grouping_id = agg["grouping_id"]
             row_value = agg[row_field]
-            if row_value not in rows:
-                rows[row_value] = {
-                    "row_key": {row_field: row_value},
-                    "cells_by_col_key": {},
-                    "row_total_numeric": Decimal("0"),
-                }
-            row_entry = rows[row_value]
-            row_entry["row_total_numeric"] += amount
+            column_key_tuple = tuple(agg[field] for field in column_fields)
 
-            # Column / cell handling
-            column_key_tuple = (
-                tuple(agg[field] for field in column_fields) if column_fields else ()
-            )
-            cells_by_col_key = row_entry["cells_by_col_key"]
-            if column_key_tuple not in cells_by_col_key:
-                column_key = (
-                    {field: agg[field] for field in column_fields}
-                    if column_fields
-                    else {}
+            if grouping_id == 0:
+                row_entry = pivot_rows.setdefault(
+                    row_value, {"row_key": {row_field: row_value}, "cells": []}
                 )
-                cells_by_col_key[column_key_tuple] = {
-                    "column_key": column_key,
-                    "total_amount_numeric": Decimal("0"),
-                }
-            cells_by_col_key[column_key_tuple]["total_amount_numeric"] += amount
+                row_entry["cells"].append(
+                    {
+                        "column_key": dict(
+                            zip(column_fields, column_key_tuple, strict=True)
+                        ),
+                        **cls._totals_of(agg, metrics, trends_of(agg)),
+                    }
+                )
+                column_order.setdefault(column_key_tuple)
+            if grouping_id == columns_mask:
+                row_totals[row_value] = agg
+            if grouping_id == row_mask:
+                column_totals[column_key_tuple] = agg
+            if grouping_id == all_mask:
+                grand = agg
 
-            # Column totals
-            column_totals_numeric[column_key_tuple] = (
-                column_totals_numeric.get(column_key_tuple, Decimal("0")) + amount
-            )
+        data_rows: list[dict] = [
+            {
+                **row_entry,
+                **cls._totals_of(
+                    row_totals[row_value],
+                    metrics,
+                    trends_of(row_totals[row_value]),
+                    total_key="row_total",
+                    metrics_key="row_metrics",
+                    trends_key="row_trends",
+                ),
+            }
+            for row_value, row_entry in pivot_rows.items()
+        ]
+        column_totals_list: list[dict] = [
+            {
+                "column_key": dict(zip(column_fields, column_key_tuple, strict=True)),
+                **cls._totals_of(
+                    column_totals[column_key_tuple],
+                    metrics,
+                    trends_of(column_totals[column_key_tuple]),
+                ),
+            }
+            for column_key_tuple in (column_order if rows is None else column_totals)
+        ]
+        grand_totals = cls._totals_of(grand, metrics)
 
-            # Grand total
-            grand_total_numeric += amount
+        other = None
+        if rows is not None:
+            data_rows, other = cls._rank_rows(data_rows, row_totals, row_field)
 
-        data_rows: list[dict] = []
-        for row_entry in rows.values():
-            cells: list[dict] = [
-                {
-                    "column_key": cell["column_key"],
-                    "total_amount": str(cell["total_amount_numeric"]),
-                }
-                for cell in row_entry["cells_by_col_key"].values()
-            ]
-            data_rows.append(
+        return TransactionReportResult(
+            row_field=row_field,
+            column_fields=column_fields,
+            data=data_rows,
+            column_totals=column_totals_list,
+            grand_total=grand_totals["total_amount"],
+            metrics=[metric.value for metric in metrics],
+            grand_metrics=grand_totals.get("metrics", {}),
+            approximation=(
                 {
-                    "row_key": row_entry["row_key"],
-                    "cells": cells,
-                    "row_total": str(row_entry["row_total_numeric"]),
+                    "method": sampling.method.value,
+                    "sample_percent": sampling.percent,
+                    "confidence_level": CONFIDENCE_LEVEL,
+                    "sample_count": grand.get("sample_count", 0),
+                    "grand_total_ci": grand_totals.get(
+                        "total_amount_ci", ["0.00", "0.00"]
+                    ),
                 }
+                if sampling is not None
+                else None
+            ),
+            trends=[trend.value for trend in trends],
+            row_count=None if rows is None else grand.get("row_count", 0),
+            other=other if rows is not None and rows.other else None,
+        )
+
+    @classmethod
+    def _rank_rows(
+        cls, data_rows: list[dict], row_totals: dict[Any, dict], row_field: str
+    ) -> tuple[list[dict], dict | None]:
+        """The rows of a row selection in rank order, and the unranked row of
+        the rows it left out (``None``), if any.
+        """
+        selected, other = [], None
+        for row in data_rows:
+            if row["row_key"][row_field] is None:
+                other = row
+            else:
+                selected.append(row)
+        selected.sort(key=lambda row: row_totals[row["row_key"][row_field]]["row_rank"])
+        return selected, other
+
+    @classmethod
+    def build_report_coalesced(
+        cls,
+        queryset: QuerySet[Transaction],
+        request: TransactionReportRequest,
+        filters: TransactionFilters | None = None,
+        admission: Callable[[], AbstractContextManager] = nullcontext,
+    ) -> TransactionReportResult:
+        """``build_report`` behind single-flight coalescing: concurrent calls with
+        the same filtered query, report request and data version share one
+        computation (and its exception). Raises ``CoalescingTimeout`` if the
+        in-flight computation does not finish within ``REPORT_COALESCING_TIMEOUT``.
+
+        The computation runs in the context returned by ``admission`` (e.g. a
+        concurrency limiter slot), which only the caller computing it enters.
+        """
+
+        def compute() -> TransactionReportResult:
+            with admission():
+                return cls.build_report(queryset, request, filters)
+
+        if not settings.REPORT_COALESCING_ENABLED:
+            return compute()
+
+        return coalesce(
+            cls.fingerprint(queryset, request),
+            compute,
+            timeout=settings.REPORT_COALESCING_TIMEOUT,
+            directory=settings.REPORT_COALESCING_DIR,
+        )
+
+    @classmethod
+    def fingerprint(
+        cls,
+        queryset: QuerySet[Transaction],
+        request: TransactionReportRequest,
+    ) -> str:
+        """Identify a report by its filtered SQL, request and the data version."""
+        try:
+            source = queryset.order_by().query.sql_with_params()
+        except EmptyResultSet:
+            source = None
+        return make_key(queryset.db, source, request, get_data_version())
+
+    @classmethod
+    def _totals_of(
+        cls,
+        agg: dict,
+        metrics: list[ReportMetric],
+        trends: list[ReportTrend] | None = None,
+        total_key: str = "total_amount",
+        metrics_key: str = "metrics",
+        trends_key: str = "trends",
+    ) -> dict[str, Any]:
+        """Render the summed amount (and requested metrics and trends) of one
+        aggregate row.
+        """
+        total_amount = agg.get("total_amount")
+        totals: dict[str, Any] = {
+            total_key: str(Decimal("0") if total_amount is None else total_amount)
+        }
+        if "total_amount_ci" in agg:
+            totals[f"{total_key}_ci"] = agg["total_amount_ci"]
+        if metrics:
+            totals[metrics_key] = cls._metrics_of(agg, metrics)
+        if trends:
+            totals[trends_key] = {
+                trend.value: (
+                    None
+                    if (value := agg[f"trend_{trend.value}"]) is None
+                    else str(value)
+                )
+                for trend in trends
+            }
+        return totals
+
+    @classmethod
+    def _scale_sample(cls, agg: dict, sampling: ReportSampling) -> dict:
+        """Scale one sampled aggregate row up to population estimates.
+
+        Sums and counts are divided by the sampling fraction ``p``; the variance
+        of the scaled sum is estimated as ``(1 - p) / p**2 * sum(amount**2)``.
+        Averages, extremes and percentiles are reported as observed in the sample.
+        """
+        p = sampling.fraction
+        sample_sum = agg["total_amount"] or Decimal("0")
+        sum_squares = agg["sum_squares"] or Decimal("0")
+        estimate = (sample_sum / p).quantize(CENT)
+        margin = (CONFIDENCE_Z * ((1 - p) * sum_squares).sqrt() / p).quantize(CENT)
+
+        scaled = {
+            **agg,
+            "total_amount": estimate,
+            "total_amount_ci": [str(estimate - margin), str(estimate + margin)],
+        }
+        if scaled.get("metric_sum") is not None:
+            scaled["metric_sum"] = estimate
+        if "metric_count" in scaled:
+            scaled["metric_count"] = round(agg["sample_count"] / p)
+        # Running totals and differences scale like sums; percentages don't
+        for name in ("trend_cumulative", "trend_yoy"):
+            if scaled.get(name) is not None:
+                scaled[name] = (scaled[name] / p).quantize(CENT)
+        return scaled
+
+    @classmethod
+    def _metrics_of(cls, agg: dict, metrics: list[ReportMetric]) -> dict[str, Any]:
+        return {
+            metric.value: format_metric(metric, agg.get(f"metric_{metric.value}"))
+            for metric in metrics
+        }
+
+    @classmethod
+    def estimate_cost(
+        cls,
+        queryset: QuerySet[Transaction],
+        request: TransactionReportRequest,
+    ) -> float:
+        """Planner's estimated total cost of the report query (``EXPLAIN``)."""
+        query = cls._grouping_sets_query(
+            queryset,
+            request.row_field.value,
+            [field.value for field in request.column_fields],
+            list(request.metrics),
+            request.sampling,
+            list(request.trends),
+            rows=request.rows,
+        )
+        if query is None:
+            return 0.0
+        sql, params = query
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return float(plan[0]["Plan"]["Total Cost"])
+
+    @classmethod
+    def _fetch_rows(cls, using: str, query: tuple[str, tuple]) -> list[dict]:
+        with connections[using].cursor() as cursor:
+            cursor.execute(*query)
+            names = [col[0] for col in cursor.description]
+            return [dict(zip(names, row, strict=True)) for row in cursor.fetchall()]
+
+    @classmethod
+    def _sampled_table(cls, model, sampling: ReportSampling, quote) -> str:
+        """``FROM`` item reading ``model``'s table through ``TABLESAMPLE``.
+        Views cannot be sampled, so the combined view is rebuilt from its
+        sampled tables.
+        """
+        table = quote(model._meta.db_table)
+        if model is not CombinedTransaction:
+            return f"{table} {sampling.tablesample_sql()}"
+        columns = ", ".join(quote(column) for column in VIEW_COLUMNS)
+        union = " UNION ALL ".join(
+            f"SELECT {columns} FROM {quote(part._meta.db_table)} "
+            f"{sampling.tablesample_sql()}"
+            for part in (Transaction, ArchivedTransaction)
+        )
+        return f"({union}) AS {table}"
+
+    @classmethod
+    def _round_mirror_values(cls, agg: dict) -> dict:
+        """Round the mirror's floating point metrics to cents, half away from
+        zero like PostgreSQL's ``ROUND``, from their 15 significant digits like
+        PostgreSQL's conversion of ``PERCENTILE_CONT`` to ``numeric`` (so that
+        e.g. 523.4649999999999 is 523.465, not 523.46).
+        """
+        return {
+            key: (
+                Decimal(f"{value:.15g}").quantize(CENT, ROUND_HALF_UP)
+                if isinstance(value, float)
+                else value
             )
+            for key, value in agg.items()
+        }
 
-        column_totals_list: list[dict] = []
-        for col_key_tuple, total in column_totals_numeric.items():
-            column_key = (
-                {column_fields[i]: col_key_tuple[i] for i in range(len(column_fields))}
-                if column_fields
-                else {}
+    @classmethod
+    def _report_source(
+        cls,
+        queryset: QuerySet[Transaction],
+        group_by: list[str],
+        sampling: ReportSampling | None = None,
+    ) -> tuple[str, tuple] | None:
+        """SQL selecting the ``group_by`` dimensions and the amount (also in
+        cents) of the transactions in ``queryset`` (read through ``TABLESAMPLE`` with
+        ``sampling``), or ``None`` if the filters can match nothing.
+        """
+        derived = {
+            field: DERIVED_DIMENSIONS[field]
+            for field in group_by
+            if field in DERIVED_DIMENSIONS
+        }
+        try:
+            source_sql, source_params = (
+                queryset.order_by()
+                .annotate(**derived)
+                .values(*group_by, "amount", "amount_cents")
+                .query.sql_with_params()
             )
-            column_totals_list.append(
-                {
-                    "column_key": column_key,
-                    "total_amount": str(total),
-                }
+        except EmptyResultSet:
+            return None
+
+        if sampling is not None:
+            quote = connections[queryset.db].ops.quote_name
+            table = quote(queryset.model._meta.db_table)
+            source_sql = source_sql.replace(
+                f"FROM {table}",
+                f"FROM {cls._sampled_table(queryset.model, sampling, quote)}",
+                1,
             )
+        return source_sql, source_params
 
-        return TransactionReportResult(
-            row_field=row_field,
-            column_fields=column_fields,
-            data=data_rows,
-            column_totals=column_totals_list,
-            grand_total=str(grand_total_numeric),
+    @classmethod
+    def _partial_query(
+        cls,
+        queryset: QuerySet[Transaction],
+        group_by: list[str],
+        sampling: ReportSampling | None = None,
+        with_amounts: bool = False,
+    ) -> tuple[str, tuple] | None:
+        """SQL aggregating ``queryset`` into the mergeable partial aggregates
+        of its finest groups (see ``aggregation.GroupStats``), or ``None`` if
+        the filters can match nothing. ``with_amounts`` also selects the sorted
+        amounts of each group, for percentiles. Sums, extremes and amounts are
+        in cents.
+        """
+        source = cls._report_source(queryset, group_by, sampling)
+        if source is None:
+            return None
+        source_sql, source_params = source
+
+        quote = connections[queryset.db].ops.quote_name
+        amount = quote("amount")
+        cents = quote("amount_cents")
+        group_cols = ", ".join(quote(field) for field in group_by)
+        select = [
+            group_cols,
+            f"SUM({cents}) AS {quote('total')}",
+            f"COUNT(*) AS {quote('count')}",
+            f"MIN({cents}) AS {quote('minimum')}",
+            f"MAX({cents}) AS {quote('maximum')}",
+        ]
+        if sampling is not None:
+            # Squared cents can overflow bigint
+            select.append(f"SUM({amount} * {amount}) AS {quote('sum_squares')}")
+        if with_amounts:
+            select.append(f"ARRAY_AGG({cents} ORDER BY {cents}) AS {quote('amounts')}")
+        sql = (
+            f"SELECT {', '.join(select)} "
+            f"FROM ({source_sql}) AS {quote('report_source')} "
+            f"GROUP BY {group_cols}"
+        )
+        return sql, source_params
+
+    @classmethod
+    def _grouping_sets_query(
+        cls,
+        queryset: QuerySet[Transaction],
+        row_field: str,
+        column_fields: list[str],
+        metrics: list[ReportMetric],
+        sampling: ReportSampling | None = None,
+        trends: list[ReportTrend] | None = None,
+        metric_sql: Mapping[ReportMetric, str] = METRIC_SQL,
+        trend_sql: Mapping[ReportTrend, str] = TREND_SQL,
+        rows: ReportRowSelection | None = None,
+    ) -> tuple[str, tuple] | None:
+        """SQL running the filtered queryset as a subquery and aggregating it over
+        ``GROUPING SETS ((row, *columns), (row), (columns), ())``, or ``None``
+        if the filters can match nothing.
+        With ``sampling`` the transactions table is read through ``TABLESAMPLE``
+        and the raw moments needed for error bounds are selected as well.
+        With ``trends`` the per-group sums are also windowed over ``year``.
+        With ``rows`` the rows are ranked first (see ``_selected_source``), and
+        the rank of each row (``row_rank``, ``NULL`` for the other rows and
+        levels not grouped by row) and the number of rows are selected too.
+        ``metric_sql`` and ``trend_sql`` select the SQL dialect of the aggregates.
+        """
+        group_by = [row_field, *column_fields]
+        source = cls._report_source(queryset, group_by, sampling)
+        if source is None:
+            return None
+        quote = connections[queryset.db].ops.quote_name
+        if rows is not None:
+            source = cls._selected_source(source, row_field, column_fields, rows, quote)
+        source_sql, source_params = source
+
+        amount = quote("amount")
+        cents = quote("amount_cents")
+        group_cols = ", ".join(quote(field) for field in group_by)
+        column_cols = ", ".join(quote(field) for field in column_fields)
+        grouping_sets = [f"({group_cols})", "()"]
+        if column_fields:
+            grouping_sets[1:1] = [f"({quote(row_field)})", f"({column_cols})"]
+
+        select = [
+            group_cols,
+            f"GROUPING({group_cols}) AS {quote('grouping_id')}",
+            f"{TOTAL_SQL.format(cents=cents)} AS {quote('total_amount')}",
+            *(
+                f"{metric_sql[metric].format(amount=amount, cents=cents)} "
+                f"AS {quote('metric_' + metric.value)}"
+                for metric in metrics
+            ),
+        ]
+        if sampling is not None:
+            select += [
+                f"SUM({amount} * {amount}) AS {quote('sum_squares')}",
+                f"COUNT(*) AS {quote('sample_count')}",
+            ]
+        if rows is not None:
+            select += [
+                f"CASE WHEN GROUPING({quote(row_field)}) = 0 "
+                f"THEN MIN({quote('row_rank')}) END AS {quote('row_rank')}",
+                f"COALESCE(MAX({quote('row_count')}), 0) AS {quote('row_count')}",
+            ]
+        window = ""
+        if trends:
+            select += cls._trend_columns(trends, quote, trend_sql)
+            window = f"WINDOW {cls._trend_window(group_by, quote)} "
+        sql = (
+            f"SELECT {', '.join(select)} "
+            f"FROM ({source_sql}) AS {quote('report_source')} "
+            f"GROUP BY GROUPING SETS ({', '.join(grouping_sets)}) "
+            f"{window}"
+            f"ORDER BY {group_cols}"
+        )
+        return sql, source_params
+
+    @classmethod
+    def _selected_source(
+        cls,
+        source: tuple[str, tuple],
+        row_field: str,
+        column_fields: list[str],
+        rows: ReportRowSelection,
+        quote,
+    ) -> tuple[str, tuple]:
+        """``source`` (see ``_report_source``) with its rows ranked by
+        ``rows``: the row value of the rows it leaves out is ``NULL``, and the
+        rank of the selected rows (``row_rank``) and the number of rows
+        (``row_count``) are added. Dimension values are never ``NULL``, so
+        the rows left out are aggregated apart.
+        """
+        source_sql, source_params = source
+        row = quote(row_field)
+        rank = quote("row_rank")
+        direction = "DESC" if rows.descending else "ASC"
+        order_params: list = []
+        if rows.sort is RowSort.ROW:
+            order = f"{row} {direction}"
+        else:
+            key = f"SUM({quote('amount_cents')})"
+            if rows.sort is RowSort.COLUMN:
+                conditions = " AND ".join(f"{quote(f)} = %s" for f in column_fields)
+                key += f" FILTER (WHERE {conditions})"
+                order_params = list(rows.column)
+            # Ties in row order; rows without the column sorted by come last
+            order = f"{key} {direction} NULLS LAST, {row}"
+
+        bounds = []
+        if rows.offset:
+            bounds.append(f"{rank} > {int(rows.offset)}")
+        if rows.limit is not None:
+            bounds.append(f"{rank} <= {int(rows.offset) + int(rows.limit)}")
+        selected = " AND ".join(bounds) or "TRUE"
+        columns = "".join(f", {quote(field)}" for field in column_fields)
+        sql = (
+            f"WITH {quote('pivot_source')} AS ({source_sql}), "
+            f"{quote('pivot_rows')} AS ("
+            f"SELECT {row}, ROW_NUMBER() OVER (ORDER BY {order}) AS {rank}, "
+            f"COUNT(*) OVER () AS {quote('row_count')} "
+            f"FROM {quote('pivot_source')} GROUP BY {row}) "
+            f"SELECT CASE WHEN {selected} THEN {row} END AS {row}{columns}, "
+            f"{quote('amount')}, {quote('amount_cents')}, "
+            f"CASE WHEN {selected} THEN {rank} END AS {rank}, "
+            f"{quote('row_count')} "
+            f"FROM {quote('pivot_source')} JOIN {quote('pivot_rows')} USING ({row})"
         )
+        return sql, (*source_params, *order_params)
+
+    @classmethod
+    def _trend_window(cls, group_by: list[str], quote) -> str:
+        """Window over the years of one group: the other dimensions at the same
+        grouping level. GROUPING() keeps cells and totals in separate partitions.
+        """
+        year = ReportDimension.YEAR.value
+        partition = [
+            f"GROUPING({', '.join(quote(field) for field in group_by)})",
+            *(quote(field) for field in group_by if field != year),
+        ]
+        return (
+            f"{quote('trend')} AS "
+            f"(PARTITION BY {', '.join(partition)} ORDER BY {quote(year)})"
+        )
+
+    @classmethod
+    def _trend_columns(
+        cls,
+        trends: list[ReportTrend],
+        quote,
+        trend_sql: Mapping[ReportTrend, str] = TREND_SQL,
+    ) -> list[str]:
+        total = TOTAL_SQL.format(cents=quote("amount_cents"))
+        window = quote("trend")
+        previous = PREVIOUS_YEAR_SQL.format(total=total, window=window)
+        return [
+            f"{trend_sql[trend].format(total=total, window=window, previous=previous)} "
+            f"AS {quote('trend_' + trend.value)}"
+            for trend in trends
+        ]
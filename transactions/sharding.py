@@ -0,0 +1,241 @@
+"""Year-range sharding of transactions over several databases.
+
+``TRANSACTION_SHARDS`` gives each database alias a contiguous range of years;
+together the ranges cover every year. A transaction (hot or archived) lives
+in the database owning its year, every other model stays in ``default``, and
+every shard has the full schema (``migrate --database <alias>``). Without
+``TRANSACTION_SHARDS`` the default database owns all years.
+
+Django routers only see models and instances, so reads are routed by the
+callers that know the filters:
+
+- ``TransactionShardRouter`` routes saves, deletes and reloads of single
+  transactions by their year;
+- ``shard_querysets`` turns a filtered query into one query per shard whose
+  years the filters can match;
+- reports aggregate on each of those shards and merge the partial aggregates
+  (``TransactionReportService``), lists page through ``ShardedResults``.
+
+Ids and transaction numbers are unique per shard. The change feed merges the
+changes of every shard (``changefeed``); the admin reads the default database.
+"""
+
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+
+from .archive import with_archive
+from .filters import TransactionFilters
+from .models import ArchivedTransaction, CombinedTransaction, Transaction
+
+# Models whose rows are spread over the shards
+SHARDED_MODELS = (Transaction, ArchivedTransaction, CombinedTransaction)
+
+# "alias:2020-2024", with either bound left out for an open range
+_SHARD_RE = re.compile(r"^(?P<alias>[\w-]+):(?P<first>\d*)-(?P<last>\d*)$")
+
+
+@dataclass(frozen=True)
+class Shard:
+    alias: str
+    # Bounds of the owned years, inclusive; ``None`` is unbounded
+    first_year: int | None
+    last_year: int | None
+
+    def owns(self, year: int) -> bool:
+        return (self.first_year is None or year >= self.first_year) and (
+            self.last_year is None or year <= self.last_year
+        )
+
+    def may_match(self, filters: TransactionFilters) -> bool:
+        """Whether ``filters`` can match a year of this shard."""
+        if (
+            filters.year_min is not None
+            and self.last_year is not None
+            and self.last_year < filters.year_min
+        ):
+            return False
+        if (
+            filters.year_max is not None
+            and self.first_year is not None
+            and self.first_year > filters.year_max
+        ):
+            return False
+        year = filters.year
+        if year is None:
+            return True
+        if not year.negate:
+            return any(self.owns(value) for value in year.values)
+        # Excluding every owned year leaves nothing
+        return (
+            self.first_year is None
+            or self.last_year is None
+            or not set(range(self.first_year, self.last_year + 1)) <= set(year.values)
+        )
+
+
+@lru_cache
+def _parse_shards(entries: tuple[str, ...]) -> tuple[Shard, ...]:
+    shards = []
+    for entry in entries:
+        match = _SHARD_RE.match(entry.strip())
+        if match is None:
+            raise ImproperlyConfigured(
+                f"Invalid TRANSACTION_SHARDS entry '{entry}'. "
+                "Expected 'alias:first_year-last_year', e.g. 'recent:2020-'."
+            )
+        alias = match["alias"]
+        if alias not in settings.DATABASES:
+            raise ImproperlyConfigured(
+                f"TRANSACTION_SHARDS refers to unknown database '{alias}'."
+            )
+        shards.append(
+            Shard(
+                alias=alias,
+                first_year=int(match["first"]) if match["first"] else None,
+                last_year=int(match["last"]) if match["last"] else None,
+            )
+        )
+
+    shards.sort(key=lambda shard: -1 if shard.first_year is None else shard.first_year)
+    contiguous = all(
+        current.last_year is not None
+        and following.first_year is not None
+        and following.first_year == current.last_year + 1
+        for current, following in zip(shards, shards[1:], strict=False)
+    )
+    if not (
+        contiguous and shards[0].first_year is None and shards[-1].last_year is None
+    ):
+        raise ImproperlyConfigured(
+            "TRANSACTION_SHARDS must cover every year exactly once, "
+            "e.g. 'default:-2019,recent:2020-'."
+        )
+    if len({shard.alias for shard in shards}) != len(shards):
+        raise ImproperlyConfigured("TRANSACTION_SHARDS lists a database twice.")
+    return tuple(shards)
+
+
+def get_shards() -> tuple[Shard, ...]:
+    """The configured shards, oldest years first."""
+    if not settings.TRANSACTION_SHARDS:
+        return (Shard(DEFAULT_DB_ALIAS, None, None),)
+    return _parse_shards(tuple(settings.TRANSACTION_SHARDS))
+
+
+def shard_aliases() -> list[str]:
+    return [shard.alias for shard in get_shards()]
+
+
+def is_sharded() -> bool:
+    return len(get_shards()) > 1
+
+
+def shard_for_year(year: int) -> str:
+    """Alias of the database owning ``year``."""
+    return next(shard.alias for shard in get_shards() if shard.owns(year))
+
+
+def shards_for_filters(filters: TransactionFilters) -> list[Shard]:
+    """Shards whose years ``filters`` can match, newest years first."""
+    return [shard for shard in reversed(get_shards()) if shard.may_match(filters)]
+
+
+def shard_querysets(
+    queryset: QuerySet, filters: TransactionFilters, include_archive: bool = True
+) -> list[QuerySet]:
+    """``queryset`` filtered by ``filters`` on every shard they can match,
+    newest years first. ``queryset`` must be unfiltered (see ``with_archive``).
+    """
+    # Filters matching no shard match nothing; query one shard for the answer
+    shards = shards_for_filters(filters) or [get_shards()[-1]]
+    querysets = []
+    for shard in shards:
+        shard_queryset = queryset.using(shard.alias)
+        if include_archive:
+            shard_queryset = with_archive(shard_queryset, filters)
+        querysets.append(filters.apply(shard_queryset))
+    return querysets
+
+
+class ShardedResults:
+    """Read-only sequence over the results of per-shard querysets, for
+    ``Paginator``.
+
+    The querysets come from ``shard_querysets`` and are each ordered by
+    ``(-year, transaction_number)``. Shards own disjoint year ranges and are
+    listed newest first, so concatenating their results is the merge in that
+    order, and a page only reads the shards (and rows) it spans.
+    """
+
+    ordered = True
+
+    def __init__(self, querysets: list[QuerySet]) -> None:
+        self.querysets = querysets
+        self._counts: list[int] | None = None
+
+    def count(self) -> int:
+        return sum(self._shard_counts())
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __iter__(self) -> Iterator:
+        for queryset in self.querysets:
+            yield from queryset
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            rows = self[index : index + 1]
+            if not rows:
+                raise IndexError(index)
+            return rows[0]
+        start, stop, step = index.indices(self.count())
+        if step != 1:
+            raise ValueError("ShardedResults does not support slice steps.")
+
+        rows: list = []
+        offset = 0
+        for queryset, count in zip(self.querysets, self._shard_counts(), strict=True):
+            if start < offset + count and stop > offset:
+                rows.extend(
+                    queryset[max(start - offset, 0) : min(stop - offset, count)]
+                )
+            offset += count
+            if offset >= stop:
+                break
+        return rows
+
+    def _shard_counts(self) -> list[int]:
+        if self._counts is None:
+            self._counts = [queryset.count() for queryset in self.querysets]
+        return self._counts
+
+
+class TransactionShardRouter:
+    """Routes single transactions to the shard owning their year. Queries
+    without an instance go to ``default`` unless they chose a database.
+    """
+
+    def db_for_read(self, model, **hints) -> str | None:
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints) -> str | None:
+        return self._route(model, hints)
+
+    def _route(self, model, hints) -> str | None:
+        instance = hints.get("instance")
+        if (
+            model not in SHARDED_MODELS
+            or instance is None
+            or instance._state.db is not None  # loaded rows stay where they are
+            or instance.year is None
+        ):
+            return None
+        return shard_for_year(instance.year)
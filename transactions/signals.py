@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .coalescing import bump_data_version
+from .models import Transaction
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, using, **kwargs) -> None:
+    """Invalidate in-flight report keys after single-row writes.
+
+    Bulk write paths (``bulk_create``, queryset ``update``/``delete``) do not
+    send signals and call ``bump_data_version`` themselves. There is
+    deliberately no ``post_delete`` receiver: it would disable Django's fast
+    queryset deletes for the whole table.
+    """
+    bump_data_version(using)
@@ -0,0 +1,478 @@
+"""Memory-mapped columnar snapshot of transactions for in-process reports.
+
+``build_report_snapshot`` dumps the report dimensions of all transactions (hot
+and archived) into one file on local disk as fixed-width columns: string
+dimensions as codes into per-column dictionaries, years, decades and amount
+buckets as integers, and amounts as integer cents. The file is written next to
+the published one, carries an increasing version and is renamed over it.
+
+Every worker process maps the published file read-only and reads its columns
+through ``memoryview``s, so the data is never copied into the workers: they
+all share one copy in the page cache. ``ReportSnapshot.aggregate`` filters and
+groups the mapped columns with numpy, ``CHUNK_ROWS`` rows at a time so that its
+working memory stays bounded, merges the per-group aggregates of the chunks
+(keeping the amounts themselves only for percentiles) and renders the report
+rows with ``aggregation``. ``numpy`` is not a project dependency: without it
+snapshots are still built, but reports do not use them.
+"""
+
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from decimal import ROUND_CEILING, ROUND_FLOOR
+from functools import cached_property
+from itertools import chain
+
+from django.conf import settings
+from django.utils import timezone
+
+from .aggregation import PERCENTILES, GroupStats, grouping_set_rows
+from .filters import TransactionFilters
+from .models import CombinedTransaction
+from .services import ReportRowSelection
+from .sharding import shard_aliases
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TXSNAP1\n"
+# Magic, header size (little-endian uint64), JSON header, then the columns,
+# each starting at a multiple of ALIGNMENT bytes in native byte order
+ALIGNMENT = 8
+
+# String dimensions, stored as codes into a dictionary of their values
+CODED_COLUMNS = ("transaction_type", "status", "transaction_number_prefix")
+# Integer dimensions with their ``array`` typecodes
+INTEGER_COLUMNS = {"year": "H", "decade": "H", "amount_bucket": "q"}
+AMOUNT_COLUMN = "amount_cents"
+# Columns the filters read
+FILTER_COLUMNS = ("transaction_type", "status", "year", AMOUNT_COLUMN)
+# Rows aggregated per vectorized pass, which bounds the working memory
+CHUNK_ROWS = 1 << 16
+
+
+class SnapshotError(Exception):
+    """Raised for files that are not snapshots readable on this host."""
+
+
+@dataclass(frozen=True)
+class SnapshotBuildResult:
+    version: int
+    rows: int
+
+
+class ReportSnapshot:
+    """A published snapshot file, mapped read-only."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            # The mapping stays valid after the file is closed or replaced
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if view[: len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{path} is not a report snapshot")
+        (header_size,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(bytes(view[header_start : header_start + header_size]))
+        if header["byteorder"] != sys.byteorder:
+            raise SnapshotError(f"{path} was written with another byte order")
+
+        self.version: int = header["version"]
+        self.built_at = datetime.fromtimestamp(header["built_at"], tz=UTC)
+        self.rows: int = header["rows"]
+        data_start = _align(header_start + header_size)
+        self._columns: dict[str, memoryview] = {}
+        self._dictionaries: dict[str, list[str]] = {}
+        for name, column in header["columns"].items():
+            start = data_start + column["offset"]
+            size = self.rows * array(column["typecode"]).itemsize
+            self._columns[name] = view[start : start + size].cast(column["typecode"])
+            if column["dictionary"] is not None:
+                self._dictionaries[name] = column["dictionary"]
+
+    @cached_property
+    def _arrays(self):
+        """The columns as numpy arrays over the mapping, without copies."""
+        import numpy as np
+
+        arrays = {}
+        for name, column in self._columns.items():
+            values = np.asarray(column)
+            # As sized types (``q`` is not ``int64``), which numpy is fastest on
+            arrays[name] = values.view(values.dtype.str)
+        return arrays
+
+    def aggregate(
+        self,
+        filters: TransactionFilters,
+        row_field: str,
+        column_fields: list[str],
+        metrics: list[str],
+        trends: list[str],
+        rows: ReportRowSelection | None = None,
+    ) -> list[dict]:
+        """Rows of the report's grouping sets query (see
+        ``TransactionReportService._grouping_sets_query``) over the snapshot,
+        with the same keys, types and order. ``metrics`` and ``trends`` are
+        ``ReportMetric`` and ``ReportTrend`` values.
+        """
+        group_by = [row_field, *column_fields]
+        with_runs = any(metric in PERCENTILES for metric in metrics)
+        groups: dict[tuple, GroupStats] = {}
+        for start in range(0, self.rows, CHUNK_ROWS):
+            chunk = slice(start, start + CHUNK_ROWS)
+            for key, stats in self._group(filters, group_by, chunk, with_runs):
+                if key in groups:
+                    groups[key].merge(stats)
+                else:
+                    groups[key] = stats
+        return grouping_set_rows(
+            groups, group_by, metrics, trends, self._decode, rows=rows
+        )
+
+    def _group(
+        self,
+        filters: TransactionFilters,
+        group_by: list[str],
+        chunk: slice,
+        with_runs: bool,
+    ) -> Iterator[tuple[tuple, GroupStats]]:
+        """Keys and stats of the groups of the ``chunk`` rows matching
+        ``filters``, with the sorted amounts of each group if ``with_runs``.
+        """
+        import numpy as np
+
+        columns = {
+            name: self._arrays[name][chunk] for name in {*group_by, *FILTER_COLUMNS}
+        }
+        mask = self._select(filters, columns)
+        if mask is not None:
+            columns = {name: values[mask] for name, values in columns.items()}
+        cents = columns[AMOUNT_COLUMN]
+        if not len(cents):
+            return
+
+        # Group number of every row from the offsets of narrow dimensions and
+        # the ranks of wide ones, renumbered densely when they grow too sparse
+        rows = len(cents)
+        group = np.zeros(rows, dtype=np.int64)
+        groups = 1
+        for name in group_by:
+            values = columns[name]
+            low = int(values.min())
+            size = int(values.max()) - low + 1
+            if size <= rows:
+                codes = values.astype(np.int64) - low
+            else:
+                ranked, codes = np.unique(values, return_inverse=True)
+                size = len(ranked)
+            group = group * size + codes
+            groups *= size
+            if groups > rows:
+                _, group = np.unique(group, return_inverse=True)
+                groups = int(group.max()) + 1
+
+        counts = np.bincount(group, minlength=groups)
+        present = np.flatnonzero(counts)
+        # Float sums are exact below 2**53, so amounts are summed in two parts
+        high, low = np.divmod(cents, 1 << 24)
+        totals = (_sum_by(group, high, groups) << 24) + _sum_by(group, low, groups)
+        minimums = np.full(groups, np.iinfo(np.int64).max)
+        np.minimum.at(minimums, group, cents)
+        maximums = np.full(groups, np.iinfo(np.int64).min)
+        np.maximum.at(maximums, group, cents)
+        first = np.empty(groups, dtype=np.int64)
+        first[group] = np.arange(rows)
+
+        keys = zip(
+            *(columns[name][first[present]].tolist() for name in group_by),
+            strict=True,
+        )
+        counts = counts[present]
+        stats = zip(
+            totals[present].tolist(),
+            counts.tolist(),
+            minimums[present].tolist(),
+            maximums[present].tolist(),
+            strict=True,
+        )
+        runs = _runs(group, cents, counts) if with_runs else None
+        for key, (total, count, minimum, maximum) in zip(keys, stats, strict=True):
+            yield (
+                key,
+                GroupStats(
+                    total=total,
+                    count=count,
+                    minimum=minimum,
+                    maximum=maximum,
+                    runs=[next(runs)] if runs is not None else [],
+                ),
+            )
+
+    def _select(self, filters: TransactionFilters, columns: dict):
+        """Mask of the ``columns`` rows matching ``filters``, ``None`` for all rows."""
+        import numpy as np
+
+        masks = []
+        for name in ("transaction_type", "status", "year"):
+            value_filter = getattr(filters, name)
+            if value_filter is None:
+                continue
+            values = set(value_filter.values)
+            if name in self._dictionaries:
+                values = {
+                    code
+                    for code, value in enumerate(self._dictionaries[name])
+                    if value in values
+                }
+            matches = np.isin(columns[name], list(values))
+            masks.append(~matches if value_filter.negate else matches)
+
+        year = columns["year"]
+        if filters.year_min is not None:
+            masks.append(year >= filters.year_min)
+        if filters.year_max is not None:
+            masks.append(year <= filters.year_max)
+        amount = columns[AMOUNT_COLUMN]
+        if filters.amount_min is not None:
+            cents = int((filters.amount_min * 100).to_integral_value(ROUND_CEILING))
+            masks.append(amount >= cents)
+        if filters.amount_max is not None:
+            cents = int((filters.amount_max * 100).to_integral_value(ROUND_FLOOR))
+            masks.append(amount <= cents)
+
+        if not masks:
+            return None
+        return np.logical_and.reduce(masks)
+
+    def _decode(self, name: str, value):
+        if name not in self._dictionaries:
+            return value
+        return self._dictionaries[name][value]
+
+
+def _sum_by(group, values, groups: int):
+    """Integer sums of ``values`` by ``group``, exact while below 2**53."""
+    import numpy as np
+
+    return np.bincount(group, values, groups).round().astype(np.int64)
+
+
+def _runs(group, cents, counts) -> Iterator[list[int]]:
+    """Sorted amounts of each group, in group order."""
+    import numpy as np
+
+    ordered = cents[np.lexsort((cents, group))]
+    end = 0
+    for count in counts.tolist():
+        yield ordered[end : end + count].tolist()
+        end += count
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _extract(aliases: list[str]) -> tuple[dict[str, array], dict[str, list[str]]]:
+    """All transactions of the ``aliases`` databases as columns, with the
+    dictionaries of the coded ones.
+    """
+    codes: dict[str, dict[str, int]] = {name: {} for name in CODED_COLUMNS}
+    columns = {
+        **{name: array("L") for name in CODED_COLUMNS},
+        **{name: array(typecode) for name, typecode in INTEGER_COLUMNS.items()},
+        AMOUNT_COLUMN: array("q"),
+    }
+    rows = chain.from_iterable(
+        CombinedTransaction.objects.using(alias)
+        .order_by()
+        .values_list(
+            "transaction_type", "status", "transaction_number", "amount_cents", "year"
+        )
+        .iterator(chunk_size=10_000)
+        for alias in aliases
+    )
+    for transaction_type, status, number, cents, year in rows:
+        # Same values as the expressions in ``DERIVED_DIMENSIONS``
+        dimensions = {
+            "transaction_type": transaction_type,
+            "status": status,
+            "transaction_number_prefix": number.split("-", 1)[0],
+        }
+        for name, value in dimensions.items():
+            column_codes = codes[name]
+            code = column_codes.get(value)
+            if code is None:
+                code = column_codes[value] = len(column_codes)
+            columns[name].append(code)
+        columns["year"].append(year)
+        columns["decade"].append(year // 10 * 10)
+        columns["amount_bucket"].append(cents // 10_000 * 100)
+        columns[AMOUNT_COLUMN].append(cents)
+
+    for name in CODED_COLUMNS:
+        # Narrowest code width for the number of distinct values
+        size = len(codes[name])
+        typecode = "B" if size <= 1 << 8 else "H" if size <= 1 << 16 else "L"
+        columns[name] = array(typecode, columns[name])
+    return columns, {name: list(codes[name]) for name in CODED_COLUMNS}
+
+
+def _write(
+    file,
+    version: int,
+    built_at: datetime,
+    columns: dict[str, array],
+    dictionaries: dict[str, list[str]],
+) -> None:
+    rows = len(columns[AMOUNT_COLUMN])
+    layout = {}
+    offsets: dict[str, int] = {}
+    offset = 0
+    for name, values in columns.items():
+        offset = offsets[name] = _align(offset)
+        layout[name] = {
+            "typecode": values.typecode,
+            "offset": offset,
+            "dictionary": dictionaries.get(name),
+        }
+        offset += rows * values.itemsize
+    header = json.dumps(
+        {
+            "version": version,
+            "built_at": built_at.timestamp(),
+            "rows": rows,
+            "byteorder": sys.byteorder,
+            "columns": layout,
+        }
+    ).encode()
+
+    file.write(MAGIC)
+    file.write(struct.pack("<Q", len(header)))
+    file.write(header)
+    data_start = _align(file.tell())
+    for name, values in columns.items():
+        file.write(b"\0" * (data_start + offsets[name] - file.tell()))
+        values.tofile(file)
+
+
+def _published_version(path: str) -> int:
+    try:
+        return ReportSnapshot(path).version
+    except (FileNotFoundError, SnapshotError, ValueError):
+        return 0
+
+
+def build_report_snapshot(
+    path: str, using: list[str] | None = None
+) -> SnapshotBuildResult:
+    """Dump all transactions (of the ``using`` databases, defaulting to every
+    shard) to a new snapshot and publish it at ``path``.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        # One build at a time, so versions increase; readers are never blocked
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        version = _published_version(path) + 1
+        built_at = timezone.now()
+        columns, dictionaries = _extract(using or shard_aliases())
+        with tempfile.NamedTemporaryFile(
+            dir=directory, suffix=".snapshot", delete=False
+        ) as file:
+            try:
+                _write(file, version, built_at, columns, dictionaries)
+                file.flush()
+                os.fsync(file.fileno())
+                os.replace(file.name, path)
+            except BaseException:
+                os.unlink(file.name)
+                raise
+    return SnapshotBuildResult(version=version, rows=len(columns[AMOUNT_COLUMN]))
+
+
+class _PublishedSnapshot:
+    """The snapshot at ``path``, remapped when a build has replaced it."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_version: tuple[int, int] | None = None
+        self._snapshot: ReportSnapshot | None = None
+
+    def get(self) -> ReportSnapshot | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        file_version = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if file_version != self._file_version:
+                # Reports still running keep the previous mapping alive
+                self._snapshot = ReportSnapshot(self.path)
+                self._file_version = file_version
+            return self._snapshot
+
+
+_published: dict[str, _PublishedSnapshot] = {}
+_published_lock = threading.Lock()
+
+
+def get_report_snapshot() -> ReportSnapshot | None:
+    """The configured snapshot, or ``None`` if there is none (yet) or
+    ``numpy`` is not installed.
+    """
+    path = settings.REPORT_SNAPSHOT_PATH
+    if not path:
+        return None
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        logger.warning("REPORT_SNAPSHOT_PATH is set but numpy is not installed")
+        return None
+    with _published_lock:
+        if path not in _published:
+            _published[path] = _PublishedSnapshot(path)
+        published = _published[path]
+    try:
+        return published.get()
+    except (SnapshotError, ValueError):
+        logger.exception("Cannot read the report snapshot %s", path)
+        return None
+
+
+def get_fresh_report_snapshot() -> ReportSnapshot | None:
+    """The configured snapshot if it is within the staleness bound."""
+    snapshot = get_report_snapshot()
+    if snapshot is None or (
+        (timezone.now() - snapshot.built_at).total_seconds()
+        > settings.REPORT_SNAPSHOT_MAX_STALENESS
+    ):
+        return None
+    return snapshot
+
+
+def refresh_report_snapshot() -> SnapshotBuildResult | None:
+    """Rebuild the configured snapshot, if any; returns what was written."""
+    path = settings.REPORT_SNAPSHOT_PATH
+    if not path:
+        return None
+    started = time.monotonic()
+    result = build_report_snapshot(path)
+    logger.info(
+        "Built report snapshot %s in %.2fs: %s",
+        path,
+        time.monotonic() - started,
+        result,
+    )
+    return result
@@ -1,9 +1,22 @@
 from decimal import Decimal
 
 import pytest
+from django.conf import settings
 
 from transactions.models import Transaction
 
+# Second database of the sharding tests; only created for tests that use it
+SHARD_ALIAS = "shard_recent"
+
+
+def pytest_configure(config):
+    default = settings.DATABASES["default"]
+    settings.DATABASES[SHARD_ALIAS] = {
+        **default,
+        "NAME": f"{default['NAME']}_recent",
+        "TEST": {**default.get("TEST", {}), "NAME": None},
+    }
+
 
 def _factory(
     count: int = 1,
@@ -69,3 +82,21 @@ def sample_transactions(transaction_factory) -> list[Transaction]:
             year=2024,
         ),
     ]
+
+
+@pytest.fixture
+def varied_transactions(db) -> list[Transaction]:
+    """120 transactions over 2019-2024 with varied dimensions and amounts."""
+    types = Transaction.TransactionType.values
+    statuses = Transaction.Status.values
+    prefixes = ["INV", "BILL", "EXP", "2025/5"]
+    return Transaction.objects.bulk_create(
+        Transaction(
+            transaction_type=types[i % len(types)],
+            status=statuses[i * 7 % len(statuses)],
+            transaction_number=f"{prefixes[i % 4]}-{i}",
+            amount=Decimal(i * 37 % 1000) + Decimal(i % 100) / 100,
+            year=2019 + i % 6,
+        )
+        for i in range(120)
+    )
@@ -0,0 +1,57 @@
+from unittest import mock
+
+import pytest
+from django.contrib.admin.sites import AdminSite
+from django.db import connection
+from django.test import RequestFactory
+
+from transactions.admin import EstimatedCountPaginator, TransactionAdmin
+from transactions.models import Transaction
+
+
+@pytest.fixture
+def model_admin():
+    return TransactionAdmin(Transaction, AdminSite())
+
+
+@pytest.mark.django_db
+def test_search_uses_indexed_lookups(model_admin, sample_transactions):
+    request = RequestFactory().get("/")
+    queryset = Transaction.objects.all()
+
+    found, may_have_duplicates = model_admin.get_search_results(
+        request, queryset, "unpaid"
+    )
+    assert not may_have_duplicates
+    assert sorted(found.values_list("transaction_number", flat=True)) == [
+        "BILL-UNPAID-2024-1",
+        "INV-UNPAID-2024-1",
+    ]
+    assert 'UPPER("transactions_transaction"."transaction_number"::text) LIKE' in (
+        str(found.query)
+    )
+
+    # Too short for a trigram lookup: matched as a prefix
+    found, _ = model_admin.get_search_results(request, queryset, "bi")
+    assert list(found.values_list("transaction_number", flat=True)) == [
+        "BILL-UNPAID-2024-1"
+    ]
+
+
+@pytest.mark.django_db
+def test_paginator_estimates_count_of_large_unfiltered_tables(sample_transactions):
+    queryset = Transaction.objects.order_by("id")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class "
+            "WHERE oid = 'transactions_transaction'::regclass"
+        )
+        estimate = cursor.fetchone()[0]
+
+    with mock.patch("transactions.admin.ESTIMATED_COUNT_THRESHOLD", estimate):
+        assert EstimatedCountPaginator(queryset, 10).count == estimate
+        # Filtered listings are always counted exactly
+        filtered = queryset.filter(year=2024)
+        assert EstimatedCountPaginator(filtered, 10).count == 3
+
+    assert EstimatedCountPaginator(queryset, 10).count == 3
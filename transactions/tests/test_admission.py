@@ -0,0 +1,106 @@
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pytest
+from django.db import OperationalError, connection, connections
+
+from transactions.admission import (
+    ConcurrencyLimiter,
+    QueueFull,
+    QueueTimeout,
+    is_statement_timeout,
+    statement_timeout,
+)
+
+
+def _limiter(**overrides) -> ConcurrencyLimiter:
+    options: dict[str, Any] = {
+        "limit": 1,
+        "queue_size": 1,
+        "queue_timeout": 2.0,
+        "retry_after": 7,
+    }
+    options.update(overrides)
+    return ConcurrencyLimiter("test", **options)
+
+
+class _Holder:
+    """Holds a slot of ``limiter`` from another thread (and DB session)."""
+
+    def __init__(self, limiter: ConcurrencyLimiter) -> None:
+        self.limiter = limiter
+        self.admitted = threading.Event()
+        self.release = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers=1)
+
+    def __enter__(self) -> "_Holder":
+        self.future = self.pool.submit(self._hold)
+        assert self.admitted.wait(5)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release.set()
+        self.future.result()
+        self.pool.shutdown()
+
+    def _hold(self) -> None:
+        try:
+            with self.limiter.admit():
+                self.admitted.set()
+                self.release.wait(5)
+        finally:
+            connections.close_all()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrencyLimiter:
+    def test_admits_up_to_limit(self):
+        limiter = _limiter(limit=2, queue_size=0)
+        with _Holder(limiter), limiter.admit():
+            pass
+
+    def test_rejects_when_queue_is_full(self):
+        limiter = _limiter(queue_size=0)
+        with _Holder(limiter), pytest.raises(QueueFull) as exc_info, limiter.admit():
+            pass
+        assert exc_info.value.retry_after == 7
+
+    def test_queued_request_times_out(self):
+        limiter = _limiter(queue_timeout=0.1)
+        with _Holder(limiter), pytest.raises(QueueTimeout), limiter.admit():
+            pass
+
+    def test_queued_request_is_admitted_when_slot_frees_up(self):
+        limiter = _limiter()
+        with _Holder(limiter) as holder:
+            threading.Timer(0.1, holder.release.set).start()
+            with limiter.admit():
+                pass
+
+    def test_slot_is_released(self):
+        limiter = _limiter(queue_size=0)
+        for _ in range(3):
+            with limiter.admit():
+                pass
+        with _Holder(limiter):
+            pass
+
+
+@pytest.mark.django_db
+def test_statement_timeout_cancels_slow_statements():
+    with (
+        pytest.raises(OperationalError) as exc_info,
+        statement_timeout(0.05),
+        connection.cursor() as cursor,
+    ):
+        cursor.execute("SELECT pg_sleep(1)")
+    assert is_statement_timeout(exc_info.value)
+
+
+def test_admission_errors_survive_pickling():
+    # As published to coalesced waiters in other processes
+    error = pickle.loads(pickle.dumps(QueueFull("Too many requests.", 7)))
+    assert isinstance(error, QueueFull)
+    assert (str(error), error.retry_after) == ("Too many requests.", 7)
@@ -0,0 +1,137 @@
+import pytest
+from django.urls import reverse
+
+from transactions.coalescing import get_data_version
+from transactions.models import Transaction
+
+
+def _patch(client, payload):
+    return client.patch(
+        reverse("transaction-bulk-status"), payload, content_type="application/json"
+    )
+
+
+@pytest.mark.django_db
+class TestTransactionBulkStatusAPI:
+    def test_updates_by_transaction_numbers(self, admin_client, sample_transactions):
+        response = _patch(
+            admin_client,
+            {
+                "status": "paid",
+                "transaction_numbers": [
+                    "INV-UNPAID-2024-1",
+                    "INV-PAID-2024-1",
+                    "INV-UNPAID-2024-1",
+                    "MISSING-1",
+                ],
+            },
+        )
+
+        assert response.status_code == 200
+        # Duplicates and unknown numbers are ignored; already paid is not a change
+        assert response.json() == {"matched": 2, "changed": 1}
+        assert Transaction.objects.get(
+            transaction_number="INV-UNPAID-2024-1"
+        ).status == (Transaction.Status.PAID)
+        assert Transaction.objects.get(
+            transaction_number="BILL-UNPAID-2024-1"
+        ).status == (Transaction.Status.UNPAID)
+
+    def test_updates_by_filters(self, admin_client, sample_transactions):
+        response = _patch(
+            admin_client,
+            {"status": "paid", "filters": {"status": "unpaid", "year": "2024"}},
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"matched": 2, "changed": 2}
+        assert not Transaction.objects.filter(status=Transaction.Status.UNPAID).exists()
+
+    def test_updates_in_batches(self, admin_client, transaction_factory, settings):
+        settings.BULK_STATUS_BATCH_SIZE = 2
+        transaction_factory(5, status=Transaction.Status.UNPAID)
+        transaction_factory(2, transaction_number_prefix="BILL-", year=2023)
+
+        by_filters = _patch(
+            admin_client, {"status": "paid", "filters": {"year": "2024"}}
+        )
+        by_numbers = _patch(
+            admin_client,
+            {
+                "status": "unpaid",
+                "transaction_numbers": [f"INV-{i}" for i in range(5)],
+            },
+        )
+
+        assert by_filters.json() == {"matched": 5, "changed": 5}
+        assert by_numbers.json() == {"matched": 5, "changed": 5}
+
+    def test_sets_updated_at_and_bumps_data_version(
+        self, admin_client, sample_transactions
+    ):
+        transaction = sample_transactions[1]
+        version = get_data_version()
+
+        _patch(
+            admin_client,
+            {"status": "paid", "transaction_numbers": [transaction.transaction_number]},
+        )
+
+        transaction_before = transaction.updated_at
+        transaction.refresh_from_db()
+        assert transaction.updated_at > transaction_before
+        assert get_data_version() > version
+
+    def test_no_changes_keeps_data_version(self, admin_client, sample_transactions):
+        version = get_data_version()
+
+        response = _patch(
+            admin_client, {"status": "paid", "filters": {"status": "paid"}}
+        )
+
+        assert response.json() == {"matched": 1, "changed": 0}
+        assert get_data_version() == version
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            {"transaction_numbers": ["INV-PAID-2024-1"]},
+            {"status": "settled", "transaction_numbers": ["INV-PAID-2024-1"]},
+            {"status": "paid"},
+            {
+                "status": "paid",
+                "transaction_numbers": ["INV-PAID-2024-1"],
+                "filters": {"year": "2024"},
+            },
+            {"status": "paid", "transaction_numbers": []},
+            {"status": "paid", "filters": {}},
+            {"status": "paid", "filters": {"colour": "red"}},
+            {"status": "paid", "filters": {"year": "last"}},
+        ],
+    )
+    def test_rejects_invalid_payload(self, admin_client, sample_transactions, payload):
+        response = _patch(admin_client, payload)
+
+        assert response.status_code == 400
+        assert (
+            not Transaction.objects.filter(status=Transaction.Status.PAID)
+            .exclude(transaction_number="INV-PAID-2024-1")
+            .exists()
+        )
+
+    def test_rejects_too_many_numbers(self, admin_client, settings):
+        settings.BULK_STATUS_MAX_NUMBERS = 2
+        response = _patch(
+            admin_client,
+            {"status": "paid", "transaction_numbers": ["A-1", "A-2", "A-3"]},
+        )
+
+        assert response.status_code == 400
+
+    def test_requires_change_permission(self, client, sample_transactions):
+        response = _patch(
+            client, {"status": "paid", "transaction_numbers": ["INV-UNPAID-2024-1"]}
+        )
+
+        assert response.status_code == 403
+        assert Transaction.objects.filter(status=Transaction.Status.UNPAID).count() == 2
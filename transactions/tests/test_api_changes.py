@@ -0,0 +1,101 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from transactions.models import Transaction, TransactionTombstone
+
+
+@pytest.fixture
+def no_safety_lag(settings):
+    settings.CHANGE_FEED_SAFETY_LAG = 0
+
+
+def _sync(client, cursor=None, page_size=100):
+    params = {"page_size": page_size}
+    if cursor:
+        params["since"] = cursor
+    response = client.get(reverse("transaction-changes"), params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.django_db
+class TestTransactionChangesAPI:
+    def test_pages_through_changes_with_cursor(
+        self, client, sample_transactions, no_safety_lag
+    ):
+        first = _sync(client, page_size=2)
+        assert first["has_more"] is True
+        assert [event["op"] for event in first["results"]] == ["upsert", "upsert"]
+        assert first["results"][0]["transaction_number"] == "INV-PAID-2024-1"
+        assert first["results"][0]["amount"] == "100.00"
+
+        second = _sync(client, first["next_cursor"], page_size=2)
+        assert second["has_more"] is False
+        assert [event["transaction_number"] for event in second["results"]] == [
+            "BILL-UNPAID-2024-1"
+        ]
+
+        # Nothing changed since: the cursor is kept as is
+        third = _sync(client, second["next_cursor"])
+        assert third["results"] == []
+        assert third["next_cursor"] == second["next_cursor"]
+
+    def test_updates_are_picked_up_incrementally(
+        self, client, sample_transactions, no_safety_lag
+    ):
+        cursor = _sync(client)["next_cursor"]
+
+        transaction = sample_transactions[1]
+        transaction.status = Transaction.Status.PAID
+        transaction.save()
+
+        page = _sync(client, cursor)
+        assert [(e["op"], e["id"], e["status"]) for e in page["results"]] == [
+            ("upsert", transaction.id, "paid")
+        ]
+
+    def test_recent_changes_are_held_back(self, client, sample_transactions, settings):
+        settings.CHANGE_FEED_SAFETY_LAG = 60
+        assert _sync(client)["results"] == []
+
+    def test_invalid_cursor(self, client):
+        resp = client.get(reverse("transaction-changes"), {"since": "not-a-cursor"})
+        assert resp.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deletes_are_recorded_as_tombstones(
+    client, sample_transactions, no_safety_lag, tmp_path
+):
+    cursor = _sync(client)["next_cursor"]
+
+    sample_transactions[2].delete()
+    fixture = tmp_path / "transactions.json"
+    fixture.write_text(
+        json.dumps(
+            [
+                {
+                    "transaction_type": "bill",
+                    "transaction_number": "BILL-NEW-1",
+                    "amount": "12.00",
+                    "status": "paid",
+                    "year": 2025,
+                }
+            ]
+        )
+    )
+    call_command("load_transactions", path=str(fixture), reset=True)
+
+    assert TransactionTombstone.objects.count() == 3
+    events = _sync(client, cursor)["results"]
+    deleted = [e["transaction_number"] for e in events if e["op"] == "delete"]
+    assert sorted(deleted) == [
+        "BILL-UNPAID-2024-1",
+        "INV-PAID-2024-1",
+        "INV-UNPAID-2024-1",
+    ]
+    assert events[-1]["op"] == "upsert"
+    assert events[-1]["transaction_number"] == "BILL-NEW-1"
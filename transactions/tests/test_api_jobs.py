@@ -0,0 +1,208 @@
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from transactions import jobs
+from transactions.jobs import _WorkerPool
+from transactions.models import ReportJob
+from transactions.services import TransactionReportService
+
+
+@pytest.fixture
+def eager_jobs(settings):
+    settings.REPORT_JOBS_EAGER = True
+
+
+@pytest.mark.django_db
+class TestTransactionReportJobsAPI:
+    def test_create_and_fetch_job(self, client, sample_transactions, eager_jobs):
+        url = reverse("transaction-report-jobs")
+        response = client.post(
+            url,
+            {"row_field": "transaction_type", "column_fields": "status"},
+            content_type="application/json",
+        )
+
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "succeeded"
+        assert response["Location"].endswith(f"/report/jobs/{job['id']}/")
+
+        detail = client.get(
+            reverse("transaction-report-job-detail", kwargs={"job_id": job["id"]})
+        )
+        assert detail.status_code == 200
+        result = detail.json()["result"]
+        assert result["grand_total"] == "225.00"
+        rows = {row["row_key"]["transaction_type"]: row for row in result["data"]}
+        assert rows["invoice"]["row_total"] == "175.00"
+
+    def test_filters_and_options_are_applied(
+        self, client, sample_transactions, eager_jobs
+    ):
+        response = client.post(
+            reverse("transaction-report-jobs"),
+            {
+                "row_field": "transaction_type",
+                "column_fields": ["status"],
+                "metrics": "count",
+                "status": "unpaid",
+            },
+            content_type="application/json",
+        )
+
+        result = response.json()["result"]
+        assert result["grand_total"] == "125.00"
+        assert result["grand_metrics"] == {"count": 2}
+
+    def test_identical_requests_are_deduplicated(
+        self, client, sample_transactions, eager_jobs
+    ):
+        url = reverse("transaction-report-jobs")
+        payload = {"row_field": "status", "year": "2024"}
+        first = client.post(url, payload, content_type="application/json")
+        second = client.post(url, payload, content_type="application/json")
+        other = client.post(
+            url, {"row_field": "status"}, content_type="application/json"
+        )
+
+        assert second.status_code == 200
+        assert second.json()["id"] == first.json()["id"]
+        assert other.json()["id"] != first.json()["id"]
+        assert ReportJob.objects.count() == 2
+
+    def test_jobs_of_dead_processes_are_not_reused(
+        self, client, sample_transactions, eager_jobs
+    ):
+        url = reverse("transaction-report-jobs")
+        payload = {"row_field": "status"}
+        first = client.post(url, payload, content_type="application/json").json()
+        # As left behind by a worker process that died mid-job
+        ReportJob.objects.filter(pk=first["id"]).update(
+            status=ReportJob.JobStatus.RUNNING,
+            heartbeat_at=timezone.now() - timedelta(minutes=5),
+        )
+
+        second = client.post(url, payload, content_type="application/json")
+
+        assert second.status_code == 202
+        assert second.json()["id"] != first["id"]
+        assert second.json()["status"] == "succeeded"
+        dead = client.get(
+            reverse("transaction-report-job-detail", kwargs={"job_id": first["id"]})
+        ).json()
+        assert dead["status"] == "failed"
+        assert dead["error"] == "The process running the job stopped."
+
+    def test_worker_records_the_stages_of_the_job(
+        self, client, monkeypatch, sample_transactions, eager_jobs
+    ):
+        recorded = []
+        set_stage = jobs._set_stage
+
+        def spy(job_id, stage):
+            set_stage(job_id, stage)
+            recorded.append(ReportJob.objects.get(pk=job_id).stage)
+
+        monkeypatch.setattr(jobs, "_set_stage", spy)
+
+        response = client.post(
+            reverse("transaction-report-jobs"),
+            {"row_field": "status"},
+            content_type="application/json",
+        )
+
+        assert recorded == ["querying", "pivoting", "serializing"]
+        assert response.json()["stage"] == "done"
+
+    def test_failed_jobs_keep_their_stage(
+        self, client, monkeypatch, sample_transactions, eager_jobs
+    ):
+        def fail(*args, **kwargs):
+            raise ValueError("pivot failed")
+
+        monkeypatch.setattr(TransactionReportService, "_pivot", fail)
+
+        job = client.post(
+            reverse("transaction-report-jobs"),
+            {"row_field": "status"},
+            content_type="application/json",
+        ).json()
+
+        assert (job["status"], job["stage"]) == ("failed", "pivoting")
+        assert job["error"] == "pivot failed"
+
+    def test_validation_and_missing_jobs(self, client, sample_transactions):
+        resp = client.post(
+            reverse("transaction-report-jobs"),
+            {"row_field": "foo"},
+            content_type="application/json",
+        )
+        assert resp.status_code == 400
+
+        resp = client.get(
+            reverse("transaction-report-job-detail", kwargs={"job_id": uuid.uuid4()})
+        )
+        assert resp.status_code == 404
+
+    def test_expired_jobs_are_gone(self, client, sample_transactions, eager_jobs):
+        response = client.post(
+            reverse("transaction-report-jobs"),
+            {"row_field": "status"},
+            content_type="application/json",
+        )
+        job_id = response.json()["id"]
+        ReportJob.objects.filter(pk=job_id).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        resp = client.get(
+            reverse("transaction-report-job-detail", kwargs={"job_id": job_id})
+        )
+        assert resp.status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_job_runs_on_worker_pool(client, sample_transactions):
+    response = client.post(
+        reverse("transaction-report-jobs"),
+        {"row_field": "status"},
+        content_type="application/json",
+    )
+    assert response.status_code == 202
+    url = reverse(
+        "transaction-report-job-detail", kwargs={"job_id": response.json()["id"]}
+    )
+
+    deadline = time.monotonic() + 10
+    while (job := client.get(url).json())["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+    assert job["status"] == "succeeded"
+    assert job["result"]["grand_total"] == "225.00"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_pool_refreshes_heartbeats_of_unfinished_jobs(settings):
+    settings.REPORT_JOBS_HEARTBEAT_INTERVAL = 0.01
+    beaten_before = timezone.now() - timedelta(minutes=5)
+    job = ReportJob.objects.create(
+        report_request={}, expires_at=timezone.now(), heartbeat_at=beaten_before
+    )
+    release = threading.Event()
+    pool = _WorkerPool(max_workers=1, max_pending=1)
+    try:
+        pool.submit(lambda _: release.wait(5), job.pk)
+        deadline = time.monotonic() + 5
+        while ReportJob.objects.get(pk=job.pk).heartbeat_at == beaten_before:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        release.set()
+        pool.shutdown(wait=True)
@@ -1,4 +1,6 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 
@@ -45,6 +47,47 @@ class TestTransactionListAPI:
         numbers = {item["transaction_number"] for item in resp.json()["results"]}
         assert numbers == {"INV-UNPAID-2024-1"}
 
+    def test_multi_value_range_and_negated_filters(self, client, sample_transactions):
+        url = reverse("transaction-list")
+
+        def numbers(params):
+            resp = client.get(url, params)
+            assert resp.status_code == 200
+            return {item["transaction_number"] for item in resp.json()["results"]}
+
+        assert numbers({"transaction_type": "invoice,bill", "status": "unpaid"}) == {
+            "BILL-UNPAID-2024-1",
+            "INV-UNPAID-2024-1",
+        }
+        assert numbers({"status": "!unpaid"}) == {"INV-PAID-2024-1"}
+        assert numbers({"year": "2023,2024", "transaction_type": "!bill"}) == {
+            "INV-PAID-2024-1",
+            "INV-UNPAID-2024-1",
+        }
+        assert numbers({"year": "!2024"}) == set()
+        assert numbers({"year_min": "2021", "year_max": "2024"}) == {
+            "BILL-UNPAID-2024-1",
+            "INV-PAID-2024-1",
+            "INV-UNPAID-2024-1",
+        }
+        assert numbers({"year_min": "2025"}) == set()
+        assert numbers({"amount_min": "50.00", "amount_max": "80"}) == {
+            "BILL-UNPAID-2024-1",
+            "INV-UNPAID-2024-1",
+        }
+
+    def test_invalid_filters_are_rejected(self, client, sample_transactions):
+        url = reverse("transaction-list")
+        for params in (
+            {"status": "paid,refunded"},
+            {"transaction_type": "receipt"},
+            {"year_min": "twenty"},
+            {"year_min": "2024", "year_max": "2020"},
+            {"amount_max": "lots"},
+            {"amount_min": "NaN"},
+        ):
+            assert client.get(url, params).status_code == 400, params
+
     def test_invalid_year_is_ignored(self, client, sample_transactions):
         url = reverse("transaction-list")
         response = client.get(url, {"year": "not-a-year"})
@@ -91,3 +134,73 @@ class TestTransactionListAPI:
         data = response.json()
         assert data["count"] == 15
         assert len(data["results"]) == 5
+
+    def test_sparse_fieldsets(self, client, sample_transactions):
+        url = reverse("transaction-list")
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url, {"fields": "transaction_number,amount"})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert {tuple(item) for item in results} == {("transaction_number", "amount")}
+        assert {item["amount"] for item in results} == {"100.00", "75.00", "50.00"}
+
+        select = next(q["sql"] for q in ctx.captured_queries if "LIMIT" in q["sql"])
+        projection = select.split(" FROM ")[0]
+        assert '"amount"' in projection
+        assert '"status"' not in projection
+        assert '"created_at"' not in projection
+
+    def test_default_fields_skip_timestamps(self, client, sample_transactions):
+        url = reverse("transaction-list")
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+
+        assert set(response.json()["results"][0]) == {
+            "id",
+            "transaction_type",
+            "transaction_number",
+            "amount",
+            "status",
+            "year",
+        }
+        select = next(q["sql"] for q in ctx.captured_queries if "LIMIT" in q["sql"])
+        assert '"updated_at"' not in select
+
+    def test_invalid_fields_are_rejected(self, client, sample_transactions):
+        url = reverse("transaction-list")
+        assert client.get(url, {"fields": "amount,created_at"}).status_code == 400
+        assert client.get(url, {"fields": "amount,amount"}).status_code == 400
+
+    def test_search_by_transaction_number(self, client, sample_transactions):
+        url = reverse("transaction-list")
+
+        def numbers(params):
+            response = client.get(url, params)
+            assert response.status_code == 200
+            return [row["transaction_number"] for row in response.json()["results"]]
+
+        assert numbers({"search": "unpaid-2024"}) == [
+            "BILL-UNPAID-2024-1",
+            "INV-UNPAID-2024-1",
+        ]
+        assert numbers({"search": "inv-", "search_mode": "prefix"}) == [
+            "INV-PAID-2024-1",
+            "INV-UNPAID-2024-1",
+        ]
+        assert numbers({"search": "inv-paid-2024-1", "search_mode": "exact"}) == [
+            "INV-PAID-2024-1"
+        ]
+        assert numbers({"search": "inv-paid", "search_mode": "exact"}) == []
+
+    def test_invalid_search_is_rejected(self, client, sample_transactions):
+        url = reverse("transaction-list")
+        response = client.get(url, {"search": "in"})
+        assert response.status_code == 400
+        assert "at least 3 characters" in response.json()["detail"]
+        short_prefix = client.get(url, {"search": "in", "search_mode": "prefix"})
+        assert short_prefix.status_code == 200
+        assert (
+            client.get(url, {"search": "inv", "search_mode": "fuzzy"}).status_code
+            == 400
+        )
@@ -1,6 +1,16 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
 import pytest
+from django.db import connection, connections
 from django.urls import reverse
 
+from transactions.admission import ConcurrencyLimiter
+from transactions.coalescing import CoalescedCallError
+from transactions.services import TransactionReportService
+
 
 @pytest.mark.django_db
 class TestTransactionReportAPI:
@@ -67,6 +77,66 @@ class TestTransactionReportAPI:
         )
         assert resp.status_code == 400
 
+    def test_metrics(self, client, sample_transactions):
+        url = reverse("transaction-report")
+        response = client.get(
+            url,
+            {
+                "row_field": "transaction_type",
+                "metrics": "count,max",
+            },
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["metrics"] == ["count", "max"]
+        assert data["grand_metrics"] == {"count": 3, "max": "100.00"}
+        rows = {row["row_key"]["transaction_type"]: row for row in data["data"]}
+        assert rows["invoice"]["row_metrics"] == {"count": 2, "max": "100.00"}
+
+        # Metrics are opt-in: the default response keeps its shape
+        response = client.get(url, {"row_field": "transaction_type"})
+        assert "metrics" not in response.json()
+
+        # Unknown and duplicate metrics are rejected
+        resp = client.get(url, {"row_field": "status", "metrics": "count,median"})
+        assert resp.status_code == 400
+        resp = client.get(url, {"row_field": "status", "metrics": "count,count"})
+        assert resp.status_code == 400
+
+    def test_approximate_mode(self, client, sample_transactions):
+        url = reverse("transaction-report")
+        response = client.get(
+            url,
+            {
+                "row_field": "transaction_type",
+                "mode": "approx",
+                "sample": "100",
+                "sample_method": "bernoulli",
+            },
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["grand_total"] == "225.00"
+        assert data["approximation"]["method"] == "bernoulli"
+        assert data["approximation"]["grand_total_ci"] == ["225.00", "225.00"]
+        rows = {row["row_key"]["transaction_type"]: row for row in data["data"]}
+        assert rows["invoice"]["row_total_ci"] == ["175.00", "175.00"]
+
+        # Exact mode stays the default
+        response = client.get(url, {"row_field": "transaction_type"})
+        assert "approximation" not in response.json()
+
+        for params in (
+            {"mode": "fast"},
+            {"mode": "approx", "sample": "0"},
+            {"mode": "approx", "sample": "abc"},
+            {"mode": "approx", "sample_method": "random"},
+        ):
+            resp = client.get(url, {"row_field": "status", **params})
+            assert resp.status_code == 400
+
     def test_filters_are_applied_before_aggregation(self, client, sample_transactions):
         url = reverse("transaction-report")
         response = client.get(
@@ -85,3 +155,291 @@ class TestTransactionReportAPI:
         assert rows["invoice"]["row_total"] == "75.00"
         assert rows["bill"]["row_total"] == "50.00"
         assert data["grand_total"] == "125.00"
+
+    def test_multi_value_filters(
+        self, client, sample_transactions, transaction_factory
+    ):
+        transaction_factory(
+            count=1,
+            transaction_number_prefix="INV-PARTIAL-2020-",
+            status="partially_paid",
+            amount="40.00",
+            year=2020,
+        )
+        url = reverse("transaction-report")
+        response = client.get(
+            url,
+            {
+                "row_field": "status",
+                "status": "paid,partially_paid",
+                "year_min": "2021",
+                "year_max": "2024",
+            },
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [row["row_key"]["status"] for row in data["data"]] == ["paid"]
+        assert data["grand_total"] == "100.00"
+
+        resp = client.get(url, {"row_field": "status", "status": "void"})
+        assert resp.status_code == 400
+
+    def test_trends(self, client, transaction_factory):
+        transaction_factory(count=1, transaction_number_prefix="A-", year=2023)
+        transaction_factory(count=2, transaction_number_prefix="B-", year=2024)
+
+        response = client.get(
+            reverse("transaction-report"),
+            {"row_field": "year", "trends": "cumulative,yoy_pct"},
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["trends"] == ["cumulative", "yoy_pct"]
+        assert [row["row_trends"] for row in data["data"]] == [
+            {"cumulative": "10.00", "yoy_pct": None},
+            {"cumulative": "30.00", "yoy_pct": "100.00"},
+        ]
+
+    def test_trend_validation(self, client, sample_transactions):
+        url = reverse("transaction-report")
+        for params in (
+            {"row_field": "status", "trends": "yoy"},
+            {"row_field": "year", "trends": "mom"},
+            {"row_field": "year", "trends": "yoy,yoy"},
+        ):
+            resp = client.get(url, params)
+            assert resp.status_code == 400
+
+        resp = client.get(
+            url, {"row_field": "status", "column_fields": "year", "trends": "yoy"}
+        )
+        assert resp.status_code == 200
+
+    def test_derived_dimensions(self, client, sample_transactions):
+        url = reverse("transaction-report")
+        response = client.get(
+            url, {"row_field": "decade", "column_fields": "amount_bucket"}
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [row["row_key"] for row in data["data"]] == [{"decade": 2020}]
+        assert [total["column_key"] for total in data["column_totals"]] == [
+            {"amount_bucket": 0},
+            {"amount_bucket": 100},
+        ]
+
+    def test_top_rows_and_other(self, client, varied_transactions):
+        url = reverse("transaction-report")
+        params = {"row_field": "amount_bucket", "column_fields": "status"}
+        full = client.get(url, params).json()
+        by_total = sorted(
+            full["data"], key=lambda row: -float(row["row_total"])
+        )  # no ties in this data
+
+        data = client.get(url, {**params, "top": 3}).json()
+
+        assert data["data"] == by_total[:3]
+        assert data["row_count"] == len(full["data"])
+        assert data["other"]["row_key"] == {"amount_bucket": None}
+        assert float(data["other"]["row_total"]) == pytest.approx(
+            sum(float(row["row_total"]) for row in by_total[3:])
+        )
+        assert data["column_totals"] == full["column_totals"]
+        assert data["grand_total"] == full["grand_total"]
+
+    def test_row_pages(self, client, varied_transactions):
+        url = reverse("transaction-report")
+        params = {"row_field": "amount_bucket", "column_fields": "status,year"}
+        full = client.get(url, params).json()
+
+        pages = [
+            client.get(
+                url, {**params, "sort": "-row", "row_page": page, "row_page_size": 4}
+            ).json()
+            for page in (1, 2, 3)
+        ]
+
+        assert [row for page in pages for row in page["data"]] == full["data"][::-1]
+        assert [len(page["data"]) for page in pages] == [4, 4, 2]
+        assert all("other" not in page for page in pages)
+        # Totals cover every row, columns in the same order on every page
+        assert pages[0]["column_totals"] == pages[2]["column_totals"]
+        assert sorted(map(str, pages[1]["column_totals"])) == sorted(
+            map(str, full["column_totals"])
+        )
+
+    def test_rows_sorted_by_a_column(self, client, varied_transactions):
+        url = reverse("transaction-report")
+        data = client.get(
+            url,
+            {
+                "row_field": "transaction_number_prefix",
+                "column_fields": "year",
+                "sort": "column",
+                "sort_column": "2020",
+            },
+        ).json()
+
+        def total_2020(row):
+            cell = [c for c in row["cells"] if c["column_key"] == {"year": 2020}]
+            return float(cell[0]["total_amount"]) if cell else None
+
+        totals = [total_2020(row) for row in data["data"]]
+        present = [total for total in totals if total is not None]
+        assert present == sorted(present)
+        assert totals[: len(present)] == present  # rows without 2020 come last
+        assert data["row_count"] == 4
+
+    def test_row_selection_validation(self, client, sample_transactions):
+        url = reverse("transaction-report")
+        for params in (
+            {"row_field": "status", "top": "0"},
+            {"row_field": "status", "top": "many"},
+            {"row_field": "status", "top": "2", "row_page": "1"},
+            {"row_field": "status", "row_page_size": "100000"},
+            {"row_field": "status", "sort": "amount"},
+            {"row_field": "status", "sort": "column"},
+            {"row_field": "status", "column_fields": "year", "sort": "column"},
+            {
+                "row_field": "status",
+                "column_fields": "year",
+                "sort": "column",
+                "sort_column": "recent",
+            },
+            {"row_field": "status", "sort": "total", "sort_column": "2024"},
+            {"row_field": "year", "trends": "yoy", "top": "1"},
+        ):
+            resp = client.get(url, params)
+            assert resp.status_code == 400, params
+
+        resp = client.get(url, {"row_field": "year", "trends": "yoy", "sort": "-row"})
+        assert resp.status_code == 200
+
+
+@pytest.mark.django_db(transaction=True)
+class TestReportAdmission:
+    @pytest.fixture
+    def saturated(self, settings):
+        """Hold the only report slot from another DB session."""
+        settings.REPORT_MAX_CONCURRENCY = 1
+        settings.REPORT_QUEUE_SIZE = 0
+        limiter = ConcurrencyLimiter(
+            "report", limit=1, queue_size=0, queue_timeout=0, retry_after=5
+        )
+        admitted, release = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with limiter.admit():
+                    admitted.set()
+                    release.wait(5)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            holder = pool.submit(hold)
+            assert admitted.wait(5)
+            yield
+            release.set()
+            holder.result()
+
+    def test_rejects_with_retry_after_when_saturated(
+        self, client, sample_transactions, saturated
+    ):
+        response = client.get(reverse("transaction-report"), {"row_field": "status"})
+        assert response.status_code == 429
+        assert response["Retry-After"] == "5"
+
+    def test_queued_request_times_out(
+        self, client, sample_transactions, saturated, settings
+    ):
+        settings.REPORT_QUEUE_SIZE = 1
+        settings.REPORT_QUEUE_TIMEOUT = 0.1
+        response = client.get(reverse("transaction-report"), {"row_field": "status"})
+        assert response.status_code == 503
+        assert response["Retry-After"] == "5"
+
+    def test_coalesced_requests_take_one_slot(
+        self, client, sample_transactions, settings
+    ):
+        settings.REPORT_MAX_CONCURRENCY = 1
+        settings.REPORT_QUEUE_SIZE = 0
+        build_report = TransactionReportService.build_report
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_report(queryset, request, filters=None):
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return build_report(queryset, request, filters)
+
+        def get():
+            try:
+                return client.get(
+                    reverse("transaction-report"), {"row_field": "status"}
+                )
+            finally:
+                connections.close_all()
+
+        with (
+            mock.patch.object(
+                TransactionReportService, "build_report", side_effect=slow_report
+            ),
+            ThreadPoolExecutor(max_workers=8) as pool,
+        ):
+            leader = pool.submit(get)
+            assert started.wait(5)
+            waiters = [pool.submit(get) for _ in range(7)]
+            time.sleep(0.2)  # let the waiters join the in-flight report
+            release.set()
+            responses = [future.result() for future in [leader, *waiters]]
+
+        assert [response.status_code for response in responses] == [200] * 8
+        assert len(calls) == 1
+
+    def test_cheap_reports_bypass_the_limiter(
+        self, client, sample_transactions, saturated, settings
+    ):
+        settings.REPORT_CHEAP_COST = 1e12
+        response = client.get(reverse("transaction-report"), {"row_field": "status"})
+        assert response.status_code == 200
+        assert response.json()["grand_total"] == "225.00"
+
+    def test_rejects_reports_over_cost_budget(
+        self, client, sample_transactions, settings
+    ):
+        settings.REPORT_MAX_COST = 0.001
+        response = client.get(reverse("transaction-report"), {"row_field": "status"})
+        assert response.status_code == 422
+        assert response.json()["detail"].startswith("The report is estimated")
+
+    def test_statement_timeout(self, client, sample_transactions, settings):
+        settings.REPORT_STATEMENT_TIMEOUT = 0.05
+
+        def slow_report(queryset, request, filters=None):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_sleep(1)")
+
+        with mock.patch.object(
+            TransactionReportService, "build_report", side_effect=slow_report
+        ):
+            response = client.get(
+                reverse("transaction-report"), {"row_field": "status"}
+            )
+        assert response.status_code == 503
+        assert "time limit" in response.json()["detail"]
+
+    def test_failed_coalesced_report_is_unavailable(self, client, sample_transactions):
+        error = CoalescedCallError("could not serialize access")
+        with mock.patch.object(
+            TransactionReportService, "build_report_coalesced", side_effect=error
+        ):
+            response = client.get(
+                reverse("transaction-report"), {"row_field": "status"}
+            )
+        assert response.status_code == 503
+        assert response["Retry-After"] == "5"
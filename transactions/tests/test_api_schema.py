@@ -0,0 +1,76 @@
+import json
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from transaction_reporting import schema
+from transactions.management.commands.import_audit import parse_import_times
+
+
+@pytest.fixture(autouse=True)
+def fresh_schema_cache():
+    schema._schemas.clear()
+    yield
+    schema._schemas.clear()
+
+
+class TestSchemaAPI:
+    def test_schema_is_generated_once(self, client):
+        with mock.patch.object(
+            schema, "render_schemas", wraps=schema.render_schemas
+        ) as render:
+            first = client.get(reverse("openapi-schema"))
+            second = client.get(reverse("openapi-schema"))
+
+        assert render.call_count == 1
+        assert first.status_code == 200
+        assert first["Content-Type"] == "application/vnd.oai.openapi"
+        assert first.content == second.content
+        assert b"/api/transactions/report/" in first.content
+
+    def test_json_format(self, client):
+        response = client.get(reverse("openapi-schema"), {"format": "openapi-json"})
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/vnd.oai.openapi+json"
+        assert json.loads(response.content)["info"]["version"] == "1.0.0"
+
+        by_accept = client.get(
+            reverse("openapi-schema"), HTTP_ACCEPT="application/vnd.oai.openapi+json"
+        )
+        assert by_accept.content == response.content
+
+    def test_not_modified_when_etag_matches(self, client):
+        response = client.get(reverse("openapi-schema"))
+        etag = response["ETag"]
+
+        revalidated = client.get(reverse("openapi-schema"), HTTP_IF_NONE_MATCH=etag)
+        assert revalidated.status_code == 304
+        assert revalidated["ETag"] == etag
+        assert revalidated.content == b""
+
+    def test_serves_schema_built_at_deploy_time(self, client, settings, tmp_path):
+        call_command("build_openapi_schema", output=str(tmp_path), stdout=mock.Mock())
+        (tmp_path / "openapi.yaml").write_bytes(b"openapi: 3.0.2\n")
+        settings.OPENAPI_SCHEMA_DIR = str(tmp_path)
+
+        with mock.patch.object(schema, "render_schemas") as render:
+            response = client.get(reverse("openapi-schema"))
+
+        render.assert_not_called()
+        assert response.content == b"openapi: 3.0.2\n"
+
+
+def test_parse_import_times():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   encodings.aliases\n"
+        "import time:       300 |        420 | encodings\n"
+        "some unrelated line\n"
+    )
+    timings = parse_import_times(stderr)
+    assert [(t.module, t.self_us, t.cumulative_us, t.depth) for t in timings] == [
+        ("encodings.aliases", 120, 120, 1),
+        ("encodings", 300, 420, 0),
+    ]
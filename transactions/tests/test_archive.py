@@ -0,0 +1,221 @@
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from transactions.archive import (
+    archive_transactions,
+    get_archive_boundary,
+    reaches_archive,
+    with_archive,
+)
+from transactions.filters import TransactionFilters
+from transactions.models import (
+    ArchivedTransaction,
+    CombinedTransaction,
+    Transaction,
+    TransactionTombstone,
+)
+
+
+@pytest.fixture
+def transactions_by_year(transaction_factory):
+    """Two transactions for each year from 2020 to 2024."""
+    created = []
+    for year in range(2020, 2025):
+        created += transaction_factory(
+            2,
+            transaction_number_prefix=f"INV-{year}-",
+            year=year,
+            amount=f"{year - 2000}.50",
+            status=Transaction.Status.UNPAID if year % 2 else Transaction.Status.PAID,
+        )
+    return created
+
+
+def _archive(before_year, batch_size=5000):
+    call_command(
+        "archive_transactions",
+        before_year=before_year,
+        batch_size=batch_size,
+        no_vacuum=True,
+    )
+
+
+@pytest.mark.django_db
+class TestArchiveTransactions:
+    def test_moves_old_years_in_batches(self, transactions_by_year):
+        originals = Transaction.objects.in_bulk()
+
+        moved = archive_transactions(2023, batch_size=4)
+
+        assert moved == 6
+        assert set(Transaction.objects.values_list("year", flat=True)) == {2023, 2024}
+        archived = ArchivedTransaction.objects.order_by("id")
+        assert [a.year for a in archived] == [2020, 2020, 2021, 2021, 2022, 2022]
+        for row in archived:
+            original = originals[row.id]
+            assert row.transaction_number == original.transaction_number
+            assert row.amount == original.amount
+            assert row.amount_cents == original.amount_cents == original.amount * 100
+            assert row.updated_at == original.updated_at
+        assert get_archive_boundary() == 2023
+        assert CombinedTransaction.objects.count() == 10
+        assert sorted(
+            CombinedTransaction.objects.values_list("amount_cents", flat=True)
+        ) == (sorted(original.amount_cents for original in originals.values()))
+
+    def test_archived_rows_are_not_tombstoned(self, transactions_by_year):
+        _archive(2022)
+
+        assert not TransactionTombstone.objects.exists()
+
+        Transaction.objects.filter(year=2024).delete()
+        assert TransactionTombstone.objects.count() == 2
+
+    def test_deleted_archived_rows_reach_the_change_feed(
+        self, client, transactions_by_year, settings
+    ):
+        settings.CHANGE_FEED_SAFETY_LAG = 0
+        _archive(2022)
+        url = reverse("transaction-changes")
+        cursor = client.get(url).json()["next_cursor"]
+
+        ArchivedTransaction.objects.filter(year=2020).delete()
+
+        events = client.get(url, {"since": cursor}).json()["results"]
+        assert sorted((e["op"], e["transaction_number"]) for e in events) == [
+            ("delete", "INV-2020-0"),
+            ("delete", "INV-2020-1"),
+        ]
+
+    def test_nothing_to_archive(self, transactions_by_year):
+        assert archive_transactions(2000) == 0
+        assert get_archive_boundary() is None
+
+    def test_reset_also_clears_the_archive(self, transactions_by_year):
+        _archive(2022)
+
+        call_command("load_transactions", reset=True)
+
+        assert not ArchivedTransaction.objects.exists()
+
+
+class TestReachesArchive:
+    @pytest.mark.parametrize(
+        ("params", "expected"),
+        [
+            ({}, True),
+            ({"year": "2024"}, False),
+            ({"year": "2024,2021"}, True),
+            ({"year": "!2021"}, True),
+            ({"year_min": "2023"}, False),
+            ({"year_min": "2022"}, True),
+            ({"year_max": "2030"}, True),
+            ({"status": "paid"}, True),
+        ],
+    )
+    def test_filters(self, params, expected):
+        filters = TransactionFilters.from_params(params)
+        assert reaches_archive(filters, 2023) is expected
+
+    def test_nothing_archived(self):
+        assert reaches_archive(TransactionFilters(), None) is False
+
+
+@pytest.mark.django_db
+class TestArchiveReads:
+    def test_queryset_switches_to_combined_view_only_when_needed(
+        self, transactions_by_year
+    ):
+        _archive(2023)
+        queryset = Transaction.objects.order_by("-year")
+
+        hot = with_archive(queryset, TransactionFilters.from_params({"year": "2024"}))
+        combined = with_archive(queryset, TransactionFilters())
+
+        assert hot is queryset
+        assert combined.model is CombinedTransaction
+        assert combined.query.order_by == ("-year",)
+
+    @pytest.mark.parametrize(
+        "params",
+        [{}, {"year": "2021"}, {"year_min": "2023"}, {"status": "paid"}],
+    )
+    def test_list_is_unchanged_by_archiving(self, client, transactions_by_year, params):
+        url = reverse("transaction-list")
+        query = {**params, "page_size": 100}
+        before = client.get(url, query).json()
+
+        _archive(2023)
+        after = client.get(url, query).json()
+
+        assert after == before
+        assert after["count"] > 0
+
+    def test_list_search_and_fields_include_archive(self, client, transactions_by_year):
+        _archive(2023)
+
+        response = client.get(
+            reverse("transaction-list"),
+            {"search": "inv-2020", "search_mode": "prefix", "fields": "amount"},
+        )
+
+        assert response.json()["results"] == [
+            {"amount": "20.50"},
+            {"amount": "20.50"},
+        ]
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"row_field": "year", "column_fields": "status"},
+            {
+                "row_field": "decade",
+                "column_fields": "transaction_type",
+                "metrics": "count,avg,p50",
+                "year_max": "2022",
+            },
+            {
+                "row_field": "status",
+                "mode": "approx",
+                "sample": "100",
+                "sample_method": "bernoulli",
+            },
+        ],
+    )
+    def test_report_is_unchanged_by_archiving(
+        self, client, transactions_by_year, params
+    ):
+        url = reverse("transaction-report")
+        before = client.get(url, params).json()
+
+        _archive(2023)
+        after = client.get(url, params).json()
+
+        assert after == before
+        assert after["grand_total"] != "0.00"
+
+    def test_report_jobs_include_archive(self, client, transactions_by_year, settings):
+        settings.REPORT_JOBS_EAGER = True
+        _archive(2023)
+
+        response = client.post(
+            reverse("transaction-report-jobs"),
+            {"row_field": "year"},
+            content_type="application/json",
+        )
+
+        data = response.json()["result"]["data"]
+        assert [row["row_key"]["year"] for row in data] == list(range(2020, 2025))
+
+    def test_bulk_status_leaves_archive_alone(self, admin_client, transactions_by_year):
+        _archive(2023)
+
+        response = admin_client.patch(
+            reverse("transaction-bulk-status"),
+            {"status": "partially_paid", "filters": {"year_max": "2030"}},
+            content_type="application/json",
+        )
+
+        assert response.json() == {"matched": 4, "changed": 4}
+        assert not ArchivedTransaction.objects.filter(status="partially_paid").exists()
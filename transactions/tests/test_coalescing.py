@@ -0,0 +1,185 @@
+import fcntl
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import connections
+
+from transactions.coalescing import (
+    CoalescedCallError,
+    CoalescingTimeout,
+    FileSingleFlight,
+    SingleFlight,
+    bump_data_version,
+    get_data_version,
+)
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_computation(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"grand_total": "225.00"}
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            leader = pool.submit(flight.do, "report", compute, 5)
+            started.wait(5)
+            waiters = [pool.submit(flight.do, "report", compute, 5) for _ in range(4)]
+            time.sleep(0.05)  # let the waiters block on the in-flight call
+            release.set()
+            results = [future.result() for future in [leader, *waiters]]
+
+        assert len(calls) == 1
+        assert all(result == {"grand_total": "225.00"} for result in results)
+        assert flight._calls == {}
+
+    def test_error_is_propagated_to_waiters(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            raise RuntimeError("database went away")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "report", compute, 5)
+            started.wait(5)
+            waiter = pool.submit(flight.do, "report", compute, 5)
+            time.sleep(0.05)
+            release.set()
+
+            for future in (leader, waiter):
+                with pytest.raises(RuntimeError, match="database went away"):
+                    future.result()
+
+    def test_waiter_times_out(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            return "done"
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            leader = pool.submit(flight.do, "report", compute, 5)
+            started.wait(5)
+            with pytest.raises(CoalescingTimeout):
+                flight.do("report", compute, timeout=0.01)
+            release.set()
+            assert leader.result() == "done"
+
+
+class TestFileSingleFlight:
+    def test_leader_result_is_published(self, tmp_path):
+        flight = FileSingleFlight(str(tmp_path))
+        assert flight.do("report", lambda: [1, 2, 3], timeout=1) == [1, 2, 3]
+        assert (tmp_path / "report.result").exists()
+
+    def test_waiter_reuses_result_published_while_waiting(self, tmp_path):
+        leader = FileSingleFlight(str(tmp_path))
+        waiter = FileSingleFlight(str(tmp_path))
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            return "shared"
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leading = pool.submit(leader.do, "report", compute, 5)
+            started.wait(5)
+            waiting = pool.submit(waiter.do, "report", lambda: "recomputed", 5)
+            time.sleep(0.05)  # let the waiter block on the lock file
+            release.set()
+            assert leading.result() == "shared"
+            assert waiting.result() == "shared"
+
+    def test_leader_error_reaches_waiters(self, tmp_path):
+        leader = FileSingleFlight(str(tmp_path))
+        waiter = FileSingleFlight(str(tmp_path))
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            raise RuntimeError("boom")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leading = pool.submit(leader.do, "report", compute, 5)
+            started.wait(5)
+            waiting = pool.submit(waiter.do, "report", lambda: "recomputed", 5)
+            time.sleep(0.05)  # let the waiter block on the lock file
+            release.set()
+            with pytest.raises(RuntimeError):
+                leading.result()
+            with pytest.raises(RuntimeError, match="boom"):
+                waiting.result()
+
+    def test_unpicklable_error_reaches_waiters_as_message(self, tmp_path):
+        class ContextError(Exception):
+            def __init__(self, message, context):
+                super().__init__(message)
+                self.context = context
+
+        def compute():
+            raise ContextError("boom", {"year": 2024})
+
+        flight = FileSingleFlight(str(tmp_path))
+        with pytest.raises(ContextError):
+            flight.do("report", compute, timeout=1)
+        with pytest.raises(CoalescedCallError, match="boom"):
+            flight._unwrap(flight._read_result(str(tmp_path / "report.result"), 0))
+
+    def test_sweeps_files_of_expired_keys(self, tmp_path):
+        flight = FileSingleFlight(str(tmp_path))
+        flight.do("old", lambda: "stale", timeout=1)
+        expired = time.time() - 10
+        for name in ("old.lock", "old.result"):
+            os.utime(tmp_path / name, (expired, expired))
+
+        assert flight.do("new", lambda: "fresh", timeout=1) == "fresh"
+        assert sorted(os.listdir(tmp_path)) == ["new.lock", "new.result"]
+
+    def test_keeps_lock_files_in_use(self, tmp_path):
+        flight = FileSingleFlight(str(tmp_path))
+        expired = time.time() - 10
+        with open(tmp_path / "busy.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            os.utime(tmp_path / "busy.lock", (expired, expired))
+            flight.do("new", lambda: "fresh", timeout=1)
+        assert (tmp_path / "busy.lock").exists()
+
+
+@pytest.mark.django_db
+def test_data_version_bump():
+    version = get_data_version()
+    bump_data_version()
+    assert get_data_version() > version
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_version_is_shared_by_connections():
+    version = get_data_version()
+    # As another worker process would after a write
+    other = connections.create_connection("default")
+    try:
+        with other.cursor() as cursor:
+            cursor.execute("SELECT nextval('transactions_data_version')")
+    finally:
+        other.close()
+    assert get_data_version() > version
@@ -0,0 +1,216 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+
+from transaction_reporting import compression, schema
+from transaction_reporting.compression import CompressionMiddleware, negotiate
+from transactions.services import TransactionReportService
+
+
+@pytest.fixture
+def report_cache(settings):
+    settings.REPORT_CACHE_TIMEOUT = 60
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        ("", None),
+        ("gzip", "gzip"),
+        ("gzip, deflate, zstd", "zstd"),
+        ("gzip;q=1.0, zstd;q=0.5", "gzip"),
+        ("zstd;q=0, *", "gzip"),
+        ("identity", None),
+        ("GZIP;q=0.2, bogus;;q", "gzip"),
+    ],
+)
+def test_negotiation(settings, accept_encoding, expected):
+    settings.COMPRESSION_ENCODINGS = ["zstd", "gzip"]
+    if expected == "zstd":
+        pytest.importorskip("zstandard")
+    codec = negotiate(accept_encoding)
+    assert (codec and codec.name) == expected
+
+
+def test_unknown_and_disabled_encodings_are_skipped(settings):
+    settings.COMPRESSION_ENCODINGS = ["lzma", "gzip"]
+    assert negotiate("lzma, gzip;q=0.1").name == "gzip"
+    settings.COMPRESSION_ENCODINGS = []
+    assert negotiate("gzip") is None
+
+
+@pytest.mark.django_db
+class TestCompressedResponses:
+    def test_list_is_gzipped(self, client, transaction_factory):
+        transaction_factory(40)
+        url = reverse("transaction-list")
+
+        plain = client.get(url)
+        compressed = client.get(url, headers={"accept-encoding": "gzip"})
+
+        assert "Content-Encoding" not in plain
+        assert compressed["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in compressed["Vary"]
+        assert int(compressed["Content-Length"]) < len(plain.content)
+        assert json.loads(gzip.decompress(compressed.content)) == plain.json()
+
+    @pytest.mark.parametrize(
+        ("encoding", "module"), [("zstd", "zstandard"), ("br", "brotli")]
+    )
+    def test_optional_encodings(self, client, transaction_factory, encoding, module):
+        library = pytest.importorskip(module)
+        transaction_factory(40)
+        url = reverse("transaction-list")
+
+        response = client.get(url, headers={"accept-encoding": encoding})
+
+        assert response["Content-Encoding"] == encoding
+        assert json.loads(library.decompress(response.content)) == (
+            client.get(url).json()
+        )
+
+    def test_small_bodies_are_not_compressed(self, client, settings):
+        settings.COMPRESSION_MIN_SIZE = 100_000
+        response = client.get(
+            reverse("transaction-list"), headers={"accept-encoding": "gzip"}
+        )
+        assert "Content-Encoding" not in response
+
+    def test_schema_revalidates_with_the_weakened_etag(self, client):
+        schema._schemas.clear()
+        first = client.get(
+            reverse("openapi-schema"), headers={"accept-encoding": "gzip"}
+        )
+        assert first["Content-Encoding"] == "gzip"
+        assert first["ETag"].startswith('W/"')
+
+        second = client.get(
+            reverse("openapi-schema"), headers={"if-none-match": first["ETag"]}
+        )
+        assert second.status_code == 304
+        schema._schemas.clear()
+
+
+def test_streams_are_compressed_chunk_by_chunk(settings):
+    settings.COMPRESSION_MIN_SIZE = 1_000_000  # streams are compressed regardless
+    chunks = [b'{"rows": [', *(b'{"n": %d},' % i for i in range(100)), b"{}]}"]
+    received = []
+
+    def view(request):
+        def content():
+            for chunk in chunks:
+                received.append(chunk)
+                yield chunk
+
+        return StreamingHttpResponse(content(), content_type="application/json")
+
+    request = RequestFactory().get("/", headers={"accept-encoding": "gzip"})
+    response = CompressionMiddleware(view)(request)
+
+    assert response["Content-Encoding"] == "gzip"
+    decompressor = zlib.decompressobj(31)
+    stream = iter(response.streaming_content)
+    # Every compressed chunk decodes to its input before the next one is read
+    assert decompressor.decompress(next(stream)) == chunks[0]
+    assert received == chunks[:1]
+    body = chunks[0] + b"".join(decompressor.decompress(part) for part in stream)
+    assert body == b"".join(chunks)
+
+
+def test_precompressed_variant_is_sent(settings):
+    body = b"x" * 2000
+
+    def view(request):
+        response = HttpResponse(body)
+        response.precompressed = {"gzip": b"stored"}
+        return response
+
+    request = RequestFactory().get("/", headers={"accept-encoding": "gzip"})
+    response = CompressionMiddleware(view)(request)
+
+    assert response.content == b"stored"
+    assert response["Content-Length"] == "6"
+
+
+@pytest.mark.django_db
+class TestReportCache:
+    URL_PARAMS = {"row_field": "transaction_type", "column_fields": "year,status"}
+
+    def test_repeated_reports_skip_building_and_compressing(
+        self, client, monkeypatch, report_cache, varied_transactions
+    ):
+        calls = []
+        build_report = TransactionReportService.build_report
+
+        def counting(*args, **kwargs):
+            calls.append(args)
+            return build_report(*args, **kwargs)
+
+        monkeypatch.setattr(TransactionReportService, "build_report", counting)
+        url = reverse("transaction-report")
+        first = client.get(url, self.URL_PARAMS, headers={"accept-encoding": "gzip"})
+
+        def no_compression(*args, **kwargs):
+            raise AssertionError("compressed again")
+
+        monkeypatch.setattr(compression.gzip, "compress", no_compression)
+        second = client.get(url, self.URL_PARAMS, headers={"accept-encoding": "gzip"})
+        plain = client.get(url, self.URL_PARAMS)
+
+        assert len(calls) == 1
+        assert second["Content-Encoding"] == "gzip"
+        assert second.content == first.content
+        assert second["Content-Type"] == "application/json"
+        assert json.loads(gzip.decompress(second.content)) == plain.json()
+        assert plain.json()["grand_total"]
+
+    def test_writes_invalidate_cached_reports(
+        self, client, report_cache, transaction_factory
+    ):
+        transaction_factory(1)
+        url = reverse("transaction-report")
+        assert client.get(url, self.URL_PARAMS).json()["grand_total"] == "10.00"
+
+        transaction_factory(1, start_index=1)
+
+        assert client.get(url, self.URL_PARAMS).json()["grand_total"] == "20.00"
+
+    def test_sampled_and_browsable_reports_are_not_cached(
+        self, client, report_cache, sample_transactions
+    ):
+        url = reverse("transaction-report")
+        params = {**self.URL_PARAMS, "mode": "approx", "sample": "100"}
+        client.get(url, params)
+        client.get(url, {**self.URL_PARAMS, "format": "api"})
+
+        assert not [key for key in cache._cache if "transactions:report" in key]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_writes_of_other_processes_invalidate_cached_reports(
+    client, report_cache, transaction_factory
+):
+    transaction_factory(1)
+    url = reverse("transaction-report")
+    assert client.get(url, TestReportCache.URL_PARAMS).json()["grand_total"] == "10.00"
+
+    # Another worker process writes, and bumps the shared data version
+    other = connections.create_connection("default")
+    try:
+        with other.cursor() as cursor:
+            cursor.execute("UPDATE transactions_transaction SET amount = 25")
+            cursor.execute("SELECT nextval('transactions_data_version')")
+    finally:
+        other.close()
+
+    assert client.get(url, TestReportCache.URL_PARAMS).json()["grand_total"] == "25.00"
@@ -0,0 +1,329 @@
+import random
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from transactions import engines
+from transactions import mirror as mirror_module
+from transactions import snapshot as snapshot_module
+from transactions.archive import archive_transactions, with_archive
+from transactions.engines import (
+    PartialsEngine,
+    ReportEngine,
+    ReportQuery,
+    get_engine,
+    get_engines,
+    register_engine,
+    select_engine,
+)
+from transactions.filters import TransactionFilters
+from transactions.models import Transaction
+from transactions.services import (
+    ReportDimension,
+    ReportMetric,
+    ReportRowSelection,
+    ReportSampling,
+    ReportTrend,
+    RowSort,
+    SampleMethod,
+    TransactionReportRequest,
+    TransactionReportService,
+)
+
+SEEDS = range(5)
+QUERIES_PER_SEED = 12
+PREFIXES = ("INV", "BILL", "CN", "X")
+
+
+def _dataset(rng: random.Random) -> None:
+    """Random transactions, with ties, zero and negative amounts and
+    (sometimes) archived years.
+    """
+    Transaction.objects.bulk_create(
+        Transaction(
+            transaction_type=rng.choice(Transaction.TransactionType.values),
+            status=rng.choice(Transaction.Status.values),
+            transaction_number=f"{rng.choice(PREFIXES)}-{index}",
+            amount=rng.choice(
+                [
+                    Decimal(rng.randint(-50_000, 500_000)) / 100,
+                    Decimal(rng.randint(0, 3) * 100),
+                    Decimal("0.00"),
+                    Decimal("-0.01"),
+                ]
+            ),
+            year=rng.randint(2015, 2025),
+        )
+        for index in range(rng.randint(20, 150))
+    )
+    before_year = rng.choice([None, 2017, 2020])
+    if before_year is not None:
+        archive_transactions(before_year)
+
+
+def _params(rng: random.Random) -> dict[str, str]:
+    params = {}
+    if rng.random() < 0.3:
+        statuses = rng.sample(Transaction.Status.values, rng.randint(1, 2))
+        params["status"] = ("!" if rng.random() < 0.5 else "") + ",".join(statuses)
+    if rng.random() < 0.3:
+        types = rng.sample(Transaction.TransactionType.values, rng.randint(1, 2))
+        params["transaction_type"] = ",".join(types)
+    if rng.random() < 0.3:
+        years = rng.sample(range(2015, 2026), rng.randint(1, 4))
+        params["year"] = ",".join(map(str, years))
+    elif rng.random() < 0.3:
+        params["year_min"] = str(rng.randint(2014, 2024))
+    if rng.random() < 0.2:
+        params["amount_min"] = str(rng.randint(-100, 1000))
+    return params
+
+
+def _request(rng: random.Random) -> TransactionReportRequest:
+    dimensions = rng.sample(list(ReportDimension), rng.randint(1, 3))
+    metrics = rng.sample(list(ReportMetric), rng.randint(0, 4))
+    trends = []
+    if ReportDimension.YEAR in dimensions and rng.random() < 0.5:
+        trends = rng.sample(list(ReportTrend), rng.randint(1, len(ReportTrend)))
+    return TransactionReportRequest(
+        row_field=dimensions[0],
+        column_fields=dimensions[1:],
+        metrics=metrics,
+        trends=trends,
+        rows=(
+            _rows(rng, dimensions[1:], limited=not trends or dimensions[0] != "year")
+            if rng.random() < 0.5
+            else None
+        ),
+    )
+
+
+def _rows(
+    rng: random.Random, columns: list[ReportDimension], limited: bool
+) -> ReportRowSelection:
+    """Random row selection; not ``limited``, it only orders the rows (like
+    the API, for trends over rows by year).
+    """
+    sorts = [RowSort.ROW, RowSort.TOTAL, *([RowSort.COLUMN] if columns else [])]
+    sort = rng.choice(sorts)
+    column = ()
+    if sort is RowSort.COLUMN:
+        # Amount buckets and prefixes of the dataset, years it may not have
+        values = {
+            ReportDimension.TRANSACTION_TYPE: Transaction.TransactionType.values,
+            ReportDimension.STATUS: Transaction.Status.values,
+            ReportDimension.YEAR: range(2014, 2027),
+            ReportDimension.AMOUNT_BUCKET: [-100, 0, 100, 300],
+            ReportDimension.DECADE: [2010, 2020],
+            ReportDimension.TRANSACTION_NUMBER_PREFIX: PREFIXES,
+        }
+        column = tuple(rng.choice(values[field]) for field in columns)
+    return ReportRowSelection(
+        sort=sort,
+        descending=rng.random() < 0.5,
+        column=column,
+        limit=rng.choice([None, 1, 3]) if limited else None,
+        offset=rng.choice([0, 0, 2]) if limited else 0,
+        other=rng.random() < 0.5,
+    )
+
+
+def _query(params, request: TransactionReportRequest) -> ReportQuery:
+    filters = TransactionFilters.from_params(params)
+    return ReportQuery(
+        queryset=filters.apply(with_archive(Transaction.objects.all(), filters)),
+        row_field=request.row_field.value,
+        column_fields=[field.value for field in request.column_fields],
+        metrics=list(request.metrics),
+        sampling=request.sampling,
+        trends=list(request.trends),
+        filters=filters,
+        rows=request.rows,
+    )
+
+
+def _comparable(rows: list[dict], query: ReportQuery) -> list[dict]:
+    """``rows`` as reports see them: by level, keeping the order within each
+    level (only the order of the cells matters), and without the trends of
+    levels not grouped by year, which PostgreSQL windows over anyway.
+    """
+    year_bit = 0
+    if query.trends:
+        year_bit = 1 << (len(query.group_by) - 1 - query.group_by.index("year"))
+    return [
+        (
+            {key: value for key, value in row.items() if not key.startswith("trend_")}
+            if row["grouping_id"] & year_bit
+            else row
+        )
+        for row in sorted(rows, key=lambda row: row["grouping_id"])
+    ]
+
+
+@pytest.fixture
+def columnar_sources(settings, tmp_path):
+    """Fresh snapshot (if ``numpy`` is installed) and mirror (if ``duckdb``
+    is installed) of the data.
+    """
+    settings.REPORT_SNAPSHOT_PATH = str(tmp_path / "report.snapshot")
+    settings.REPORT_SNAPSHOT_MAX_STALENESS = 3600
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        settings.REPORT_MIRROR_PATH = None
+    else:
+        settings.REPORT_MIRROR_PATH = str(tmp_path / "mirror.duckdb")
+        settings.REPORT_MIRROR_MAX_STALENESS = 3600
+
+    def refresh() -> None:
+        snapshot_module.refresh_report_snapshot()
+        if settings.REPORT_MIRROR_PATH:
+            mirror_module.refresh_report_mirror()
+
+    yield refresh
+    snapshot_module._published.pop(settings.REPORT_SNAPSHOT_PATH, None)
+    if settings.REPORT_MIRROR_PATH:
+        mirror_module._mirrors.pop(settings.REPORT_MIRROR_PATH).close()
+
+
+@pytest.mark.django_db
+class TestDifferential:
+    @pytest.mark.parametrize("seed", SEEDS)
+    def test_engines_match_postgres(self, seed, columnar_sources):
+        rng = random.Random(seed)
+        _dataset(rng)
+        columnar_sources()
+        reference = get_engine("postgres")
+
+        for _ in range(QUERIES_PER_SEED):
+            params, request = _params(rng), _request(rng)
+            query = _query(params, request)
+            expected = _comparable(reference.fetch(query), query)
+            for engine in get_engines():
+                if engine is reference:
+                    continue
+                # Partials answer any query, they are only selected across shards
+                if engine.name != "partials" and not engine.supports(query):
+                    # only without duckdb or numpy
+                    assert engine.name in ("mirror", "snapshot")
+                    continue
+                assert _comparable(engine.fetch(query), query) == expected, (
+                    engine.name,
+                    params,
+                    request,
+                )
+
+    @pytest.mark.parametrize("seed", SEEDS)
+    def test_sampled_reports_match(self, seed):
+        rng = random.Random(seed)
+        _dataset(rng)
+        request = _request(rng)
+        sampled = TransactionReportRequest(
+            row_field=request.row_field,
+            column_fields=request.column_fields,
+            metrics=request.metrics,
+            sampling=ReportSampling(percent=100, method=SampleMethod.BERNOULLI),
+        )
+        query = _query(_params(rng), sampled)
+
+        assert [engine.name for engine in get_engines() if engine.supports(query)] == [
+            "postgres"
+        ]
+        assert _comparable(get_engine("partials").fetch(query), query) == (
+            _comparable(get_engine("postgres").fetch(query), query)
+        )
+
+
+@pytest.fixture(autouse=True)
+def fresh_estimates():
+    """Planner estimates cached by earlier tests are of other data."""
+    engines._row_estimates.clear()
+    engines._year_cardinalities.clear()
+
+
+@pytest.mark.django_db
+class TestSelection:
+    REQUEST = TransactionReportRequest(
+        row_field=ReportDimension.TRANSACTION_TYPE,
+        column_fields=[ReportDimension.STATUS],
+        metrics=[ReportMetric.COUNT, ReportMetric.P90],
+    )
+
+    def test_cheapest_supporting_engine(self, transaction_factory):
+        transaction_factory(5)
+        query = _query({}, self.REQUEST)
+
+        assert select_engine(query).name == "postgres"
+        assert not get_engine("partials").supports(query)
+        assert query.estimate.groups <= max(query.estimate.rows, 1)
+        filtered = _query({"status": "paid,unpaid"}, self.REQUEST)
+        assert filtered.estimate.groups <= 2 * len(Transaction.TransactionType.values)
+
+    def _build_queries(self) -> list[str]:
+        with CaptureQueriesContext(connection) as queries:
+            TransactionReportService.build_report(
+                Transaction.objects.all(), self.REQUEST, TransactionFilters()
+            )
+        return [query["sql"] for query in queries]
+
+    def test_single_supporting_engine_is_not_estimated(self, sample_transactions):
+        [only] = self._build_queries()
+        assert "GROUPING SETS" in only
+
+    def test_repeated_reports_reuse_the_estimate(
+        self, sample_transactions, columnar_sources
+    ):
+        pytest.importorskip("numpy")
+        columnar_sources()
+
+        assert any(sql.startswith("EXPLAIN") for sql in self._build_queries())
+        assert not any(sql.startswith("EXPLAIN") for sql in self._build_queries())
+
+    def test_fresh_snapshot_wins_small_reports(self, columnar_sources):
+        pytest.importorskip("numpy")
+        _dataset(random.Random(0))
+        columnar_sources()
+
+        assert select_engine(_query({}, self.REQUEST)).name == "snapshot"
+
+    def test_setting_forces_a_supporting_engine(self, settings, transaction_factory):
+        transaction_factory(5)
+        settings.REPORT_ENGINE = "partials"  # single database: not supported
+        assert select_engine(_query({}, self.REQUEST)).name == "postgres"
+
+        settings.REPORT_ENGINE = "snapshot"  # no snapshot: not supported
+        assert select_engine(_query({}, self.REQUEST)).name == "postgres"
+
+    def test_setting_forces_a_costlier_engine(self, settings, columnar_sources):
+        _dataset(random.Random(0))
+        columnar_sources()
+
+        settings.REPORT_ENGINE = "postgres"
+        assert select_engine(_query({}, self.REQUEST)).name == "postgres"
+
+    def test_registered_engine(self, settings, sample_transactions):
+        class Recording(PartialsEngine):
+            name = "recording"
+            queries: list[ReportQuery] = []
+
+            def supports(self, query: ReportQuery) -> bool:
+                return True
+
+            def fetch(self, query: ReportQuery) -> list[dict]:
+                self.queries.append(query)
+                return super().fetch(query)
+
+        engine = register_engine(Recording())
+        settings.REPORT_ENGINE = "recording"
+        try:
+            report = TransactionReportService.build_report(
+                Transaction.objects.all(), self.REQUEST, TransactionFilters()
+            )
+        finally:
+            engines._engines.pop("recording")
+
+        assert len(engine.queries) == 1
+        assert report.grand_total == "225.00"
+        assert isinstance(engine, ReportEngine)
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from transaction_reporting.loadtest import LatencyStats, Target, parse_mix
+
+TARGETS = {"list": Target("/list/", [{}]), "report": Target("/report/", [{}])}
+
+
+def test_parse_mix():
+    assert parse_mix("list=3, report=1", TARGETS) == {"list": 3, "report": 1}
+    for raw in ("list", "list=x", "other=1", "list=0"):
+        with pytest.raises(ValueError):
+            parse_mix(raw, TARGETS)
+
+
+def test_latency_stats():
+    stats = LatencyStats([0.0005, 0.003, 0.003, 0.04, 12.0])
+
+    assert stats.percentile(0.5) == 0.003
+    assert stats.percentile(0.99) == 12.0
+    assert LatencyStats().percentile(0.5) is None
+    histogram = dict(stats.histogram())
+    assert (histogram["<=1ms"], histogram["<=5ms"], histogram["<=50ms"]) == (1, 2, 1)
+    assert histogram[">10000ms"] == 1
+    assert sum(histogram.values()) == 5
+
+
+@pytest.mark.django_db(transaction=True)
+def test_loadtest_command(live_server, tmp_path, varied_transactions, capsys):
+    path = tmp_path / "results.json"
+
+    call_command(
+        "loadtest",
+        url=live_server.url,
+        rate=40,
+        duration=1,
+        concurrency=4,
+        interval=0.25,
+        seed=1,
+        json_path=str(path),
+    )
+
+    results = json.loads(path.read_text())
+    total = results["total"]
+    assert total["requests"] > 10
+    assert total["error_rate"] == 0
+    assert set(total["statuses"]) == {"200"}
+    assert set(results["targets"]) == {"list", "report"}
+    assert sum(total["histogram"].values()) == total["requests"]
+    assert len(results["intervals"]) >= 4
+    completed = sum(interval["completed"] for interval in results["intervals"])
+    assert completed == total["requests"]
+    assert all(interval["connections"] is not None for interval in results["intervals"])
+    output = capsys.readouterr().out
+    assert "req/s" in output and "latency p50=" in output
+
+
+def test_loadtest_command_rejects_bad_options():
+    with pytest.raises(CommandError, match="--concurrency"):
+        call_command("loadtest", concurrency=0)
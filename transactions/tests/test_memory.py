@@ -0,0 +1,144 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from transactions import tracing
+from transactions.memory import account_memory, memory_stage
+from transactions.models import Transaction
+
+KB = 1024
+
+# Allocation budgets of the reference workloads, in bytes: roughly twice what
+# they take today, so that regressions stand out rather than noise
+LIST_PAGE_SIZE = 100
+LIST_BUDGETS = {
+    "queryset": 160 * KB,
+    "serialize": 96 * KB,
+    "request": 512 * KB,
+}
+REPORT_PARAMS = {
+    "row_field": "year",
+    "column_fields": "transaction_type,status",
+    "metrics": "count,avg,p90",
+}
+REPORT_BUDGETS = {
+    "aggregate": 48 * KB,
+    "pivot": 24 * KB,
+    "serialize": 40 * KB,
+    "request": 160 * KB,
+}
+
+
+@pytest.fixture
+def accounting(settings):
+    settings.MEMORY_ACCOUNTING = True
+
+
+def _stages(response) -> dict[str, int]:
+    """Peak bytes of each stage of the response, and of the request."""
+    peaks = {"request": int(response["X-Memory-Peak"])}
+    for entry in response["X-Memory-Stages"].split(", "):
+        name, peak, _ = entry.split(";")
+        peaks[name] = max(peaks.get(name, 0), int(peak.removeprefix("peak=")))
+    return peaks
+
+
+def _measure(client, url, params) -> dict[str, int]:
+    client.get(url, params)  # one-time imports and caches
+    response = client.get(url, params)
+    assert response.status_code == 200
+    return _stages(response)
+
+
+def test_stages_nest():
+    with account_memory("outer") as account:
+        with memory_stage("inner"):
+            transient = bytearray(1024 * KB)
+            del transient
+        with memory_stage("kept"):
+            kept = bytearray(256 * KB)
+
+    inner, kept_stage, outer = account.stages
+    assert inner.name == "inner" and inner.peak >= 1024 * KB
+    assert inner.retained < 16 * KB
+    assert kept_stage.retained >= 256 * KB
+    assert outer.peak >= 1024 * KB and outer.retained >= 256 * KB
+    assert len(kept) == 256 * KB
+
+
+def test_stages_outside_accounts_are_ignored():
+    with memory_stage("alone") as stage:
+        assert stage is None
+
+
+@pytest.mark.django_db
+class TestMemoryAccounting:
+    def test_headers_only_when_enabled(self, client, settings, sample_transactions):
+        response = client.get(reverse("transaction-list"))
+        assert "X-Memory-Peak" not in response
+
+        settings.MEMORY_ACCOUNTING = True
+        response = client.get(reverse("transaction-list"))
+        assert int(response["X-Memory-Peak"]) >= int(response["X-Memory-Retained"])
+        assert {"filters", "queryset", "serialize"} <= set(_stages(response))
+
+    def test_traces_carry_the_account(
+        self, client, settings, tmp_path, accounting, sample_transactions
+    ):
+        settings.TRACE_LOG_PATH = str(tmp_path / "traces.jsonl")
+        settings.TRACE_SAMPLE_RATE = 1.0
+        settings.TRACE_SLOW_THRESHOLD = 60.0
+        try:
+            client.get(reverse("transaction-report"), {"row_field": "status"})
+        finally:
+            tracing._logs.pop(settings.TRACE_LOG_PATH, None)
+
+        with open(settings.TRACE_LOG_PATH) as file:
+            [trace] = [json.loads(line) for line in file]
+        assert trace["memory"]["peak"] > 0
+        assert {"aggregate", "pivot", "serialize"} <= {
+            stage["name"] for stage in trace["memory"]["stages"]
+        }
+        pivot = next(span for span in trace["spans"] if span["name"] == "pivot")
+        assert pivot["memory_peak"] >= 0
+
+
+@pytest.mark.django_db
+class TestAllocationBudgets:
+    def test_list_page(self, client, accounting, varied_transactions):
+        peaks = _measure(
+            client, reverse("transaction-list"), {"page_size": LIST_PAGE_SIZE}
+        )
+
+        for stage, budget in LIST_BUDGETS.items():
+            assert peaks[stage] <= budget, (stage, peaks[stage])
+
+    def test_report(self, client, accounting, varied_transactions):
+        peaks = _measure(client, reverse("transaction-report"), REPORT_PARAMS)
+
+        for stage, budget in REPORT_BUDGETS.items():
+            assert peaks[stage] <= budget, (stage, peaks[stage])
+
+    def test_report_memory_does_not_grow_with_rows(
+        self, client, accounting, varied_transactions
+    ):
+        url = reverse("transaction-report")
+        small = _measure(client, url, REPORT_PARAMS)
+        Transaction.objects.bulk_create(
+            Transaction(
+                transaction_type=row.transaction_type,
+                status=row.status,
+                transaction_number=f"{row.transaction_number}-{copy}",
+                amount=row.amount + Decimal(copy),
+                year=row.year,
+            )
+            for row in varied_transactions
+            for copy in range(1, 10)
+        )
+        large = _measure(client, url, REPORT_PARAMS)
+
+        # Ten times the transactions, the same groups: aggregated in SQL
+        for stage in ("aggregate", "pivot", "serialize"):
+            assert large[stage] <= small[stage] * 1.5 + 4 * KB, stage
@@ -0,0 +1,222 @@
+import dataclasses
+import os
+import shutil
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+
+from transactions import mirror as mirror_module
+from transactions.archive import archive_transactions, with_archive
+from transactions.filters import TransactionFilters
+from transactions.models import Transaction
+from transactions.services import (
+    ReportDimension,
+    ReportMetric,
+    ReportSampling,
+    ReportTrend,
+    SampleMethod,
+    TransactionReportRequest,
+    TransactionReportService,
+)
+
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def report_mirror(settings, tmp_path):
+    settings.REPORT_MIRROR_PATH = str(tmp_path / "mirror.duckdb")
+    settings.REPORT_MIRROR_MAX_STALENESS = 3600
+    yield mirror_module.get_report_mirror()
+    mirror_module._mirrors.pop(settings.REPORT_MIRROR_PATH).close()
+
+
+def _postgres_report(settings, params, request):
+    path = settings.REPORT_MIRROR_PATH
+    settings.REPORT_MIRROR_PATH = None
+    try:
+        return TransactionReportService.build_report(
+            TransactionFilters.from_params(params).apply(
+                with_archive(
+                    Transaction.objects.all(), TransactionFilters.from_params(params)
+                )
+            ),
+            request,
+        )
+    finally:
+        settings.REPORT_MIRROR_PATH = path
+
+
+def _mirror_report(params, request):
+    filters = TransactionFilters.from_params(params)
+    return TransactionReportService.build_report(
+        filters.apply(with_archive(Transaction.objects.all(), filters)), request
+    )
+
+
+@pytest.mark.django_db
+class TestReportMirror:
+    @pytest.mark.parametrize(
+        ("params", "request_"),
+        [
+            (
+                {},
+                TransactionReportRequest(
+                    row_field=ReportDimension.TRANSACTION_TYPE,
+                    column_fields=[ReportDimension.STATUS],
+                    metrics=list(ReportMetric),
+                ),
+            ),
+            (
+                {"year": "2020,2022", "amount_min": "100.5"},
+                TransactionReportRequest(
+                    row_field=ReportDimension.TRANSACTION_NUMBER_PREFIX,
+                    column_fields=[
+                        ReportDimension.DECADE,
+                        ReportDimension.AMOUNT_BUCKET,
+                    ],
+                    metrics=[ReportMetric.AVG, ReportMetric.P90],
+                ),
+            ),
+            (
+                {"status": "!paid"},
+                TransactionReportRequest(
+                    row_field=ReportDimension.YEAR,
+                    column_fields=[ReportDimension.TRANSACTION_TYPE],
+                    metrics=[ReportMetric.COUNT, ReportMetric.P99],
+                    trends=list(ReportTrend),
+                ),
+            ),
+        ],
+    )
+    def test_matches_postgres(
+        self, settings, report_mirror, varied_transactions, params, request_
+    ):
+        archive_transactions(2021)
+        report_mirror.refresh()
+
+        assert dataclasses.asdict(_mirror_report(params, request_)) == (
+            dataclasses.asdict(_postgres_report(settings, params, request_))
+        )
+
+    def test_incremental_refresh(self, settings, report_mirror, varied_transactions):
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR,
+            column_fields=[],
+            metrics=[ReportMetric.COUNT],
+        )
+        assert report_mirror.refresh().rebuilt is True
+
+        Transaction.objects.filter(year=2019).delete()
+        Transaction.objects.filter(year=2020).update(amount=Decimal("1.00"))
+        Transaction.objects.create(
+            transaction_type="bill",
+            status="paid",
+            transaction_number="NEW-1",
+            amount="5.00",
+            year=2030,
+        )
+        archive_transactions(2022)
+        result = report_mirror.refresh()
+
+        assert result.rebuilt is False
+        assert result.deleted == 20
+        assert _mirror_report({}, request) == _postgres_report(settings, {}, request)
+
+    def test_refreshes_the_other_file_in_place(
+        self, settings, report_mirror, varied_transactions
+    ):
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR, column_fields=[]
+        )
+        path = settings.REPORT_MIRROR_PATH
+        copies = mock.patch.object(
+            mirror_module.shutil, "copyfile", wraps=shutil.copyfile
+        )
+        targets = []
+        for year in (2019, 2020, 2021):
+            Transaction.objects.filter(year=year).delete()
+            with copies as copyfile:
+                report_mirror.refresh()
+            targets.append((os.readlink(path), copyfile.call_count))
+            assert _mirror_report({}, request) == (
+                _postgres_report(settings, {}, request)
+            )
+
+        # Only the first refresh of the second file copies the published one
+        assert targets == [
+            ("mirror.duckdb.0", 0),
+            ("mirror.duckdb.1", 1),
+            ("mirror.duckdb.0", 0),
+        ]
+
+    def test_file_still_read_is_replaced_by_a_copy(
+        self, settings, report_mirror, varied_transactions
+    ):
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR, column_fields=[]
+        )
+        report_mirror.refresh()
+        # A reader that has not switched since keeps the first file open
+        reader = mirror_module.ReportMirror(settings.REPORT_MIRROR_PATH)
+        assert reader.state() is not None
+        report_mirror.refresh()
+
+        Transaction.objects.filter(year=2019).delete()
+        with mock.patch.object(
+            mirror_module.shutil, "copyfile", wraps=shutil.copyfile
+        ) as copyfile:
+            report_mirror.refresh()
+
+        assert copyfile.call_count == 1
+        assert os.readlink(settings.REPORT_MIRROR_PATH) == "mirror.duckdb.0"
+        reader.close()
+        assert _mirror_report({}, request) == _postgres_report(settings, {}, request)
+
+    def test_stale_or_missing_mirror_falls_back_to_postgres(
+        self, settings, report_mirror, varied_transactions
+    ):
+        request = TransactionReportRequest(
+            row_field=ReportDimension.STATUS, column_fields=[]
+        )
+        before = _postgres_report(settings, {}, request)
+        assert _mirror_report({}, request) == before
+
+        report_mirror.refresh()
+        Transaction.objects.filter(year=2019).delete()
+        after = _postgres_report(settings, {}, request)
+        assert after.grand_total != before.grand_total
+        # Within the staleness bound the (now outdated) mirror answers
+        assert _mirror_report({}, request) == before
+
+        settings.REPORT_MIRROR_MAX_STALENESS = 0
+        assert _mirror_report({}, request) == after
+
+    def test_sampled_reports_use_postgres(
+        self, settings, report_mirror, varied_transactions
+    ):
+        report_mirror.refresh()
+        Transaction.objects.filter(year=2019).delete()
+        request = TransactionReportRequest(
+            row_field=ReportDimension.STATUS,
+            column_fields=[],
+            sampling=ReportSampling(percent=100, method=SampleMethod.BERNOULLI),
+        )
+
+        assert _mirror_report({}, request) == _postgres_report(settings, {}, request)
+
+    def test_commands_refresh_the_mirror(self, report_mirror, varied_transactions):
+        call_command("refresh_report_mirror")
+        assert report_mirror.state() is not None
+
+        call_command("load_transactions", reset=True)
+
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR,
+            column_fields=[],
+            metrics=[ReportMetric.COUNT],
+        )
+        assert _mirror_report({}, request).grand_metrics == {
+            "count": Transaction.objects.count()
+        }
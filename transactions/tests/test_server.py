@@ -0,0 +1,155 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import pytest
+from django.conf import settings
+
+from transaction_reporting.server import parse_bind
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str, timeout: float = 10.0) -> int:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return response.status
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def _children(pid: int) -> set[int]:
+    children = set()
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[0] is the state, fields[1] the parent pid; skip zombies
+        if fields[0] != "Z" and int(fields[1]) == pid:
+            children.add(int(stat.parent.name))
+    return children
+
+
+def _wait_for_workers(
+    pid: int,
+    count: int,
+    excluding: frozenset[int] | set[int] = frozenset(),
+    timeout: float = 20.0,
+) -> set[int]:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        children = _children(pid)
+        if len(children) == count and not children & excluding:
+            return children
+        time.sleep(0.1)
+    raise AssertionError(f"Expected {count} new workers, found {children}.")
+
+
+@pytest.mark.parametrize(
+    "bind,expected",
+    [
+        ("0.0.0.0:8000", ("0.0.0.0", 8000)),
+        (":8000", ("0.0.0.0", 8000)),
+        ("[::1]:9000", ("::1", 9000)),
+    ],
+)
+def test_parse_bind(bind, expected):
+    assert parse_bind(bind) == expected
+
+
+def test_parse_bind_rejects_missing_port():
+    with pytest.raises(ValueError):
+        parse_bind("localhost")
+
+
+def test_serve_recycles_reloads_and_stops():
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/api/schema/"
+    master = subprocess.Popen(
+        [
+            sys.executable,
+            "manage.py",
+            "serve",
+            f"--bind=127.0.0.1:{port}",
+            "--workers=2",
+            "--max-requests=1",
+        ],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, "SERVER_MAX_REQUESTS_JITTER": "0"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        first_workers = _wait_for_workers(master.pid, 2)
+
+        # Every worker exits after one request and is replaced
+        for _ in range(4):
+            assert _get(url) == 200
+        time.sleep(1)
+        assert len(_children(master.pid) - first_workers) == 2
+
+        workers = _children(master.pid)
+        master.send_signal(signal.SIGHUP)
+        # The re-executed master starts new workers, then retires the old ones
+        _wait_for_workers(master.pid, 2, excluding=workers)
+        assert _get(url) == 200
+
+        master.send_signal(signal.SIGTERM)
+        assert master.wait(timeout=20) == 0
+    finally:
+        if master.poll() is None:
+            master.kill()
+            master.wait()
+
+
+def test_idle_client_does_not_block_the_worker():
+    port = _free_port()
+    master = subprocess.Popen(
+        [
+            sys.executable,
+            "manage.py",
+            "serve",
+            f"--bind=127.0.0.1:{port}",
+            "--workers=1",
+        ],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, "SERVER_TIMEOUT": "0.5"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for_workers(master.pid, 1)
+        assert _get(f"http://127.0.0.1:{port}/api/schema/") == 200
+
+        # Connects and sends nothing; the only worker accepts it first
+        with socket.create_connection(("127.0.0.1", port)) as idle:
+            time.sleep(0.2)
+            started = time.monotonic()
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{port}/api/schema/", timeout=5
+            ) as response:
+                assert response.status == 200
+            assert time.monotonic() - started < 5
+            # The idle connection was closed by the worker
+            assert idle.recv(1) == b""
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            master.kill()
+            master.wait()
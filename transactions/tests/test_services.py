@@ -1,4 +1,5 @@
 import dataclasses
+from decimal import Decimal
 
 import pytest
 from django.db.models import QuerySet
@@ -6,6 +7,12 @@ from django.db.models import QuerySet
 from transactions.models import Transaction
 from transactions.services import (
     ReportDimension,
+    ReportMetric,
+    ReportRowSelection,
+    ReportSampling,
+    ReportTrend,
+    RowSort,
+    SampleMethod,
     TransactionReportRequest,
     TransactionReportService,
 )
@@ -59,6 +66,12 @@ class TestTransactionReportService:
                 }
             ],
             "grand_total": "225.00",
+            "metrics": [],
+            "grand_metrics": {},
+            "approximation": None,
+            "trends": [],
+            "row_count": None,
+            "other": None,
         }
 
     def test_row_and_single_column(self, sample_transactions):
@@ -110,6 +123,12 @@ class TestTransactionReportService:
                 },
             ],
             "grand_total": "225.00",
+            "metrics": [],
+            "grand_metrics": {},
+            "approximation": None,
+            "trends": [],
+            "row_count": None,
+            "other": None,
         }
 
     def test_row_and_two_columns(self, sample_transactions):
@@ -161,6 +180,12 @@ class TestTransactionReportService:
                 },
             ],
             "grand_total": "225.00",
+            "metrics": [],
+            "grand_metrics": {},
+            "approximation": None,
+            "trends": [],
+            "row_count": None,
+            "other": None,
         }
 
     @pytest.mark.django_db
@@ -178,4 +203,247 @@ class TestTransactionReportService:
             "data": [],
             "column_totals": [],
             "grand_total": "0",
+            "metrics": [],
+            "grand_metrics": {},
+            "approximation": None,
+            "trends": [],
+            "row_count": None,
+            "other": None,
         }
+
+    def test_amounts_are_summed_in_cents(self, transaction_factory):
+        [first, second] = transaction_factory(2, amount="0.10")
+        Transaction.objects.filter(pk=second.pk).update(amount=Decimal("-0.30"))
+        Transaction.objects.bulk_update(
+            [Transaction(pk=first.pk, amount=Decimal("1234567890.99"))], ["amount"]
+        )
+        assert sorted(Transaction.objects.values_list("amount_cents", flat=True)) == [
+            -30,
+            123456789099,
+        ]
+
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR,
+            column_fields=[],
+            metrics=[ReportMetric.SUM, ReportMetric.AVG],
+        )
+        result = TransactionReportService.build_report(
+            Transaction.objects.all(), request
+        )
+
+        # The same strings as numeric sums of the amounts
+        assert result.grand_total == "1234567890.69"
+        assert result.grand_metrics == {"sum": "1234567890.69", "avg": "617283945.35"}
+
+    def test_metrics_for_cells_and_totals(self, sample_transactions):
+        qs = self._build_qs(sample_transactions)
+        request = TransactionReportRequest(
+            row_field=ReportDimension.TRANSACTION_TYPE,
+            column_fields=[ReportDimension.STATUS],
+            metrics=[ReportMetric.COUNT, ReportMetric.AVG, ReportMetric.P50],
+        )
+        result = TransactionReportService.build_report(qs, request)
+
+        assert result.metrics == ["count", "avg", "p50"]
+        rows = {row["row_key"]["transaction_type"]: row for row in result.data}
+        assert rows["invoice"]["row_metrics"] == {
+            "count": 2,
+            "avg": "87.50",
+            "p50": "87.50",
+        }
+        assert [cell["metrics"]["count"] for cell in rows["invoice"]["cells"]] == [
+            1,
+            1,
+        ]
+        assert result.column_totals[0] == {
+            "column_key": {"status": "unpaid"},
+            "total_amount": "125.00",
+            "metrics": {"count": 2, "avg": "62.50", "p50": "62.50"},
+        }
+        assert result.grand_metrics == {"count": 3, "avg": "75.00", "p50": "75.00"}
+        # Default output is unchanged by requesting metrics
+        assert rows["invoice"]["row_total"] == "175.00"
+        assert result.grand_total == "225.00"
+
+    def test_full_bernoulli_sample_matches_exact_report(self, sample_transactions):
+        """A 100% sample has nothing to scale, so intervals collapse to the total."""
+        qs = self._build_qs(sample_transactions)
+        request = TransactionReportRequest(
+            row_field=ReportDimension.TRANSACTION_TYPE,
+            column_fields=[ReportDimension.STATUS],
+            metrics=[ReportMetric.COUNT],
+            sampling=ReportSampling(percent=100, method=SampleMethod.BERNOULLI),
+        )
+        result = TransactionReportService.build_report(qs, request)
+
+        rows = {row["row_key"]["transaction_type"]: row for row in result.data}
+        assert rows["invoice"]["row_total"] == "175.00"
+        assert rows["invoice"]["row_total_ci"] == ["175.00", "175.00"]
+        assert rows["bill"]["cells"][0]["total_amount_ci"] == ["50.00", "50.00"]
+        assert result.grand_metrics == {"count": 3}
+        assert result.approximation == {
+            "method": "bernoulli",
+            "sample_percent": 100,
+            "confidence_level": 0.95,
+            "sample_count": 3,
+            "grand_total_ci": ["225.00", "225.00"],
+        }
+
+    def test_sample_scaling_and_interval(self):
+        sampling = ReportSampling(percent=50)
+        scaled = TransactionReportService._scale_sample(
+            {
+                "total_amount": Decimal("30.00"),
+                "sum_squares": Decimal("500.00"),
+                "sample_count": 2,
+                "metric_count": 2,
+            },
+            sampling,
+        )
+
+        # 30 / 0.5 = 60; margin = 1.96 * sqrt(0.5 * 500) / 0.5 = 61.98
+        assert scaled["total_amount"] == Decimal("60.00")
+        assert scaled["total_amount_ci"] == ["-1.98", "121.98"]
+        assert scaled["metric_count"] == 4
+
+    def test_derived_dimensions(self, transaction_factory):
+        transaction_factory(count=2, transaction_number_prefix="INV-", amount="99.99")
+        transaction_factory(
+            count=1, transaction_number_prefix="BILL-", amount="150.00", year=2019
+        )
+        transaction_factory(count=1, transaction_number="2025/5", amount="250.00")
+        request = TransactionReportRequest(
+            row_field=ReportDimension.TRANSACTION_NUMBER_PREFIX,
+            column_fields=[ReportDimension.DECADE, ReportDimension.AMOUNT_BUCKET],
+        )
+        result = TransactionReportService.build_report(
+            Transaction.objects.all(), request
+        )
+
+        assert [
+            (row["row_key"], [cell["column_key"] for cell in row["cells"]])
+            for row in result.data
+        ] == [
+            (
+                {"transaction_number_prefix": "2025/5"},
+                [{"decade": 2020, "amount_bucket": 200}],
+            ),
+            (
+                {"transaction_number_prefix": "BILL"},
+                [{"decade": 2010, "amount_bucket": 100}],
+            ),
+            (
+                {"transaction_number_prefix": "INV"},
+                [{"decade": 2020, "amount_bucket": 0}],
+            ),
+        ]
+        rows = {row["row_key"]["transaction_number_prefix"]: row for row in result.data}
+        assert rows["INV"]["row_total"] == "199.98"
+        assert result.grand_total == "599.98"
+
+    def test_trends_along_year_rows(self, transaction_factory):
+        transaction_factory(count=2, transaction_number_prefix="A-", year=2021)
+        transaction_factory(count=1, transaction_number_prefix="B-", year=2022)
+        transaction_factory(
+            count=3,
+            transaction_number_prefix="C-",
+            year=2022,
+            status=Transaction.Status.UNPAID,
+        )
+        # No 2023 transactions: 2024 is compared against nothing
+        transaction_factory(count=1, transaction_number_prefix="D-", year=2024)
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR,
+            column_fields=[ReportDimension.STATUS],
+            trends=list(ReportTrend),
+        )
+        result = TransactionReportService.build_report(
+            Transaction.objects.all(), request
+        )
+
+        assert result.trends == ["cumulative", "yoy", "yoy_pct"]
+        rows = {row["row_key"]["year"]: row for row in result.data}
+        assert rows[2021]["row_trends"] == {
+            "cumulative": "20.00",
+            "yoy": None,
+            "yoy_pct": None,
+        }
+        assert rows[2022]["row_trends"] == {
+            "cumulative": "60.00",
+            "yoy": "20.00",
+            "yoy_pct": "100.00",
+        }
+        assert rows[2024]["row_trends"] == {
+            "cumulative": "70.00",
+            "yoy": None,
+            "yoy_pct": None,
+        }
+        paid_2022, unpaid_2022 = rows[2022]["cells"]
+        assert paid_2022["trends"] == {
+            "cumulative": "30.00",
+            "yoy": "-10.00",
+            "yoy_pct": "-50.00",
+        }
+        assert unpaid_2022["trends"] == {
+            "cumulative": "30.00",
+            "yoy": None,
+            "yoy_pct": None,
+        }
+        # Column totals and the grand total are not grouped by year
+        assert all("trends" not in total for total in result.column_totals)
+
+    def test_trends_along_year_columns(self, transaction_factory):
+        transaction_factory(count=1, transaction_number_prefix="A-", year=2023)
+        transaction_factory(count=3, transaction_number_prefix="B-", year=2024)
+        request = TransactionReportRequest(
+            row_field=ReportDimension.TRANSACTION_TYPE,
+            column_fields=[ReportDimension.YEAR],
+            trends=[ReportTrend.YOY],
+        )
+        result = TransactionReportService.build_report(
+            Transaction.objects.all(), request
+        )
+
+        (row,) = result.data
+        assert [cell["trends"] for cell in row["cells"]] == [
+            {"yoy": None},
+            {"yoy": "20.00"},
+        ]
+        assert "row_trends" not in row
+        assert [total["trends"] for total in result.column_totals] == [
+            {"yoy": None},
+            {"yoy": "20.00"},
+        ]
+
+    def test_sample_scaling_of_trends(self):
+        scaled = TransactionReportService._scale_sample(
+            {
+                "total_amount": Decimal("30.00"),
+                "sum_squares": Decimal("500.00"),
+                "sample_count": 2,
+                "trend_cumulative": Decimal("45.00"),
+                "trend_yoy": None,
+                "trend_yoy_pct": Decimal("50.00"),
+            },
+            ReportSampling(percent=50),
+        )
+
+        assert scaled["trend_cumulative"] == Decimal("90.00")
+        assert scaled["trend_yoy"] is None
+        assert scaled["trend_yoy_pct"] == Decimal("50.00")
+
+    def test_request_round_trips_through_dict(self):
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR,
+            column_fields=[ReportDimension.STATUS],
+            metrics=[ReportMetric.COUNT],
+            sampling=ReportSampling(percent=10, method=SampleMethod.BERNOULLI),
+            trends=[ReportTrend.CUMULATIVE, ReportTrend.YOY_PCT],
+            rows=ReportRowSelection(
+                RowSort.COLUMN, descending=True, column=("paid",), limit=5, other=True
+            ),
+        )
+
+        assert (
+            TransactionReportRequest.from_dict(dataclasses.asdict(request)) == request
+        )
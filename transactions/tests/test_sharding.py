@@ -0,0 +1,350 @@
+import dataclasses
+from decimal import Decimal
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.urls import reverse
+
+from transactions import mirror as mirror_module
+from transactions import snapshot as snapshot_module
+from transactions.archive import archive_transactions, with_archive
+from transactions.filters import TransactionFilters
+from transactions.models import ArchivedTransaction, Transaction
+from transactions.services import (
+    ReportDimension,
+    ReportMetric,
+    ReportSampling,
+    ReportTrend,
+    SampleMethod,
+    TransactionReportRequest,
+    TransactionReportService,
+)
+from transactions.sharding import (
+    ShardedResults,
+    get_shards,
+    shard_for_year,
+    shard_querysets,
+)
+
+from .conftest import SHARD_ALIAS
+
+SHARDS = ["default:-2021", f"{SHARD_ALIAS}:2022-"]
+
+sharded_db = pytest.mark.django_db(transaction=True, databases=["default", SHARD_ALIAS])
+
+
+@pytest.fixture
+def shards(settings):
+    settings.TRANSACTION_SHARDS = SHARDS
+
+
+def _move_to_shards():
+    """Move the transactions of the years owned by the shard to it."""
+    for model in (Transaction, ArchivedTransaction):
+        recent = model.objects.filter(year__gte=2022)
+        model.objects.using(SHARD_ALIAS).bulk_create(recent)
+        recent.delete()
+
+
+def _report(params, request):
+    filters = TransactionFilters.from_params(params)
+    queryset = filters.apply(with_archive(Transaction.objects.all(), filters))
+    return dataclasses.asdict(
+        TransactionReportService.build_report(queryset, request, filters)
+    )
+
+
+REPORTS = [
+    (
+        {},
+        TransactionReportRequest(
+            row_field=ReportDimension.TRANSACTION_TYPE,
+            column_fields=[ReportDimension.STATUS],
+            metrics=list(ReportMetric),
+        ),
+    ),
+    (
+        {"status": "!paid", "year_min": "2020"},
+        TransactionReportRequest(
+            row_field=ReportDimension.TRANSACTION_TYPE,
+            column_fields=[ReportDimension.YEAR],
+            metrics=[ReportMetric.COUNT, ReportMetric.P99],
+            trends=list(ReportTrend),
+        ),
+    ),
+    (
+        {"year": "2020,2023", "amount_min": "100.5"},
+        TransactionReportRequest(
+            row_field=ReportDimension.TRANSACTION_NUMBER_PREFIX,
+            column_fields=[ReportDimension.DECADE, ReportDimension.AMOUNT_BUCKET],
+            metrics=[ReportMetric.AVG, ReportMetric.P50],
+        ),
+    ),
+    (
+        {"year_min": "2022"},
+        TransactionReportRequest(
+            row_field=ReportDimension.YEAR,
+            column_fields=[],
+            metrics=[ReportMetric.SUM, ReportMetric.MIN, ReportMetric.MAX],
+            trends=[ReportTrend.YOY_PCT],
+        ),
+    ),
+    (
+        {"amount_min": "100000"},
+        TransactionReportRequest(
+            row_field=ReportDimension.STATUS, column_fields=[ReportDimension.YEAR]
+        ),
+    ),
+    (
+        {},
+        TransactionReportRequest(
+            row_field=ReportDimension.STATUS,
+            column_fields=[ReportDimension.TRANSACTION_TYPE],
+            sampling=ReportSampling(percent=100, method=SampleMethod.BERNOULLI),
+        ),
+    ),
+]
+
+
+@sharded_db
+class TestShardedReports:
+    def test_reports_match_a_single_database(self, settings, varied_transactions):
+        archive_transactions(2020)
+        expected = [_report(params, request) for params, request in REPORTS]
+
+        _move_to_shards()
+        settings.TRANSACTION_SHARDS = SHARDS
+
+        assert Transaction.objects.using(SHARD_ALIAS).count() == 60
+        assert [_report(params, request) for params, request in REPORTS] == expected
+
+    def test_columnar_sources_read_every_shard(
+        self, settings, tmp_path, varied_transactions
+    ):
+        request = TransactionReportRequest(
+            row_field=ReportDimension.YEAR,
+            column_fields=[ReportDimension.STATUS],
+            metrics=[ReportMetric.COUNT, ReportMetric.P90],
+        )
+        expected = _report({}, request)
+        _move_to_shards()
+        settings.TRANSACTION_SHARDS = SHARDS
+
+        settings.REPORT_SNAPSHOT_PATH = str(tmp_path / "report.snapshot")
+        settings.REPORT_SNAPSHOT_MAX_STALENESS = 3600
+        assert snapshot_module.refresh_report_snapshot().rows == 120
+        try:
+            assert _report({}, request) == expected
+        finally:
+            snapshot_module._published.pop(settings.REPORT_SNAPSHOT_PATH, None)
+        settings.REPORT_SNAPSHOT_PATH = None
+
+        pytest.importorskip("duckdb")
+        settings.REPORT_MIRROR_PATH = str(tmp_path / "mirror.duckdb")
+        settings.REPORT_MIRROR_MAX_STALENESS = 3600
+        try:
+            assert mirror_module.refresh_report_mirror().upserted == 120
+            # Same ids on both shards are different transactions
+            Transaction.objects.using(SHARD_ALIAS).filter(year=2023).delete()
+            Transaction.objects.filter(year=2019).update(status="paid")
+            assert mirror_module.refresh_report_mirror().deleted == 20
+            settings.REPORT_MIRROR_PATH = None
+            expected = _report({}, request)
+            settings.REPORT_MIRROR_PATH = str(tmp_path / "mirror.duckdb")
+            assert _report({}, request) == expected
+        finally:
+            mirror_module._mirrors.pop(str(tmp_path / "mirror.duckdb")).close()
+
+    def test_report_endpoint(self, client, shards):
+        Transaction.objects.create(
+            transaction_type="bill",
+            status="paid",
+            transaction_number="B-1",
+            amount=Decimal("10.00"),
+            year=2020,
+        )
+        Transaction.objects.create(
+            transaction_type="bill",
+            status="paid",
+            transaction_number="B-1",
+            amount=Decimal("2.50"),
+            year=2024,
+        )
+
+        response = client.get(reverse("transaction-report"), {"row_field": "year"})
+
+        assert response.status_code == 200
+        assert response.json()["grand_total"] == "12.50"
+
+
+@sharded_db
+class TestShardedList:
+    def test_pages_through_shards_in_order(self, client, shards, varied_transactions):
+        _move_to_shards()
+        expected = [
+            number
+            for _, number in sorted(
+                (-row.year, row.transaction_number) for row in varied_transactions
+            )
+        ]
+
+        numbers = []
+        for page in range(1, 9):
+            response = client.get(
+                reverse("transaction-list"),
+                {"page": page, "page_size": 17, "fields": "transaction_number"},
+            )
+            assert response.status_code == 200
+            assert response.json()["count"] == 120
+            numbers += [row["transaction_number"] for row in response.json()["results"]]
+        assert numbers == expected
+
+    def test_filters_pick_the_shards(self, shards):
+        filters = TransactionFilters.from_params({"year_min": "2023"})
+        assert [
+            qs.db for qs in shard_querysets(Transaction.objects.all(), filters)
+        ] == [SHARD_ALIAS]
+        filters = TransactionFilters.from_params({"year": "!2022,2023,2024"})
+        assert [
+            qs.db for qs in shard_querysets(Transaction.objects.all(), filters)
+        ] == [
+            SHARD_ALIAS,
+            "default",
+        ]
+        filters = TransactionFilters.from_params({"year": "2025", "year_max": "2021"})
+        assert len(shard_querysets(Transaction.objects.all(), filters)) == 1
+
+    def test_sharded_results_slices(self, shards, transaction_factory):
+        transaction_factory(3, year=2020)
+        transaction_factory(2, year=2024, start_index=3)
+        results = ShardedResults(
+            shard_querysets(
+                Transaction.objects.order_by("-year", "transaction_number").values_list(
+                    "transaction_number", flat=True
+                ),
+                TransactionFilters(),
+            )
+        )
+
+        assert len(results) == 5
+        assert results[1:4] == ["INV-4", "INV-0", "INV-1"]
+        assert results[4] == "INV-2"
+        with pytest.raises(IndexError):
+            results[5]
+
+
+@sharded_db
+class TestShardRouting:
+    def test_writes_go_to_the_owning_shard(self, shards):
+        recent = Transaction.objects.create(
+            transaction_type="bill",
+            status="unpaid",
+            transaction_number="B-1",
+            amount=Decimal("1.00"),
+            year=2022,
+        )
+        old = Transaction(
+            transaction_type="bill",
+            status="unpaid",
+            transaction_number="B-2",
+            amount=Decimal("1.00"),
+            year=2021,
+        )
+        old.save()
+
+        assert recent._state.db == SHARD_ALIAS
+        assert old._state.db == "default"
+        loaded = Transaction.objects.using(SHARD_ALIAS).get()
+        loaded.status = "paid"
+        loaded.save()
+        assert Transaction.objects.using(SHARD_ALIAS).get().status == "paid"
+        assert not Transaction.objects.filter(status="paid").exists()
+
+    def test_change_feed_merges_every_shard(self, client, shards, settings):
+        settings.CHANGE_FEED_SAFETY_LAG = 0
+        for number, year in (("OLD-1", 2020), ("NEW-1", 2023), ("NEW-2", 2024)):
+            Transaction.objects.create(
+                transaction_type="bill",
+                status="unpaid",
+                transaction_number=number,
+                amount=Decimal("1.00"),
+                year=year,
+            )
+        Transaction.objects.using(SHARD_ALIAS).filter(
+            transaction_number="NEW-1"
+        ).delete()
+
+        events, cursor = [], None
+        while True:
+            params = {"page_size": 1, **({"since": cursor} if cursor else {})}
+            page = client.get(reverse("transaction-changes"), params).json()
+            events += page["results"]
+            cursor = page["next_cursor"]
+            if not page["has_more"]:
+                break
+
+        assert [(e["op"], e["shard"], e["transaction_number"]) for e in events] == [
+            ("upsert", "default", "OLD-1"),
+            ("upsert", SHARD_ALIAS, "NEW-2"),
+            ("delete", SHARD_ALIAS, "NEW-1"),
+        ]
+        later = client.get(reverse("transaction-changes"), {"since": cursor}).json()
+        assert later["results"] == []
+
+    def test_bulk_status_updates_every_shard(self, admin_client, shards):
+        for year in (2020, 2024):
+            Transaction.objects.create(
+                transaction_type="bill",
+                status="unpaid",
+                transaction_number=f"B-{year}",
+                amount=Decimal("1.00"),
+                year=year,
+            )
+
+        by_numbers = admin_client.patch(
+            reverse("transaction-bulk-status"),
+            {"status": "paid", "transaction_numbers": ["B-2020", "B-2024"]},
+            content_type="application/json",
+        )
+        by_filters = admin_client.patch(
+            reverse("transaction-bulk-status"),
+            {"status": "partially_paid", "filters": {"year_min": "2019"}},
+            content_type="application/json",
+        )
+
+        assert by_numbers.json() == {"matched": 2, "changed": 2}
+        assert by_filters.json() == {"matched": 2, "changed": 2}
+        assert Transaction.objects.using(SHARD_ALIAS).get().status == "partially_paid"
+
+    def test_load_and_archive_commands(self, shards, tmp_path):
+        path = tmp_path / "transactions.json"
+        path.write_text(
+            '[{"transaction_type": "bill", "status": "paid", '
+            '"transaction_number": "B-1", "amount": "1.00", "year": 2018},'
+            '{"transaction_type": "bill", "status": "paid", '
+            '"transaction_number": "B-2", "amount": "2.00", "year": 2023}]'
+        )
+        call_command("load_transactions", path=str(path))
+        assert shard_for_year(2023) == SHARD_ALIAS
+        assert Transaction.objects.using(SHARD_ALIAS).get().transaction_number == "B-2"
+
+        call_command("archive_transactions", before_year=2024, no_vacuum=True)
+        assert ArchivedTransaction.objects.get().year == 2018
+        assert ArchivedTransaction.objects.using(SHARD_ALIAS).get().year == 2023
+
+
+@pytest.mark.parametrize(
+    "entries",
+    [
+        ["default:-2019", f"{SHARD_ALIAS}:2021-"],
+        ["default:-2019", f"{SHARD_ALIAS}:2019-"],
+        ["default:2000-", f"{SHARD_ALIAS}:-1999", "default:1990-1995"],
+        ["default:-2019", "missing:2020-"],
+        ["default:2019"],
+    ],
+)
+def test_invalid_shard_settings(settings, entries):
+    settings.TRANSACTION_SHARDS = entries
+    with pytest.raises(ImproperlyConfigured):
+        get_shards()
@@ -0,0 +1,214 @@
+import dataclasses
+import tracemalloc
+from decimal import Decimal
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+
+from transactions import snapshot as snapshot_module
+from transactions.archive import archive_transactions, with_archive
+from transactions.filters import TransactionFilters
+from transactions.models import Transaction
+from transactions.services import (
+    ReportDimension,
+    ReportMetric,
+    ReportSampling,
+    ReportTrend,
+    SampleMethod,
+    TransactionReportRequest,
+    TransactionReportService,
+)
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def snapshot_path(settings, tmp_path):
+    settings.REPORT_SNAPSHOT_PATH = str(tmp_path / "report.snapshot")
+    settings.REPORT_SNAPSHOT_MAX_STALENESS = 3600
+    yield settings.REPORT_SNAPSHOT_PATH
+    snapshot_module._published.pop(settings.REPORT_SNAPSHOT_PATH, None)
+
+
+def _report(params, request, use_snapshot=True):
+    filters = TransactionFilters.from_params(params)
+    queryset = filters.apply(with_archive(Transaction.objects.all(), filters))
+    return TransactionReportService.build_report(
+        queryset, request, filters if use_snapshot else None
+    )
+
+
+@pytest.mark.django_db
+class TestReportSnapshot:
+    @pytest.mark.parametrize(
+        ("params", "request_"),
+        [
+            (
+                {},
+                TransactionReportRequest(
+                    row_field=ReportDimension.TRANSACTION_TYPE,
+                    column_fields=[ReportDimension.STATUS],
+                    metrics=list(ReportMetric),
+                ),
+            ),
+            (
+                {"year": "2020,2022", "amount_min": "100.5", "amount_max": "900"},
+                TransactionReportRequest(
+                    row_field=ReportDimension.TRANSACTION_NUMBER_PREFIX,
+                    column_fields=[
+                        ReportDimension.DECADE,
+                        ReportDimension.AMOUNT_BUCKET,
+                    ],
+                    metrics=[ReportMetric.AVG, ReportMetric.P90],
+                ),
+            ),
+            (
+                {"status": "!paid", "year_min": "2020"},
+                TransactionReportRequest(
+                    row_field=ReportDimension.TRANSACTION_TYPE,
+                    column_fields=[ReportDimension.YEAR],
+                    metrics=[ReportMetric.COUNT, ReportMetric.P99],
+                    trends=list(ReportTrend),
+                ),
+            ),
+            (
+                {"transaction_type": "bill", "year": "!2021", "year_max": "2023"},
+                TransactionReportRequest(
+                    row_field=ReportDimension.YEAR,
+                    column_fields=[],
+                    metrics=[ReportMetric.MIN, ReportMetric.MAX, ReportMetric.P50],
+                    trends=[ReportTrend.CUMULATIVE, ReportTrend.YOY_PCT],
+                ),
+            ),
+            (
+                {"amount_min": "5000"},
+                TransactionReportRequest(
+                    row_field=ReportDimension.STATUS,
+                    column_fields=[ReportDimension.YEAR],
+                    metrics=list(ReportMetric),
+                ),
+            ),
+        ],
+    )
+    def test_matches_postgres(
+        self, snapshot_path, monkeypatch, varied_transactions, params, request_
+    ):
+        # Groups span several chunks
+        monkeypatch.setattr(snapshot_module, "CHUNK_ROWS", 3)
+        archive_transactions(2021)
+        Transaction.objects.create(
+            transaction_type="bill",
+            status="unpaid",
+            transaction_number="NODASH",
+            amount=Decimal("0.05"),
+            year=2022,
+        )
+        snapshot_module.build_report_snapshot(snapshot_path)
+
+        assert dataclasses.asdict(_report(params, request_)) == dataclasses.asdict(
+            _report(params, request_, use_snapshot=False)
+        )
+
+    def test_stale_or_missing_snapshot_falls_back_to_postgres(
+        self, settings, snapshot_path, varied_transactions
+    ):
+        request = TransactionReportRequest(
+            row_field=ReportDimension.STATUS, column_fields=[]
+        )
+        before = _report({}, request, use_snapshot=False)
+        assert _report({}, request) == before
+
+        snapshot_module.build_report_snapshot(snapshot_path)
+        Transaction.objects.filter(year=2019).delete()
+        after = _report({}, request, use_snapshot=False)
+        assert after.grand_total != before.grand_total
+        # Within the staleness bound the (now outdated) snapshot answers
+        assert _report({}, request) == before
+
+        settings.REPORT_SNAPSHOT_MAX_STALENESS = 0
+        assert _report({}, request) == after
+
+    def test_sampled_reports_use_postgres(self, snapshot_path, varied_transactions):
+        snapshot_module.build_report_snapshot(snapshot_path)
+        Transaction.objects.filter(year=2019).delete()
+        request = TransactionReportRequest(
+            row_field=ReportDimension.STATUS,
+            column_fields=[],
+            sampling=ReportSampling(percent=100, method=SampleMethod.BERNOULLI),
+        )
+
+        assert _report({}, request).grand_total == (
+            _report({}, request, use_snapshot=False).grand_total
+        )
+
+    def test_workers_pick_up_new_versions(self, snapshot_path, transaction_factory):
+        transaction_factory(2, amount="10.00")
+        assert snapshot_module.build_report_snapshot(snapshot_path).version == 1
+        first = snapshot_module.get_report_snapshot()
+        assert first.rows == 2
+        assert snapshot_module.get_report_snapshot() is first
+
+        transaction_factory(1, amount="5.00", start_index=2)
+        assert snapshot_module.build_report_snapshot(snapshot_path).version == 2
+        second = snapshot_module.get_report_snapshot()
+        assert (second.version, second.rows) == (2, 3)
+
+        # A report still holding the previous version keeps reading it
+        [grand] = first.aggregate(TransactionFilters(), "status", [], [], [])[-1:]
+        assert grand["total_amount"] == Decimal("20.00")
+
+    def test_aggregates_in_bounded_chunks(self, snapshot_path, monkeypatch):
+        rows = 40_000
+        Transaction.objects.bulk_create(
+            Transaction(
+                transaction_type="invoice" if index % 2 else "bill",
+                status="paid",
+                transaction_number=f"INV-{index}",
+                amount=Decimal(index % 1000),
+                year=2020 + index % 5,
+            )
+            for index in range(rows)
+        )
+        snapshot_module.build_report_snapshot(snapshot_path)
+        snapshot = snapshot_module.get_report_snapshot()
+        filters = TransactionFilters.from_params({"year_min": "2021"})
+        monkeypatch.setattr(snapshot_module, "CHUNK_ROWS", 256)
+
+        # Memory accounting may already be tracing
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = snapshot.aggregate(
+                filters, "transaction_type", ["year"], ["count"], []
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+        assert result[-1]["metric_count"] == rows * 4 // 5
+        # Working memory follows the chunk size, not the number of rows
+        assert peak - before < rows * 8 // 4
+
+    def test_report_endpoint_uses_snapshot(
+        self, client, snapshot_path, sample_transactions
+    ):
+        call_command("build_report_snapshot")
+        Transaction.objects.filter(status="paid").delete()
+
+        response = client.get(
+            reverse("transaction-report"),
+            {"row_field": "transaction_type", "status": "paid"},
+        )
+
+        assert response.status_code == 200
+        assert response.json()["grand_total"] == "100.00"
+
+    def test_command_requires_a_path(self, settings):
+        settings.REPORT_SNAPSHOT_PATH = None
+        with pytest.raises(CommandError, match="REPORT_SNAPSHOT_PATH"):
+            call_command("build_report_snapshot")
@@ -0,0 +1,132 @@
+import json
+import os
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+
+from transactions import tracing
+
+
+@pytest.fixture
+def trace_log(settings, tmp_path):
+    settings.TRACE_LOG_PATH = str(tmp_path / "traces.jsonl")
+    settings.TRACE_SAMPLE_RATE = 1.0
+    settings.TRACE_SLOW_THRESHOLD = 60.0
+    yield settings.TRACE_LOG_PATH
+    tracing._logs.pop(settings.TRACE_LOG_PATH, None)
+
+
+def _traces(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+@pytest.mark.django_db
+class TestTracing:
+    def test_records_spans_of_sampled_requests(
+        self, client, trace_log, sample_transactions
+    ):
+        response = client.get(reverse("transaction-list"), {"status": "unpaid"})
+
+        assert response.status_code == 200
+        [trace] = _traces(trace_log)
+        assert trace["view"] == "transaction-list"
+        assert (trace["method"], trace["status"], trace["slow"]) == ("GET", 200, False)
+        assert trace["plans"] == []
+        spans = trace["spans"]
+        assert spans[0]["name"] == "view" and spans[0]["parent"] is None
+        names = [span["name"] for span in spans]
+        assert {"filters", "sql", "serialize"} <= set(names)
+        statements = [span for span in spans if span["name"] == "sql"]
+        assert all(span["alias"] == "default" for span in statements)
+        assert any("transactions_transaction" in span["sql"] for span in statements)
+        assert all(span["duration_ms"] >= 0 for span in spans)
+
+    def test_slow_requests_capture_plans(
+        self, client, settings, trace_log, sample_transactions
+    ):
+        settings.TRACE_SLOW_THRESHOLD = 0
+        settings.TRACE_EXPLAIN_STATEMENTS = 1
+
+        response = client.get(
+            reverse("transaction-report"), {"row_field": "status", "year": "2024"}
+        )
+
+        assert response.status_code == 200
+        [trace] = _traces(trace_log)
+        assert trace["slow"] is True
+        [plan] = trace["plans"]
+        explained = trace["spans"][plan["span"]]
+        assert explained["name"] == "sql"
+        assert explained["sql"].startswith("SELECT")
+        assert "Execution Time" in plan["plan"][0]
+        assert "Shared Hit Blocks" in plan["plan"][0]["Plan"]
+        names = {span["name"] for span in trace["spans"]}
+        assert {"build_report", "aggregate", "serialize"} <= names
+
+    def test_writes_are_not_explained(
+        self, admin_client, settings, trace_log, sample_transactions
+    ):
+        settings.TRACE_SLOW_THRESHOLD = 0
+
+        admin_client.patch(
+            reverse("transaction-bulk-status"),
+            {"status": "paid", "filters": {"year": "2024"}},
+            content_type="application/json",
+        )
+
+        [trace] = _traces(trace_log)
+        explained = [trace["spans"][plan["span"]]["sql"] for plan in trace["plans"]]
+        assert explained
+        assert all(sql.startswith("SELECT") for sql in explained)
+        # Outside the report aggregation statements are only planned
+        assert all("Execution Time" not in plan["plan"][0] for plan in trace["plans"])
+
+    def test_replays_take_no_advisory_locks(
+        self, client, settings, trace_log, sample_transactions
+    ):
+        settings.TRACE_SLOW_THRESHOLD = 0
+        settings.TRACE_EXPLAIN_STATEMENTS = 100
+        settings.REPORT_MAX_CONCURRENCY = 1
+
+        for _ in range(3):
+            response = client.get(
+                reverse("transaction-report"), {"row_field": "status", "year": "2024"}
+            )
+            assert response.status_code == 200
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'")
+            assert cursor.fetchone()[0] == 0
+        for trace in _traces(trace_log):
+            explained = [trace["spans"][plan["span"]]["sql"] for plan in trace["plans"]]
+            assert explained
+            assert not any("pg_try_advisory_lock" in sql for sql in explained)
+
+    def test_unsampled_requests_are_not_traced(
+        self, client, settings, trace_log, sample_transactions
+    ):
+        settings.TRACE_SAMPLE_RATE = 0
+
+        client.get(reverse("transaction-list"))
+
+        assert not os.path.exists(trace_log)
+
+
+def test_trace_span_outside_a_trace():
+    with tracing.trace_span("filters") as span:
+        assert span is None
+
+
+def test_trace_log_rotates(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    log = tracing.TraceLog(path, max_bytes=100, backup_count=2)
+
+    for index in range(5):
+        log.write({"index": index, "padding": "x" * 40})
+
+    assert _traces(path) == [{"index": 4, "padding": "x" * 40}]
+    assert _traces(f"{path}.1")[0]["index"] == 3
+    assert _traces(f"{path}.2")[0]["index"] == 2
+    assert not (tmp_path / "traces.jsonl.3").exists()
@@ -0,0 +1,313 @@
+"""Sampled request tracing to a local JSONL file.
+
+``TracingMiddleware`` traces a ``TRACE_SAMPLE_RATE`` share of the requests:
+``trace_span`` blocks (the view, filter parsing, report building and
+aggregation, serialization) and every SQL statement become spans of the
+request's trace, which is appended as one JSON line to ``TRACE_LOG_PATH``.
+Untraced requests only pay for one random number.
+With ``MEMORY_ACCOUNTING`` on, spans and traces also carry their memory
+figures (see ``memory``).
+
+Traced requests taking ``TRACE_SLOW_THRESHOLD`` seconds or more also get the
+plans of their slowest ``SELECT`` statements, captured once the response is
+sent. Statements of the report aggregation are run again for their
+``EXPLAIN (ANALYZE, BUFFERS)`` plans, others are only planned, and statements
+calling functions with side effects (advisory locks, sequences) are skipped.
+
+The file is rotated at ``TRACE_LOG_MAX_BYTES`` keeping
+``TRACE_LOG_BACKUP_COUNT`` old files; writers in several worker processes
+take turns through an exclusive ``flock`` on it.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .admission import statement_timeout
+from .memory import memory_stage
+
+logger = logging.getLogger(__name__)
+
+# Statements recorded per trace; bulk writes can run thousands
+MAX_STATEMENTS = 500
+
+# Statements of these spans are read-only queries, explained with ANALYZE
+ANALYZED_SPANS = {"aggregate"}
+
+# Calls that change state even in a SELECT, so are never run again
+SIDE_EFFECTS = re.compile(r"\b(?:pg_\w*lock\w*|nextval|setval)\s*\(", re.IGNORECASE)
+
+
+@dataclass
+class Span:
+    id: int
+    parent: int | None
+    name: str
+    start: float
+    duration: float | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self, origin: float) -> dict:
+        return {
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": (
+                None if self.duration is None else round(self.duration * 1000, 3)
+            ),
+            **self.attributes,
+        }
+
+
+@dataclass
+class Statement:
+    span: Span
+    alias: str
+    sql: str
+    params: Any
+    analyze: bool = False
+
+
+class Trace:
+    """Spans of one request. Spans nest in the order they are opened, so a
+    trace is only recorded from the thread handling the request.
+    """
+
+    def __init__(self, **attributes: Any) -> None:
+        self.id = uuid.uuid4().hex
+        self.timestamp = timezone.now()
+        self.attributes = attributes
+        self.spans: list[Span] = []
+        self.statements: list[Statement] = []
+        self.dropped_statements = 0
+        self.plans: list[dict] = []
+        self._open: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = Span(
+            id=len(self.spans),
+            parent=self._open[-1].id if self._open else None,
+            name=name,
+            start=time.perf_counter(),
+            attributes=attributes,
+        )
+        self.spans.append(span)
+        self._open.append(span)
+        try:
+            yield span
+        finally:
+            self._open.pop()
+            span.duration = time.perf_counter() - span.start
+
+    def record_sql(self, alias: str):
+        """``execute_wrapper`` recording the statements run on ``alias``."""
+
+        def wrapper(execute, sql, params, many, context):
+            if len(self.statements) >= MAX_STATEMENTS:
+                self.dropped_statements += 1
+                return execute(sql, params, many, context)
+            analyze = any(span.name in ANALYZED_SPANS for span in self._open)
+            with self.span("sql", alias=alias, sql=sql, many=many) as span:
+                try:
+                    return execute(sql, params, many, context)
+                except Exception as exc:
+                    span.attributes["error"] = type(exc).__name__
+                    raise
+                finally:
+                    self.statements.append(Statement(span, alias, sql, params, analyze))
+
+        return wrapper
+
+    @property
+    def duration(self) -> float:
+        root = self.spans[0]
+        return root.duration or 0.0
+
+    def as_dict(self) -> dict:
+        origin = self.spans[0].start
+        return {
+            "trace_id": self.id,
+            "timestamp": self.timestamp.isoformat(),
+            **self.attributes,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [span.as_dict(origin) for span in self.spans],
+            "dropped_statements": self.dropped_statements,
+            "plans": self.plans,
+        }
+
+
+_current: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+
+@contextmanager
+def trace_span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Record the block as a span of the current request's trace, if traced,
+    and as a stage of its memory account, if accounted (see ``memory``).
+    """
+    trace = _current.get()
+    with ExitStack() as stack:
+        span = stack.enter_context(trace.span(name, **attributes)) if trace else None
+        stage = stack.enter_context(memory_stage(name))
+        yield span
+    if span is not None and stage is not None:
+        span.attributes.update(memory_peak=stage.peak, memory_retained=stage.retained)
+
+
+def capture_plans(trace: Trace, limit: int) -> None:
+    """Attach the plans of the ``limit`` slowest ``SELECT`` statements of
+    ``trace``. ``ANALYZE`` executes the statement, so it is only used for
+    those of the report aggregation; statements with side effects are
+    skipped altogether.
+    """
+    statements = sorted(
+        (
+            statement
+            for statement in trace.statements
+            if not statement.span.attributes["many"]
+            and "error" not in statement.span.attributes
+            and statement.sql.lstrip()[:6].upper() == "SELECT"
+            and not SIDE_EFFECTS.search(statement.sql)
+        ),
+        key=lambda statement: statement.span.duration or 0.0,
+        reverse=True,
+    )
+    for statement in statements[:limit]:
+        plan: dict[str, Any] = {"span": statement.span.id}
+        options = "ANALYZE, BUFFERS, " if statement.analyze else ""
+        try:
+            with (
+                statement_timeout(settings.REPORT_STATEMENT_TIMEOUT, statement.alias),
+                connections[statement.alias].cursor() as cursor,
+            ):
+                cursor.execute(
+                    f"EXPLAIN ({options}FORMAT JSON) {statement.sql}",
+                    statement.params,
+                )
+                plan["plan"] = cursor.fetchone()[0]
+        except DatabaseError as exc:
+            plan["error"] = str(exc).strip()
+        trace.plans.append(plan)
+
+
+class TraceLog:
+    """Append-only JSONL file rotated by size."""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = (json.dumps(record, default=str) + "\n").encode()
+        with self._lock:
+            while True:
+                with open(self.path, "ab") as file:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                    if not self._is_current(file):
+                        continue  # rotated by another process meanwhile
+                    size = os.fstat(file.fileno()).st_size
+                    if size and size + len(line) > self.max_bytes:
+                        self._rotate()
+                        continue
+                    file.write(line)
+                    return
+
+    def _is_current(self, file) -> bool:
+        try:
+            return os.stat(self.path).st_ino == os.fstat(file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _rotate(self) -> None:
+        if self.backup_count < 1:
+            os.unlink(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+_logs: dict[str, TraceLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_trace_log() -> TraceLog | None:
+    """The configured trace log, or ``None`` if tracing is off."""
+    path = settings.TRACE_LOG_PATH
+    if not path:
+        return None
+    with _logs_lock:
+        if path not in _logs:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            _logs[path] = TraceLog(
+                path, settings.TRACE_LOG_MAX_BYTES, settings.TRACE_LOG_BACKUP_COUNT
+            )
+        return _logs[path]
+
+
+class TracingMiddleware:
+    """Traces sampled requests (see the module docstring). Installed last, so
+    its root span covers the view and the rendering of its response.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        log = get_trace_log()
+        if log is None or random.random() >= settings.TRACE_SAMPLE_RATE:
+            return self.get_response(request)
+
+        trace = Trace(method=request.method, path=request.path, view=None)
+        token = _current.set(trace)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(trace.record_sql(connection.alias))
+                    )
+                with trace.span("view"):
+                    response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        trace.attributes["status"] = response.status_code
+        account = getattr(request, "memory_account", None)
+        if account is not None:
+            trace.attributes["memory"] = account.as_dict()
+        trace.attributes["slow"] = trace.duration >= settings.TRACE_SLOW_THRESHOLD
+        # Plans and the log write wait until the response is sent
+        response._resource_closers.append(lambda: self.finish(trace, log))
+        return response
+
+    def finish(self, trace: Trace, log: TraceLog) -> None:
+        if trace.attributes["slow"]:
+            capture_plans(trace, settings.TRACE_EXPLAIN_STATEMENTS)
+        try:
+            log.write(trace.as_dict())
+        except OSError:
+            logger.exception("Cannot write trace %s to %s", trace.id, log.path)
+
+    def process_view(self, request, view_func, view_args, view_kwargs) -> None:
+        trace = _current.get()
+        if trace is not None:
+            trace.attributes["view"] = request.resolver_match.view_name
@@ -1,12 +1,39 @@
 from django.urls import path
 
-from .views import TransactionListView, TransactionReportView
+from .views import (
+    TransactionBulkStatusView,
+    TransactionChangesView,
+    TransactionListView,
+    TransactionReportJobCreateView,
+    TransactionReportJobDetailView,
+    TransactionReportView,
+)
 
 urlpatterns = [
     path("transactions/", TransactionListView.as_view(), name="transaction-list"),
+    path(
+        "transactions/bulk-status/",
+        TransactionBulkStatusView.as_view(),
+        name="transaction-bulk-status",
+    ),
+    path(
+        "transactions/changes/",
+        TransactionChangesView.as_view(),
+        name="transaction-changes",
+    ),
     path(
         "transactions/report/",
         TransactionReportView.as_view(),
         name="transaction-report",
     ),
+    path(
+        "transactions/report/jobs/",
+        TransactionReportJobCreateView.as_view(),
+        name="transaction-report-jobs",
+    ),
+    path(
+        "transactions/report/jobs/<uuid:job_id>/",
+        TransactionReportJobDetailView.as_view(),
+        name="transaction-report-job-detail",
+    ),
 ]
@@ -1,4 +1,14 @@
+from .bulk import TransactionBulkStatusView
+from .changes import TransactionChangesView
+from .jobs import TransactionReportJobCreateView, TransactionReportJobDetailView
 from .list import TransactionListView
 from .report import TransactionReportView
 
-__all__ = ["TransactionListView", "TransactionReportView"]
+__all__ = [
+    "TransactionBulkStatusView",
+    "TransactionChangesView",
+    "TransactionListView",
+    "TransactionReportJobCreateView",
+    "TransactionReportJobDetailView",
+    "TransactionReportView",
+]
@@ -1,10 +1,18 @@
+from collections.abc import Mapping
+from typing import Any
+
 from django.conf import settings
 from django.db.models import QuerySet
 from rest_framework import generics
+from rest_framework.exceptions import ParseError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.schemas.openapi import AutoSchema
 
+from ..archive import with_archive
+from ..filters import FilterError, TransactionFilters
 from ..models import Transaction
+from ..sharding import shard_querysets
+from ..tracing import trace_span
 
 
 class TransactionFilterSchema(AutoSchema):
@@ -21,28 +29,64 @@ class TransactionFilterSchema(AutoSchema):
                     "name": "transaction_type",
                     "in": "query",
                     "required": False,
-                    "description": "Filter by transaction type.",
-                    "schema": {
-                        "type": "string",
-                        "enum": list(Transaction.TransactionType.values),
-                    },
+                    "description": (
+                        "Filter by transaction type. Accepts a comma-separated list "
+                        f"from {','.join(Transaction.TransactionType.values)}; "
+                        "prefix the list with '!' to exclude those types "
+                        "(e.g. !bill,direct_expense)."
+                    ),
+                    "schema": {"type": "string"},
                 },
                 {
                     "name": "status",
                     "in": "query",
                     "required": False,
-                    "description": "Filter by payment status.",
-                    "schema": {
-                        "type": "string",
-                        "enum": list(Transaction.Status.values),
-                    },
+                    "description": (
+                        "Filter by payment status. Accepts a comma-separated list "
+                        f"from {','.join(Transaction.Status.values)}; "
+                        "prefix the list with '!' to exclude those statuses "
+                        "(e.g. paid,partially_paid)."
+                    ),
+                    "schema": {"type": "string"},
                 },
                 {
                     "name": "year",
                     "in": "query",
                     "required": False,
-                    "description": "Filter by year (e.g. 2024). Non-numeric values are ignored.",
-                    "schema": {"type": "integer"},
+                    "description": (
+                        "Filter by year (e.g. 2024) or a comma-separated list of years; "
+                        "prefix the list with '!' to exclude them. "
+                        "Non-numeric values are ignored."
+                    ),
+                    "schema": {"type": "string"},
+                },
+                {
+                    "name": "year_min",
+                    "in": "query",
+                    "required": False,
+                    "description": "Only transactions from this year onwards.",
+                    "schema": {"type": "integer", "minimum": 0},
+                },
+                {
+                    "name": "year_max",
+                    "in": "query",
+                    "required": False,
+                    "description": "Only transactions up to and including this year.",
+                    "schema": {"type": "integer", "minimum": 0},
+                },
+                {
+                    "name": "amount_min",
+                    "in": "query",
+                    "required": False,
+                    "description": "Only transactions with at least this amount.",
+                    "schema": {"type": "string", "format": "decimal"},
+                },
+                {
+                    "name": "amount_max",
+                    "in": "query",
+                    "required": False,
+                    "description": "Only transactions with at most this amount.",
+                    "schema": {"type": "string", "format": "decimal"},
                 },
             ]
         )
@@ -62,24 +106,46 @@ class TransactionFilterMixin(generics.GenericAPIView):
 
     This mixin subclasses DRF's GenericAPIView so that ``request`` and
     other view attributes are available without additional hacks.
+
+    When the filters reach into archived years, the base queryset is swapped
+    for one over hot and archived transactions (see ``archive.with_archive``).
     """
 
+    # Views writing transactions set this to False: archived rows are read-only
+    include_archive = True
+
     def get_base_queryset(self) -> QuerySet[Transaction]:
         raise NotImplementedError("Subclasses must implement get_base_queryset().")
 
-    def get_filtered_queryset(self) -> QuerySet[Transaction]:
-        queryset = self.get_base_queryset()
-
-        transaction_type = self.request.query_params.get("transaction_type")
-        if transaction_type:
-            queryset = queryset.filter(transaction_type=transaction_type)
-
-        status = self.request.query_params.get("status")
-        if status:
-            queryset = queryset.filter(status=status)
+    def get_query_params(self) -> Mapping[str, Any]:
+        """Parameters driving filtering; views taking a request body override this."""
+        return self.request.query_params
 
-        year = self.request.query_params.get("year")
-        if year and year.isdigit():
-            queryset = queryset.filter(year=int(year))
+    def get_filters(self) -> TransactionFilters:
+        """Parse the filter params; invalid values are rejected with a 400."""
+        try:
+            with trace_span("filters"):
+                return TransactionFilters.from_params(self.get_query_params())
+        except FilterError as exc:
+            raise ParseError(str(exc)) from exc
 
-        return queryset
+    def get_filtered_queryset(self) -> QuerySet[Transaction]:
+        """The filtered queryset, on the shard owning the matched years when
+        there is one (see ``sharding``), else on the default database.
+        """
+        querysets = self.get_filtered_querysets()
+        if len(querysets) == 1:
+            return querysets[0]
+        filters = self.get_filters()
+        queryset = self.get_base_queryset()
+        if self.include_archive:
+            queryset = with_archive(queryset, filters)
+        return filters.apply(queryset)
+
+    def get_filtered_querysets(self) -> list[QuerySet[Transaction]]:
+        """The filtered queryset on every shard the filters can match, newest
+        years first.
+        """
+        return shard_querysets(
+            self.get_base_queryset(), self.get_filters(), self.include_archive
+        )
@@ -0,0 +1,77 @@
+from collections.abc import Mapping
+from typing import Any
+
+from django.db.models import QuerySet
+from rest_framework import generics, permissions
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+from ..bulk import (
+    BulkStatusResult,
+    update_status_by_filters,
+    update_status_by_numbers,
+)
+from ..filters import FILTER_PARAMS, TransactionFilters
+from ..models import Transaction
+from ..serializers import (
+    TransactionBulkStatusResultSerializer,
+    TransactionBulkStatusSerializer,
+)
+from .base import TransactionFilterMixin
+
+
+class TransactionBulkStatusView(TransactionFilterMixin, generics.GenericAPIView):
+    """Set the status of many transactions at once, e.g. after reconciling
+    payments. Select transactions by ``transaction_numbers`` or by ``filters``
+    (same parameters as the list endpoint, e.g. ``{"status": "unpaid",
+    "year": "2024"}``). Responds with how many transactions matched and how
+    many of them actually changed status.
+
+    Requires the ``transactions.change_transaction`` permission.
+    """
+
+    serializer_class = TransactionBulkStatusSerializer
+    permission_classes = [permissions.DjangoModelPermissions]
+    queryset = Transaction.objects.all()  # for DjangoModelPermissions
+    include_archive = False
+    filter_params: Mapping[str, Any] = {}
+
+    def get_base_queryset(self) -> QuerySet[Transaction]:
+        return Transaction.objects.all()
+
+    def get_query_params(self) -> Mapping[str, Any]:
+        return self.filter_params
+
+    def patch(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        status = data["status"]
+
+        if "transaction_numbers" in data:
+            result = update_status_by_numbers(data["transaction_numbers"], status)
+        else:
+            self.filter_params = data["filters"]
+            unknown = set(self.filter_params) - set(FILTER_PARAMS)
+            if unknown:
+                raise ParseError(
+                    f"Unknown filters {sorted(unknown)}. "
+                    f"Must be among {list(FILTER_PARAMS)}."
+                )
+            filters = self.get_filters()
+            # Ignored values (e.g. a non-numeric year) must not widen the update
+            # to the whole table
+            if filters == TransactionFilters():
+                raise ParseError("filters must restrict the transactions to update.")
+            matched = changed = 0
+            for queryset in self.get_filtered_querysets():
+                shard_result = update_status_by_filters(queryset, status)
+                matched += shard_result.matched
+                changed += shard_result.changed
+            result = BulkStatusResult(matched=matched, changed=changed)
+
+        return Response(
+            TransactionBulkStatusResultSerializer(
+                {"matched": result.matched, "changed": result.changed}
+            ).data
+        )
@@ -0,0 +1,76 @@
+from django.conf import settings
+from rest_framework import generics
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+from rest_framework.schemas.openapi import AutoSchema
+
+from ..changefeed import ChangeFeedCursor, InvalidCursor, read_changes
+from ..serializers import TransactionChangePageSerializer
+
+
+class TransactionChangesSchema(AutoSchema):
+    def get_filter_parameters(self, path, method):
+        params = super().get_filter_parameters(path, method)
+        if method.lower() != "get":
+            return params
+
+        params.extend(
+            [
+                {
+                    "name": "since",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "Opaque cursor returned as next_cursor by the previous page. "
+                        "Omit it to start from the beginning of the history."
+                    ),
+                    "schema": {"type": "string"},
+                },
+                {
+                    "name": "page_size",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "Maximum number of events to return "
+                        f"(default {settings.CHANGE_FEED_PAGE_SIZE}, "
+                        f"max {settings.CHANGE_FEED_MAX_PAGE_SIZE})."
+                    ),
+                    "schema": {"type": "integer"},
+                },
+            ]
+        )
+        return params
+
+
+class TransactionChangesView(generics.GenericAPIView):
+    """Feed of inserted, updated and deleted transactions for incremental sync.
+    Events are ordered by the time of the change; keep calling the endpoint with
+    ``since=<next_cursor>`` until ``has_more`` is false, and store the last
+    cursor to resume the next sync from there.
+    """
+
+    schema = TransactionChangesSchema()
+    serializer_class = TransactionChangePageSerializer
+
+    def get(self, request, *args, **kwargs):
+        raw_cursor = self.request.query_params.get("since")
+        try:
+            cursor = (
+                ChangeFeedCursor.decode(raw_cursor)
+                if raw_cursor
+                else ChangeFeedCursor()
+            )
+        except InvalidCursor as exc:
+            raise ParseError(str(exc)) from exc
+
+        raw_page_size = self.request.query_params.get("page_size", "")
+        page_size = (
+            int(raw_page_size)
+            if raw_page_size.isdigit() and int(raw_page_size) > 0
+            else settings.CHANGE_FEED_PAGE_SIZE
+        )
+        page = read_changes(
+            cursor, limit=min(page_size, settings.CHANGE_FEED_MAX_PAGE_SIZE)
+        )
+        serializer = self.get_serializer(page)
+        return Response(serializer.data)
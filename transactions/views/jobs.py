@@ -0,0 +1,70 @@
+from collections.abc import Mapping
+from typing import Any
+
+from django.db.models import QuerySet
+from django.http import Http404
+from rest_framework import generics, status
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from ..filters import get_filter_params
+from ..jobs import JobQueueFull, get_job, submit_report_job
+from ..models import ReportJob, Transaction
+from ..serializers import ReportJobSerializer
+from .report import ReportRequestMixin, ReportUnavailable
+
+
+class TransactionReportJobCreateView(ReportRequestMixin, generics.GenericAPIView):
+    """Enqueue a transaction report to be computed in the background.
+    Accepts the same parameters as the report endpoint (report options and
+    filters) in the request body, e.g. ``{"row_field": "status",
+    "column_fields": "year", "status": "paid"}``, and responds with
+    ``202 Accepted`` and the job to poll. Identical requests made while
+    an earlier job is still queued, running, or holding an unexpired
+    result return that job instead (``200 OK``).
+    """
+
+    serializer_class = ReportJobSerializer
+
+    def get_base_queryset(self) -> QuerySet[Transaction]:
+        return Transaction.objects.all()
+
+    def get_query_params(self) -> Mapping[str, Any]:
+        return self.request.data
+
+    def post(self, request, *args, **kwargs):
+        report_request = self.get_report_request()
+        self.get_filters()  # validate up front, workers re-parse the raw params
+        filters = get_filter_params(self.get_query_params())
+        try:
+            job, created = submit_report_job(filters, report_request)
+        except JobQueueFull as exc:
+            raise ReportUnavailable(str(exc)) from exc
+
+        serializer = self.get_serializer(job)
+        return Response(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+            headers={
+                "Location": reverse(
+                    "transaction-report-job-detail",
+                    kwargs={"job_id": job.pk},
+                    request=request,
+                )
+            },
+        )
+
+
+class TransactionReportJobDetailView(generics.RetrieveAPIView):
+    """Status, stage (``queued``, ``querying``, ``pivoting``, ``serializing``,
+    ``done``) and (once finished) the result of a report job.
+    Jobs and their results are removed after ``REPORT_JOBS_RESULT_TTL`` seconds.
+    """
+
+    serializer_class = ReportJobSerializer
+
+    def get_object(self) -> ReportJob:
+        job = get_job(self.kwargs["job_id"])
+        if job is None:
+            raise Http404
+        return job
@@ -1,24 +1,138 @@
 from django.db.models import QuerySet
 from rest_framework import generics
+from rest_framework.exceptions import ParseError
 
+from ..filters import (
+    DEFAULT_SEARCH_MODE,
+    SEARCH_LOOKUPS,
+    FilterError,
+    search_transactions,
+)
 from ..models import Transaction
 from ..serializers import TransactionSerializer
+from ..sharding import ShardedResults
+from ..tracing import trace_span
 from .base import TransactionFilterMixin, TransactionFilterSchema, TransactionPagination
 
 
+class TransactionListSchema(TransactionFilterSchema):
+    def get_filter_parameters(self, path, method):
+        params = super().get_filter_parameters(path, method)
+        if method.lower() != "get":
+            return params
+
+        params.append(
+            {
+                "name": "search",
+                "in": "query",
+                "required": False,
+                "description": (
+                    "Case-insensitive search by transaction_number; see search_mode."
+                ),
+                "schema": {"type": "string"},
+            }
+        )
+        params.append(
+            {
+                "name": "search_mode",
+                "in": "query",
+                "required": False,
+                "description": (
+                    "How search is matched: the whole number (exact), its "
+                    "beginning (prefix) or any part of it (substring, at least "
+                    f"3 characters). Defaults to {DEFAULT_SEARCH_MODE}."
+                ),
+                "schema": {"type": "string", "enum": list(SEARCH_LOOKUPS)},
+            }
+        )
+        params.append(
+            {
+                "name": "fields",
+                "in": "query",
+                "required": False,
+                "description": (
+                    "Optional comma-separated subset of fields to return, from "
+                    f"{','.join(TransactionSerializer.Meta.fields)}. "
+                    "Only these columns are selected from the database."
+                ),
+                "schema": {"type": "string"},
+            }
+        )
+        return params
+
+
 class TransactionListView(TransactionFilterMixin, generics.ListAPIView):
     """List raw transactions with optional filtering.
-    Supports filtering by transaction_type, status, and year via
-    query parameters combined with AND logic. Results are paginated
-    using page and page_size query parameters.
+    Supports filtering by transaction_type, status, and year (single values,
+    comma-separated lists or '!'-negated lists) and by year/amount ranges via
+    query parameters combined with AND logic. ``?search=`` matches
+    transaction_number exactly, by prefix or by substring (``search_mode``),
+    each served by an index. Results are paginated using page and page_size
+    query parameters.
+
+    Rows are fetched with ``values()`` restricted to the rendered fields, so
+    ``?fields=`` narrows both the SQL projection and the response.
+
+    When the filters match several shards, the page is read from the shards
+    it spans (see ``sharding.ShardedResults``).
     """
 
-    schema = TransactionFilterSchema()
+    schema = TransactionListSchema()
     serializer_class = TransactionSerializer
     pagination_class = TransactionPagination
 
     def get_base_queryset(self) -> QuerySet[Transaction]:
         return Transaction.objects.all().order_by("-year", "transaction_number")
 
-    def get_queryset(self) -> QuerySet[Transaction]:
-        return self.get_filtered_queryset()
+    def get_queryset(self) -> QuerySet[Transaction] | ShardedResults:
+        fields = self.get_fields()
+        querysets = [
+            self.apply_search(queryset).values(*fields)
+            for queryset in self.get_filtered_querysets()
+        ]
+        if len(querysets) == 1:
+            return querysets[0]
+        return ShardedResults(querysets)
+
+    def apply_search(self, queryset: QuerySet[Transaction]) -> QuerySet[Transaction]:
+        params = self.request.query_params
+        term = params.get("search", "").strip()
+        if not term:
+            return queryset
+        try:
+            return search_transactions(
+                queryset, term, params.get("search_mode", DEFAULT_SEARCH_MODE)
+            )
+        except FilterError as exc:
+            raise ParseError(str(exc)) from exc
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_fields(self) -> list[str]:
+        """Fields requested via ``?fields=``, defaulting to all serializer fields."""
+        allowed = TransactionSerializer.Meta.fields
+        if self.request is None:  # offline schema generation
+            return list(allowed)
+        raw = self.request.query_params.get("fields", "")
+        fields = [_p for part in raw.split(",") if (_p := part.strip())]
+        if not fields:
+            return list(allowed)
+
+        for field in fields:
+            if field not in allowed:
+                raise ParseError(
+                    f"Invalid field '{field}'. Must be one of {sorted(allowed)}."
+                )
+        if len(fields) != len(set(fields)):
+            raise ParseError("Duplicate fields are not allowed in fields.")
+        return fields
+
+    # Defined last: the name shadows the builtin in the class body
+    def list(self, request, *args, **kwargs):
+        with trace_span("queryset"):
+            page = self.paginate_queryset(self.get_queryset())
+        with trace_span("serialize"):
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
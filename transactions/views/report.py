@@ -1,14 +1,41 @@
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError
 from django.db.models import QuerySet
-from rest_framework import generics, status
+from django.http import HttpResponse
+from rest_framework import generics
+from rest_framework.exceptions import APIException, ParseError, Throttled
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from transaction_reporting.compression import precompress
+
+from ..admission import (
+    ConcurrencyLimiter,
+    QueueFull,
+    QueueTimeout,
+    is_statement_timeout,
+    statement_timeout,
+)
+from ..coalescing import CoalescedCallError, CoalescingTimeout
 from ..models import Transaction
 from ..serializers import TransactionReportSerializer
 from ..services import (
     ReportDimension,
+    ReportMetric,
+    ReportMode,
+    ReportRowSelection,
+    ReportSampling,
+    ReportTrend,
+    RowSort,
+    SampleMethod,
     TransactionReportRequest,
     TransactionReportService,
 )
+from ..tracing import trace_span
 from .base import TransactionFilterMixin, TransactionFilterSchema
 
 
@@ -24,7 +51,10 @@ class TransactionReportSchema(TransactionFilterSchema):
                     "name": "row_field",
                     "in": "query",
                     "required": True,
-                    "description": "Column to group by.",
+                    "description": (
+                        "Column to group by. amount_bucket, decade and "
+                        "transaction_number_prefix are derived from the raw columns."
+                    ),
                     "schema": {
                         "type": "string",
                         "enum": sorted(ReportDimension.values()),
@@ -34,19 +64,372 @@ class TransactionReportSchema(TransactionFilterSchema):
                     "name": "column_fields",
                     "in": "query",
                     "required": False,
-                    "description": "Optional comma-separated list from transaction_type,status,year.",
+                    "description": (
+                        "Optional comma-separated list from "
+                        f"{','.join(ReportDimension.values())}."
+                    ),
                     "schema": {"type": "string"},
                 },
+                {
+                    "name": "metrics",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "Optional comma-separated list of extra metrics computed for "
+                        f"every cell and total, from {','.join(ReportMetric.values())}. "
+                        "Percentiles are interpolated over the transaction amounts."
+                    ),
+                    "schema": {"type": "string"},
+                },
+                {
+                    "name": "trends",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "Optional comma-separated list from "
+                        f"{','.join(ReportTrend.values())}: running total, and "
+                        "absolute and percentage change against the previous year, "
+                        "of every cell and total grouped by year. Requires year "
+                        "among row_field and column_fields; computed over the "
+                        "filtered transactions."
+                    ),
+                    "schema": {"type": "string"},
+                },
+                {
+                    "name": "mode",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "exact (default) or approx. Approximate reports aggregate a "
+                        "TABLESAMPLE of the table, scale counts and sums up, and add "
+                        "95% confidence intervals to every total."
+                    ),
+                    "schema": {"type": "string", "enum": ReportMode.values()},
+                },
+                {
+                    "name": "sample",
+                    "in": "query",
+                    "required": False,
+                    "description": "Sample size in percent for mode=approx (default 1).",
+                    "schema": {"type": "number", "minimum": 0, "maximum": 100},
+                },
+                {
+                    "name": "sample_method",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "TABLESAMPLE method for mode=approx: system (page-level, "
+                        "fastest) or bernoulli (row-level, tighter error bounds)."
+                    ),
+                    "schema": {"type": "string", "enum": SampleMethod.values()},
+                },
+                {
+                    "name": "sort",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        f"Order of the rows: {', '.join(RowSort.values())} (the "
+                        "row value, the row total or the total of sort_column), "
+                        "prefixed with - for descending order. Defaults to row, "
+                        "or -total with top."
+                    ),
+                    "schema": {"type": "string"},
+                },
+                {
+                    "name": "sort_column",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "Comma-separated values of the column_fields of the "
+                        "column to sort rows by, for sort=column."
+                    ),
+                    "schema": {"type": "string"},
+                },
+                {
+                    "name": "top",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "Only return the first rows in sort order; the other rows "
+                        "are aggregated into one row, returned as other."
+                    ),
+                    "schema": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": settings.REPORT_MAX_ROW_PAGE_SIZE,
+                    },
+                },
+                {
+                    "name": "row_page",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        "Page of rows to return, in sort order. Column totals and "
+                        "the grand total cover every row."
+                    ),
+                    "schema": {"type": "integer", "minimum": 1},
+                },
+                {
+                    "name": "row_page_size",
+                    "in": "query",
+                    "required": False,
+                    "description": (
+                        f"Rows per row_page (default {settings.REPORT_ROW_PAGE_SIZE})."
+                    ),
+                    "schema": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": settings.REPORT_MAX_ROW_PAGE_SIZE,
+                    },
+                },
             ]
         )
         return params
 
 
-class TransactionReportView(TransactionFilterMixin, generics.GenericAPIView):
+class ReportUnavailable(APIException):
+    status_code = 503
+    default_detail = "The report could not be computed in time, try again later."
+    default_code = "report_unavailable"
+
+    def __init__(self, detail=None, code=None, wait: int | None = None) -> None:
+        super().__init__(detail, code)
+        # Sent as ``Retry-After`` by DRF's exception handler
+        self.wait = wait
+
+
+class ReportTooExpensive(APIException):
+    status_code = 422
+    default_detail = (
+        "The report is estimated to be too expensive to compute in a request. "
+        "Narrow it down with filters, use mode=approx or create a report job."
+    )
+    default_code = "report_too_expensive"
+
+
+@dataclass(frozen=True)
+class CachedReport:
+    """A rendered report response, with its precompressed variants."""
+
+    body: bytes
+    content_type: str
+    precompressed: dict[str, bytes]
+
+    def response(self) -> HttpResponse:
+        response = HttpResponse(self.body, content_type=self.content_type)
+        # Picked up by ``CompressionMiddleware``
+        response.precompressed = self.precompressed
+        return response
+
+
+class ReportRequestMixin(TransactionFilterMixin):
+    """Mixin parsing report parameters into a ``TransactionReportRequest``.
+    Shared by the synchronous report endpoint and report jobs.
+    """
+
+    def get_report_request(self) -> TransactionReportRequest:
+        """Validate the report params; raises ``ParseError`` (400) on bad input."""
+        row_field_str = self.get_query_params().get("row_field")
+        if not row_field_str:
+            raise ParseError("row_field is required.")
+
+        allowed = set(ReportDimension.values())
+        if row_field_str not in allowed:
+            raise ParseError(
+                f"Invalid row_field '{row_field_str}'. Must be one of {sorted(allowed)}."
+            )
+
+        column_field_strs = self._split_csv_param("column_fields")
+        for field in column_field_strs:
+            if field not in allowed:
+                raise ParseError(
+                    f"Invalid column field '{field}'. Must be one of {sorted(allowed)}."
+                )
+
+        if len(column_field_strs) != len(set(column_field_strs)):
+            raise ParseError("Duplicate fields are not allowed in column_fields.")
+
+        metric_strs = self._split_csv_param("metrics")
+        allowed_metrics = ReportMetric.values()
+        for metric in metric_strs:
+            if metric not in allowed_metrics:
+                raise ParseError(
+                    f"Invalid metric '{metric}'. Must be one of {allowed_metrics}."
+                )
+
+        if len(metric_strs) != len(set(metric_strs)):
+            raise ParseError("Duplicate metrics are not allowed in metrics.")
+
+        column_fields = [ReportDimension(field) for field in column_field_strs]
+        trends = self._get_trends([row_field_str, *column_field_strs])
+        rows = self._get_rows(column_fields)
+        if (
+            rows is not None
+            and rows.is_limited
+            and trends
+            and row_field_str == ReportDimension.YEAR
+        ):
+            raise ParseError(
+                "trends cannot be combined with top or row_page when row_field is year."
+            )
+
+        return TransactionReportRequest(
+            row_field=ReportDimension(row_field_str),
+            column_fields=column_fields,
+            metrics=[ReportMetric(metric) for metric in metric_strs],
+            sampling=self._get_sampling(),
+            trends=trends,
+            rows=rows,
+        )
+
+    def _get_rows(
+        self, column_fields: list[ReportDimension]
+    ) -> ReportRowSelection | None:
+        params = self.get_query_params()
+        top = self._get_positive_int("top", settings.REPORT_MAX_ROW_PAGE_SIZE)
+        page = self._get_positive_int("row_page")
+        page_size = self._get_positive_int(
+            "row_page_size", settings.REPORT_MAX_ROW_PAGE_SIZE
+        )
+        sort_str = params.get("sort")
+        if sort_str is None and top is None and page is None and page_size is None:
+            return None
+        if top is not None and (page is not None or page_size is not None):
+            raise ParseError("top cannot be combined with row_page or row_page_size.")
+
+        if sort_str is None:
+            sort_str = (
+                f"-{RowSort.TOTAL.value}" if top is not None else RowSort.ROW.value
+            )
+        sort_str = str(sort_str)
+        descending = sort_str.startswith("-")
+        sort = sort_str.removeprefix("-")
+        if sort not in RowSort.values():
+            raise ParseError(
+                f"Invalid sort '{sort_str}'. Must be one of {RowSort.values()}, "
+                "optionally prefixed with '-'."
+            )
+
+        column = self._get_sort_column(sort, column_fields)
+        if top is not None:
+            return ReportRowSelection(
+                RowSort(sort), descending, column, limit=top, other=True
+            )
+        if page is None and page_size is None:
+            return ReportRowSelection(RowSort(sort), descending, column)
+        page_size = page_size or settings.REPORT_ROW_PAGE_SIZE
+        return ReportRowSelection(
+            RowSort(sort),
+            descending,
+            column,
+            limit=page_size,
+            offset=((page or 1) - 1) * page_size,
+        )
+
+    def _get_sort_column(
+        self, sort: str, column_fields: list[ReportDimension]
+    ) -> tuple:
+        column_strs = self._split_csv_param("sort_column")
+        if sort != RowSort.COLUMN:
+            if column_strs:
+                raise ParseError("sort_column requires sort=column.")
+            return ()
+        if not column_fields or len(column_strs) != len(column_fields):
+            raise ParseError(
+                "sort=column requires sort_column with one value per column field."
+            )
+        try:
+            return tuple(
+                field.parse(value)
+                for field, value in zip(column_fields, column_strs, strict=True)
+            )
+        except ValueError as exc:
+            raise ParseError(f"Invalid sort_column '{','.join(column_strs)}'.") from exc
+
+    def _get_positive_int(self, name: str, maximum: int | None = None) -> int | None:
+        raw = self.get_query_params().get(name)
+        if raw is None:
+            return None
+        try:
+            value = int(raw)
+        except (TypeError, ValueError):
+            value = 0
+        if value < 1 or (maximum is not None and value > maximum):
+            bounds = f"between 1 and {maximum}" if maximum is not None else "positive"
+            raise ParseError(f"Invalid {name} '{raw}'. Must be an integer {bounds}.")
+        return value
+
+    def _get_trends(self, group_by: list[str]) -> list[ReportTrend]:
+        trend_strs = self._split_csv_param("trends")
+        allowed_trends = ReportTrend.values()
+        for trend in trend_strs:
+            if trend not in allowed_trends:
+                raise ParseError(
+                    f"Invalid trend '{trend}'. Must be one of {allowed_trends}."
+                )
+
+        if len(trend_strs) != len(set(trend_strs)):
+            raise ParseError("Duplicate trends are not allowed in trends.")
+        if trend_strs and ReportDimension.YEAR.value not in group_by:
+            raise ParseError("trends require year as row_field or in column_fields.")
+        return [ReportTrend(trend) for trend in trend_strs]
+
+    def _get_sampling(self) -> ReportSampling | None:
+        mode = self.get_query_params().get("mode", ReportMode.EXACT.value)
+        if mode not in ReportMode.values():
+            raise ParseError(
+                f"Invalid mode '{mode}'. Must be one of {ReportMode.values()}."
+            )
+        if mode == ReportMode.EXACT:
+            return None
+
+        raw_sample = self.get_query_params().get("sample", "1")
+        try:
+            percent = float(raw_sample)
+        except (TypeError, ValueError):
+            percent = 0.0
+        if not 0 < percent <= 100:
+            raise ParseError(
+                f"Invalid sample '{raw_sample}'. Must be a percentage in (0, 100]."
+            )
+
+        method = self.get_query_params().get("sample_method", SampleMethod.SYSTEM.value)
+        if method not in SampleMethod.values():
+            raise ParseError(
+                f"Invalid sample_method '{method}'. Must be one of {SampleMethod.values()}."
+            )
+        return ReportSampling(percent=percent, method=SampleMethod(method))
+
+    def _split_csv_param(self, name: str) -> list[str]:
+        raw = self.get_query_params().get(name, "")
+        if isinstance(raw, list):
+            raw = ",".join(str(part) for part in raw)
+        return [_p for part in raw.split(",") if (_p := part.strip())] if raw else []
+
+
+class TransactionReportView(ReportRequestMixin, generics.GenericAPIView):
     """Returns a pre-aggregated, pivot-style report of transactions.
     Use this endpoint when you need totals grouped by a chosen row dimension
     (for example, transaction_type or status) and optional column dimensions,
     All monetary values are summed with Decimal and returned as strings.
+    Extra ``metrics`` (count, avg, min, max, percentiles, ...) can be requested;
+    they are computed in the same query for every cell and total.
+    With ``year`` among the dimensions, ``trends`` add running totals and
+    year-over-year changes, computed with window functions in that query too.
+    With ``mode=approx`` the report is estimated from a table sample and every
+    total carries a confidence interval.
+    Rows can be sorted by value, row total or the total of one column, and
+    limited to the ``top`` ones (the rest aggregated as ``other``) or to one
+    ``row_page``; rows are ranked in the database, so that only the returned
+    rows are fetched.
+
+    Concurrent reports are limited: when all slots and the wait queue are taken
+    the endpoint answers 429, when a queued report times out or the query runs
+    over its time limit it answers 503, both with ``Retry-After``.
+
+    With ``REPORT_CACHE_TIMEOUT`` set, exact JSON reports are cached rendered
+    and precompressed, so repeated ones are served without being computed,
+    serialized or compressed again.
 
     Filters on `transaction_type`, `status`, and `year` are applied **before** the aggregation
     logic, so they affect which transactions are counted in the report.
@@ -59,58 +442,111 @@ class TransactionReportView(TransactionFilterMixin, generics.GenericAPIView):
         return Transaction.objects.all()
 
     def get(self, request, *args, **kwargs):
-        row_field_str = self.request.query_params.get("row_field")
-        if not row_field_str:
-            return Response(
-                {"detail": "row_field is required."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        report_request = self.get_report_request()
+        qs = self.get_filtered_queryset()
+        cache_key = self.get_cache_key(qs, report_request)
+        if cache_key is not None:
+            with trace_span("cache"):
+                cached = cache.get(cache_key)
+            if cached is not None:
+                return cached.response()
 
-        allowed = set(ReportDimension.values())
-        if row_field_str not in allowed:
-            return Response(
-                {
-                    "detail": f"Invalid row_field '{row_field_str}'. Must be one of {sorted(allowed)}."
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        limiter = self.get_limiter(qs, report_request)
+        retry_after = settings.REPORT_RETRY_AFTER
+        service = TransactionReportService()
+        try:
+            with trace_span("build_report"):
+                result = service.build_report_coalesced(
+                    qs,
+                    report_request,
+                    self.get_filters(),
+                    admission=lambda: self.admitted(limiter, qs.db),
+                )
+        except QueueFull as exc:
+            raise Throttled(wait=exc.retry_after, detail=str(exc)) from exc
+        except (QueueTimeout, CoalescingTimeout) as exc:
+            raise ReportUnavailable(str(exc), wait=retry_after) from exc
+        except CoalescedCallError as exc:
+            # The identical report computed by another process failed
+            raise ReportUnavailable(str(exc), wait=retry_after) from exc
+        except OperationalError as exc:
+            if not is_statement_timeout(exc):
+                raise
+            raise ReportUnavailable(
+                "The report query exceeded its time limit. "
+                "Narrow it down with filters or create a report job.",
+                wait=retry_after,
+            ) from exc
+        with trace_span("serialize"):
+            data = self.get_serializer(result.as_dict()).data
+        if cache_key is None:
+            return Response(data)
 
-        raw_column_fields = self.request.query_params.get("column_fields", "")
-        column_field_strs = (
-            [_p for part in raw_column_fields.split(",") if (_p := part.strip())]
-            if raw_column_fields
-            else []
-        )
+        with trace_span("render"):
+            cached = self.render_cached(data)
+        cache.set(cache_key, cached, settings.REPORT_CACHE_TIMEOUT)
+        return cached.response()
 
-        for field in column_field_strs:
-            if field not in allowed:
-                return Response(
-                    {
-                        "detail": f"Invalid column field '{field}'. Must be one of {sorted(allowed)}."
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+    @contextmanager
+    def admitted(self, limiter: ConcurrencyLimiter | None, using: str):
+        """Context of the report computation: a slot of ``limiter`` and the
+        statement timeout. Requests waiting on an identical report computed
+        by another one do not enter it, so they take no slot.
+        """
+        with (
+            limiter.admit() if limiter is not None else nullcontext(),
+            statement_timeout(settings.REPORT_STATEMENT_TIMEOUT, using),
+        ):
+            yield
 
-        if len(column_field_strs) != len(set(column_field_strs)):
-            return Response(
-                {"detail": "Duplicate fields are not allowed in column_fields."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+    def get_cache_key(
+        self, queryset: QuerySet[Transaction], report_request: TransactionReportRequest
+    ) -> str | None:
+        """Cache key of the rendered report, ``None`` if it is not cacheable:
+        caching is off, the report is sampled or not rendered as JSON.
+        """
+        if not settings.REPORT_CACHE_TIMEOUT or report_request.sampling is not None:
+            return None
+        if not isinstance(self.request.accepted_renderer, JSONRenderer):
+            return None
+        fingerprint = TransactionReportService.fingerprint(queryset, report_request)
+        return f"transactions:report:{self.request.accepted_media_type}:{fingerprint}"
 
-        report_request = TransactionReportRequest(
-            row_field=ReportDimension(row_field_str),
-            column_fields=[ReportDimension(field) for field in column_field_strs],
+    def render_cached(self, data) -> CachedReport:
+        renderer = self.request.accepted_renderer
+        body = renderer.render(
+            data, self.request.accepted_media_type, self.get_renderer_context()
         )
-        qs = self.get_filtered_queryset()
-        service = TransactionReportService()
-        result = service.build_report(qs, report_request)
-        serializer = self.get_serializer(
-            {
-                "row_field": result.row_field,
-                "column_fields": result.column_fields,
-                "data": result.data,
-                "column_totals": result.column_totals,
-                "grand_total": result.grand_total,
-            }
+        # As ``Response`` would set it
+        content_type = self.request.accepted_media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        return CachedReport(
+            body=body, content_type=content_type, precompressed=precompress(body)
+        )
+
+    def get_limiter(
+        self, queryset: QuerySet[Transaction], report_request: TransactionReportRequest
+    ) -> ConcurrencyLimiter | None:
+        """Concurrency limiter the report must pass, if any.
+        With cost budgets configured the report is first ``EXPLAIN``-ed: too
+        expensive reports are rejected, cheap ones bypass the limiter.
+        """
+        max_cost, cheap_cost = settings.REPORT_MAX_COST, settings.REPORT_CHEAP_COST
+        if max_cost is not None or cheap_cost is not None:
+            cost = TransactionReportService.estimate_cost(queryset, report_request)
+            if max_cost is not None and cost > max_cost:
+                raise ReportTooExpensive()
+            if cheap_cost is not None and cost <= cheap_cost:
+                return None
+
+        if not settings.REPORT_MAX_CONCURRENCY:
+            return None
+        return ConcurrencyLimiter(
+            "report",
+            limit=settings.REPORT_MAX_CONCURRENCY,
+            queue_size=settings.REPORT_QUEUE_SIZE,
+            queue_timeout=settings.REPORT_QUEUE_TIMEOUT,
+            retry_after=settings.REPORT_RETRY_AFTER,
+            using=queryset.db,
         )
-        return Response(serializer.data)